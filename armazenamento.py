@@ -0,0 +1,138 @@
+"""Acesso ao arquivo compartilhado: descritores persistentes, envio sem cópia
+e buffers de recepção reutilizáveis."""
+import os
+import select
+import threading
+
+BUFFER_SIZE = 64 * 1024  # Tamanho dos blocos no envio sem sendfile
+
+_FLAGS_BINARIO = getattr(os, 'O_BINARY', 0)
+
+
+class CacheDescritores:
+    """Mantém um descritor aberto por arquivo durante toda a sessão"""
+
+    def __init__(self):
+        self._descritores = {}  # {caminho: fd}
+        self._lock = threading.Lock()
+        # Trava por descritor para plataformas sem leitura posicional (os.pread)
+        self._locks_posicao = {}
+
+    def obter(self, caminho):
+        """Retorna o descritor do arquivo, abrindo-o para leitura e escrita na primeira vez"""
+        fd = self._descritores.get(caminho)
+        if fd is not None:
+            return fd
+        with self._lock:
+            fd = self._descritores.get(caminho)
+            if fd is None:
+                modo = os.O_RDWR if os.access(caminho, os.W_OK) else os.O_RDONLY
+                fd = os.open(caminho, modo | _FLAGS_BINARIO)
+                self._locks_posicao[fd] = threading.Lock()
+                self._descritores[caminho] = fd
+            return fd
+
+    def lock_posicao(self, fd):
+        return self._locks_posicao[fd]
+
+    def fechar_todos(self):
+        with self._lock:
+            descritores, self._descritores = self._descritores, {}
+            self._locks_posicao.clear()
+        for fd in descritores.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class PoolBuffers:
+    """Buffers pré-alocados reutilizados entre recepções, evitando uma alocação por trecho"""
+
+    def __init__(self, tamanho_buffer, max_livres=64):
+        self.tamanho_buffer = tamanho_buffer
+        self.max_livres = max_livres
+        self._livres = []
+        self._lock = threading.Lock()
+
+    def obter(self):
+        with self._lock:
+            if self._livres:
+                return self._livres.pop()
+        return bytearray(self.tamanho_buffer)
+
+    def devolver(self, buffer):
+        with self._lock:
+            if len(self._livres) < self.max_livres:
+                self._livres.append(buffer)
+
+
+def receber_em(sock, visao):
+    """Preenche a memoryview inteira com dados do socket (recv_into, sem cópias)"""
+    recebidos = 0
+    while recebidos < len(visao):
+        n = sock.recv_into(visao[recebidos:])
+        if not n:
+            raise ConnectionError("Conexão encerrada pelo par")
+        recebidos += n
+
+
+def _aguardar_escrita(sock):
+    # Sockets com timeout são não-bloqueantes internamente: espera o buffer esvaziar
+    timeout = sock.gettimeout()
+    _, prontos, _ = select.select([], [sock], [], timeout)
+    if not prontos:
+        raise TimeoutError("Tempo esgotado enviando dados ao par")
+
+
+def enviar_trecho(sock, cache, fd, inicio, tamanho):
+    """Envia `tamanho` bytes do arquivo a partir de `inicio` direto para o socket.
+
+    Usa os.sendfile (cópia feita pelo kernel) quando disponível; senão lê em
+    blocos de BUFFER_SIZE com leitura posicional.
+    """
+    if hasattr(os, 'sendfile'):
+        enviados = 0
+        while enviados < tamanho:
+            try:
+                n = os.sendfile(sock.fileno(), fd, inicio + enviados, tamanho - enviados)
+            except BlockingIOError:
+                _aguardar_escrita(sock)
+                continue
+            if n == 0:
+                raise ConnectionError("Fim do arquivo antes do fim do trecho")
+            enviados += n
+        return
+
+    enviados = 0
+    while enviados < tamanho:
+        parte = min(BUFFER_SIZE, tamanho - enviados)
+        dados = ler_trecho(cache, fd, inicio + enviados, parte)
+        if not dados:
+            raise ConnectionError("Fim do arquivo antes do fim do trecho")
+        sock.sendall(dados)
+        enviados += len(dados)
+
+
+def ler_trecho(cache, fd, inicio, tamanho):
+    """Leitura posicional, sem alterar a posição compartilhada do descritor"""
+    if hasattr(os, 'pread'):
+        return os.pread(fd, tamanho, inicio)
+    with cache.lock_posicao(fd):
+        os.lseek(fd, inicio, os.SEEK_SET)
+        return os.read(fd, tamanho)
+
+
+def escrever_trecho(cache, fd, inicio, dados):
+    """Escrita posicional no descritor persistente, sem reabrir o arquivo"""
+    dados = memoryview(dados)
+    if hasattr(os, 'pwrite'):
+        escritos = 0
+        while escritos < len(dados):
+            escritos += os.pwrite(fd, dados[escritos:], inicio + escritos)
+        return
+    with cache.lock_posicao(fd):
+        os.lseek(fd, inicio, os.SEEK_SET)
+        escritos = 0
+        while escritos < len(dados):
+            escritos += os.write(fd, dados[escritos:])
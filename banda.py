@@ -0,0 +1,136 @@
+"""Limite global de banda e partilha justa de banda e vagas entre torrents."""
+import threading
+import time
+from collections import Counter
+
+RAJADA = 0.25  # Segundos de banda que uma classe ociosa pode usar de uma vez
+
+
+def repartir(limite, demandas):
+    """Partilha max-min justa de `limite` unidades: {classe: cota}.
+
+    Classes que pedem menos que a parcela igual recebem o que pedem; a sobra
+    é dividida igualmente entre as demais (water-filling).
+    """
+    cotas = {}
+    restantes = sorted(demandas.items(), key=lambda item: item[1])
+    while restantes:
+        parcela = limite / len(restantes)
+        classe, demanda = restantes[0]
+        if demanda > parcela:
+            cotas.update((classe, parcela) for classe, _ in restantes)
+            break
+        cotas[classe] = demanda
+        limite -= demanda
+        restantes.pop(0)
+    return cotas
+
+
+class LimitadorBanda:
+    """Balde de fichas com a taxa total dividida igualmente entre as classes ativas.
+
+    Cada classe (um torrent) tem seu balde na forma de instante teórico de
+    chegada (GCRA): reservar n bytes empurra esse instante em n / parcela
+    segundos, onde a parcela é a taxa dividida pelas classes que ainda têm
+    reservas a cumprir. Uma classe sozinha usa a banda toda; classes que
+    disputam a banda a dividem igualmente, não importa quantas conexões cada
+    uma tem. Depois de um período ocioso, até `rajada` bytes passam sem espera.
+
+    reservar() não bloqueia: retorna quantos segundos esperar antes de usar os
+    bytes, para que o motor com threads durma e o asyncio aguarde.
+    """
+
+    def __init__(self, taxa=None, rajada=None):
+        self.taxa = taxa  # Bytes/s (None = ilimitada)
+        self.rajada = rajada if rajada is not None else (taxa or 0) * RAJADA
+        self._chegada = {}  # {classe: instante teórico de chegada da próxima reserva}
+        self._lock = threading.Lock()
+
+    def _parcela(self, classe, agora):
+        ativas = 1 + sum(1 for outra, chegada in self._chegada.items()
+                         if outra != classe and chegada > agora)
+        return self.taxa / ativas
+
+    def reservar(self, classe, quantidade, espera_maxima=None):
+        """Reserva `quantidade` bytes para a classe; retorna a espera em segundos.
+
+        Com espera_maxima, nada é reservado (e o retorno é None) se a espera
+        passaria dela: quem chamou tenta de novo mais tarde.
+        """
+        if not self.taxa:
+            return 0.0
+        with self._lock:
+            agora = time.monotonic()
+            chegada = max(self._chegada.get(classe, agora), agora)
+            espera = max(0.0, chegada - agora - self.rajada / self.taxa)
+            if espera_maxima is not None and espera > espera_maxima:
+                return None
+            self._chegada[classe] = chegada + quantidade / self._parcela(classe, agora)
+        return espera
+
+    def devolver(self, classe, quantidade):
+        """Devolve bytes reservados e não usados (ex: menos blocos que o previsto)"""
+        if not self.taxa or quantidade <= 0:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            chegada = self._chegada.get(classe)
+            if chegada is not None:
+                self._chegada[classe] = max(agora, chegada - quantidade / self._parcela(classe, agora))
+
+    def esquecer(self, classe):
+        with self._lock:
+            self._chegada.pop(classe, None)
+
+
+class EscalonadorJusto:
+    """Divide a banda e as vagas de um processo entre os torrents que ele serve.
+
+    Envio e recepção passam cada um por um LimitadorBanda. Cada recurso com
+    vagas (ex: conexões recebidas) tem um limite no processo: com vagas
+    livres qualquer torrent é admitido; com o limite atingido, um torrent
+    abaixo da parcela igual ainda é admitido e o que mais excede a sua é
+    indicado para ceder uma vaga.
+    """
+
+    def __init__(self, taxa_upload=None, taxa_download=None, limites=None):
+        self.upload = LimitadorBanda(taxa_upload)
+        self.download = LimitadorBanda(taxa_download)
+        self.limites = dict(limites or {})  # {recurso: vagas no processo}
+        self._ocupadas = {}                 # {recurso: Counter {classe: vagas em uso}}
+        self._lock = threading.Lock()
+
+    def admitir(self, recurso, classe):
+        """Tenta ocupar uma vaga do recurso: retorna (admitida, classe que deve ceder uma vaga)"""
+        with self._lock:
+            ocupadas = self._ocupadas.setdefault(recurso, Counter())
+            limite = self.limites[recurso]
+            if sum(ocupadas.values()) < limite:
+                ocupadas[classe] += 1
+                return True, None
+
+            parcela = limite / len(ocupadas.keys() | {classe})
+            cedente, maior = max(ocupadas.items(), key=lambda item: item[1])
+            if ocupadas[classe] + 1 > parcela or maior <= parcela:
+                return False, None
+            # A vaga da cedente só volta ao contador quando a conexão dela fechar
+            ocupadas[classe] += 1
+            return True, cedente
+
+    def liberar(self, recurso, classe):
+        with self._lock:
+            ocupadas = self._ocupadas.get(recurso)
+            if ocupadas and ocupadas[classe] > 0:
+                ocupadas[classe] -= 1
+                if not ocupadas[classe]:
+                    del ocupadas[classe]
+
+    def ocupadas(self, recurso, classe=None):
+        """Vagas do recurso em uso pela classe (ou por todas)"""
+        with self._lock:
+            ocupadas = self._ocupadas.get(recurso, Counter())
+            return sum(ocupadas.values()) if classe is None else ocupadas[classe]
+
+    def cota(self, recurso, classe, demandas):
+        """Vagas que a classe pode usar, dadas as demandas {classe: vagas desejadas} de todas"""
+        return repartir(self.limites[recurso], demandas).get(classe, 0)
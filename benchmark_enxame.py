@@ -0,0 +1,293 @@
+"""Benchmark de um enxame completo em um único processo, com relatório JSON.
+
+Sobe um tracker e N pares (motor com threads de par.py) em portas efêmeras de
+localhost. Tamanho do arquivo e dos pedaços, número de semeadores, cronograma
+de entrada dos leechers e banda/latência de cada enlace são configuráveis, assim
+como qualquer constante de módulo (--definir). O relatório traz percentis do
+tempo até completar, goodput e envio de cada par, a fração do envio feita pelos
+semeadores e a taxa de RPCs no tracker. Com --comparar, mostra a variação de
+cada métrica em relação a um relatório anterior (linha de base).
+
+Uso: python benchmark_enxame.py [--leechers 8] [--semeadores 1] [--mb 32] [--pedaco-kb 256]
+         [--intervalo-entrada 0] [--banda-mbps 0] [--latencia-ms 0] [--repeticoes 1]
+         [--definir par.DOWNLOADS_INICIAIS=8] [--saida relatorio.json] [--comparar base.json]
+"""
+import argparse
+import ast
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from criar_arquivo import criar_arquivo_teste, criar_metainfo
+from rastreador import criar_servidor
+
+MB = 1024 * 1024
+INTERVALO_AMOSTRA = 0.01  # Intervalo entre verificações de conclusão dos leechers (segundos)
+
+# Métricas do resumo comparadas com a linha de base: (chave, maior é melhor?)
+METRICAS_COMPARADAS = [
+    ('tempo_p50_s', False),
+    ('tempo_p90_s', False),
+    ('tempo_max_s', False),
+    ('goodput_p50_mb_s', True),
+    ('fracao_envio_semeadores', False),
+    ('rpc_por_segundo', False),
+]
+
+
+class ModeladorEnlaces:
+    """Emula banda e latência em cada enlace (par de origem -> par de destino).
+
+    É o gancho `modelador` de Par, chamado antes do envio de cada bloco. Um
+    bloco começa a ser transmitido quando sua requisição já chegou há
+    `latencia` segundos (ida e volta) e o enlace terminou o bloco anterior, e
+    ocupa o enlace por tamanho/banda segundos; o servidor espera até o fim da
+    transmissão e então envia pelo loopback. Também soma os bytes enviados por
+    cada par.
+    """
+
+    def __init__(self, banda=None, latencia=0.0):
+        self.banda = banda          # Bytes/s de cada enlace (None = ilimitada)
+        self.latencia = latencia    # Segundos
+        self.enviados = Counter()   # {id_par: bytes enviados}
+        self._livre = {}            # {(origem, destino): instante em que o enlace fica livre}
+        self._lock = threading.Lock()
+
+    def __call__(self, origem, destino, tamanho, chegada):
+        agora = time.monotonic()
+        with self._lock:
+            self.enviados[origem] += tamanho
+            if self.banda is None and not self.latencia:
+                return 0.0
+            pronta = (agora if chegada is None else chegada) + self.latencia
+            inicio = max(pronta, self._livre.get((origem, destino), 0.0))
+            fim = inicio + (tamanho / self.banda if self.banda else 0.0)
+            self._livre[(origem, destino)] = fim
+        return fim - agora
+
+
+def _percentil(valores, p):
+    """Percentil p (0-100) com interpolação linear; None para lista vazia"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    abaixo = int(posicao)
+    acima = min(abaixo + 1, len(ordenados) - 1)
+    return ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * (posicao - abaixo)
+
+
+def _arredondar(valor, casas=3):
+    return None if valor is None else round(valor, casas)
+
+
+def aplicar_definicoes(definicoes):
+    """Aplica sobrescritas 'modulo.CONSTANTE=valor' (valor em sintaxe Python).
+
+    Retorna {"modulo.CONSTANTE": valor aplicado}, gravado no relatório.
+    """
+    aplicadas = {}
+    for definicao in definicoes:
+        nome, _, valor = definicao.partition('=')
+        modulo, _, constante = nome.strip().rpartition('.')
+        alvo = importlib.import_module(modulo)
+        if not hasattr(alvo, constante):
+            raise SystemExit(f"{modulo} não tem a constante {constante}")
+        aplicadas[nome.strip()] = ast.literal_eval(valor.strip())
+        setattr(alvo, constante, aplicadas[nome.strip()])
+    return aplicadas
+
+
+def executar_enxame(args, caminho, tamanho_arquivo):
+    """Executa um enxame até todos os leechers completarem (ou o timeout) e mede"""
+    import par
+
+    servidor, rastreador = criar_servidor('localhost', 0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://localhost:{servidor.server_address[1]}"
+    modelador = ModeladorEnlaces(args.banda_mbps * MB / 8 if args.banda_mbps else None,
+                                 args.latencia_ms / 1000)
+
+    semeadores, leechers, entradas, conclusoes = [], [], {}, {}
+    try:
+        for _ in range(args.semeadores):
+            semeadores.append(par.Par('localhost', 0, True, url, caminho, modelador))
+
+        inicio = time.monotonic()
+        while True:
+            agora = time.monotonic()
+            # Cronograma de entrada: o leecher i entra em i * intervalo_entrada
+            while (len(leechers) < args.leechers
+                   and agora >= inicio + len(leechers) * args.intervalo_entrada):
+                leecher = par.Par('localhost', 0, False, url, caminho, modelador)
+                entradas[leecher.id_par] = time.monotonic()
+                leechers.append(leecher)
+            for leecher in leechers:
+                if (leecher.id_par not in conclusoes
+                        and len(leecher.meus_pedacos) == leecher.total_pedacos):
+                    conclusoes[leecher.id_par] = time.monotonic()
+            if len(conclusoes) == args.leechers or agora - inicio > args.timeout:
+                break
+            time.sleep(INTERVALO_AMOSTRA)
+        fim = time.monotonic()
+        with rastreador._trava:
+            rpcs = rastreador._stats['total_registros'] + rastreador._stats['total_consultas']
+    finally:
+        for p in semeadores + leechers:
+            p.parar()
+        servidor.shutdown()
+        servidor.server_close()
+        for leecher in leechers:
+            with contextlib.suppress(OSError):
+                os.remove(leecher.caminho_arquivo)
+
+    # Métricas por par, nomeadas pela ordem de entrada (portas mudam a cada execução)
+    pares, tempos, goodputs = [], [], []
+    for numero, p in enumerate(semeadores):
+        pares.append({'nome': f"semeador-{numero}",
+                      'enviado_mb': _arredondar(modelador.enviados[p.id_par] / MB)})
+    for numero, p in enumerate(leechers):
+        entrada = entradas[p.id_par]
+        concluido = p.id_par in conclusoes
+        tempo = (conclusoes[p.id_par] if concluido else fim) - entrada
+        obtido = tamanho_arquivo if concluido else len(p.meus_pedacos) * p.tamanho_pedaco
+        goodput = obtido / MB / tempo if tempo > 0 else None
+        if concluido:
+            tempos.append(tempo)
+        if goodput is not None:
+            goodputs.append(goodput)
+        pares.append({'nome': f"leecher-{numero}",
+                      'entrada_s': _arredondar(entrada - inicio),
+                      'completou': concluido,
+                      'tempo_s': _arredondar(tempo),
+                      'goodput_mb_s': _arredondar(goodput),
+                      'enviado_mb': _arredondar(modelador.enviados[p.id_par] / MB)})
+
+    enviado_total = sum(modelador.enviados.values())
+    enviado_semeadores = sum(modelador.enviados[p.id_par] for p in semeadores)
+    duracao = fim - inicio
+    return {
+        'duracao_s': _arredondar(duracao),
+        'completos': len(conclusoes),
+        'tempo_ate_completar_s': {f"p{p}": _arredondar(_percentil(tempos, p))
+                                  for p in (50, 90, 99, 100)},
+        'goodput_mb_s': {f"p{p}": _arredondar(_percentil(goodputs, p)) for p in (10, 50, 90)},
+        'fracao_envio_semeadores': _arredondar(enviado_semeadores / enviado_total
+                                               if enviado_total else None),
+        'rpc_rastreador': {'total': rpcs, 'por_segundo': _arredondar(rpcs / duracao)},
+        'pares': pares,
+    }
+
+
+def resumir(execucoes):
+    """Mediana, entre as repetições, das métricas comparadas com a linha de base"""
+    colunas = {
+        'tempo_p50_s': [e['tempo_ate_completar_s']['p50'] for e in execucoes],
+        'tempo_p90_s': [e['tempo_ate_completar_s']['p90'] for e in execucoes],
+        'tempo_max_s': [e['tempo_ate_completar_s']['p100'] for e in execucoes],
+        'goodput_p50_mb_s': [e['goodput_mb_s']['p50'] for e in execucoes],
+        'fracao_envio_semeadores': [e['fracao_envio_semeadores'] for e in execucoes],
+        'rpc_por_segundo': [e['rpc_rastreador']['por_segundo'] for e in execucoes],
+    }
+    resumo = {chave: _arredondar(statistics.median([v for v in valores if v is not None]))
+              if any(v is not None for v in valores) else None
+              for chave, valores in colunas.items()}
+    resumo['completos'] = min(e['completos'] for e in execucoes)
+    return resumo
+
+
+def comparar(base, atual):
+    """Imprime a variação de cada métrica do resumo em relação à linha de base"""
+    print(f"\n{'métrica':<26}{'base':>10}{'atual':>10}{'variação':>11}")
+    for chave, maior_melhor in METRICAS_COMPARADAS:
+        antes, depois = base['resumo'].get(chave), atual['resumo'].get(chave)
+        if antes is None or depois is None:
+            print(f"{chave:<26}{str(antes):>10}{str(depois):>10}{'-':>11}")
+            continue
+        variacao = (depois - antes) / antes * 100 if antes else 0.0
+        melhorou = (variacao > 0) == maior_melhor
+        sinal = '' if variacao == 0 else (' +' if melhorou else ' -')
+        print(f"{chave:<26}{antes:>10.3f}{depois:>10.3f}{variacao:>+9.1f}%{sinal}")
+    if base.get('config') != atual.get('config'):
+        print("Atenção: as configurações dos dois relatórios são diferentes")
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'python': platform.python_version(), 'plataforma': platform.platform(),
+            'cpus': os.cpu_count(), 'commit': commit}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--leechers', type=int, default=8)
+    parser.add_argument('--semeadores', type=int, default=1)
+    parser.add_argument('--mb', type=int, default=32, help='tamanho do arquivo (MB)')
+    parser.add_argument('--pedaco-kb', type=int, default=256, help='tamanho do pedaço (KB)')
+    parser.add_argument('--intervalo-entrada', type=float, default=0,
+                        help='segundos entre a entrada de leechers consecutivos')
+    parser.add_argument('--banda-mbps', type=float, default=0,
+                        help='banda de cada enlace em Mbit/s (0 = ilimitada)')
+    parser.add_argument('--latencia-ms', type=float, default=0,
+                        help='latência de ida e volta de cada enlace (ms)')
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300, help='limite de cada execução (s)')
+    parser.add_argument('--semente', type=int, default=0, help='semente do arquivo e dos sorteios')
+    parser.add_argument('--definir', action='append', default=[], metavar='MODULO.CONSTANTE=VALOR',
+                        help='sobrescreve uma constante (ex: par.DOWNLOADS_INICIAIS=8)')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    parser.add_argument('--comparar', metavar='BASE.json', help='relatório da linha de base')
+    args = parser.parse_args()
+
+    definicoes = aplicar_definicoes(args.definir)
+    random.seed(args.semente)
+    config = {chave: valor for chave, valor in vars(args).items() if chave not in ('saida', 'comparar')}
+
+    execucoes = []
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'enxame.bin')
+        # Saída dos pares descartada: o custo do terminal não entra na medição
+        with contextlib.redirect_stdout(io.StringIO()):
+            criar_arquivo_teste(caminho, args.mb, args.semente)
+            criar_metainfo(caminho, args.pedaco_kb * 1024)
+        for repeticao in range(args.repeticoes):
+            with contextlib.redirect_stdout(io.StringIO()):
+                execucao = executar_enxame(args, caminho, os.path.getsize(caminho))
+            execucoes.append(execucao)
+            tempos = execucao['tempo_ate_completar_s']
+            print(f"Execução {repeticao + 1}/{args.repeticoes}: {execucao['completos']}/"
+                  f"{args.leechers} completos, p50 {tempos['p50']} s, p90 {tempos['p90']} s",
+                  file=sys.stderr)
+
+    relatorio = {'config': config, 'definicoes_aplicadas': definicoes, 'ambiente': _ambiente(),
+                 'resumo': resumir(execucoes), 'execucoes': execucoes}
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(json.load(f), relatorio)
+
+
+if __name__ == "__main__":
+    main()
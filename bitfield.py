@@ -0,0 +1,77 @@
+"""Representação compacta de conjuntos de pedaços (bitfields).
+
+O bit mais significativo do primeiro byte corresponde ao pedaço 0, como no
+protocolo BitTorrent.
+"""
+
+# Para cada valor de byte, os deslocamentos (0-7) dos bits ligados
+_BITS_DO_BYTE = tuple(
+    tuple(bit for bit in range(8) if valor & (0x80 >> bit))
+    for valor in range(256)
+)
+
+
+def tamanho_bitfield(total_pedacos):
+    """Número de bytes necessários para representar total_pedacos pedaços"""
+    return (total_pedacos + 7) // 8
+
+
+def dados_binarios(valor):
+    """Extrai os bytes de um bitfield recebido via XML-RPC (Binary ou bytes)"""
+    return bytes(getattr(valor, 'data', valor))
+
+
+def criar_bitfield(pedacos, total_pedacos=None):
+    """Cria um bitfield a partir de um iterável de índices de pedaços"""
+    pedacos = list(pedacos)
+    if total_pedacos is None:
+        total_pedacos = max(pedacos) + 1 if pedacos else 0
+
+    bitfield = bytearray(tamanho_bitfield(total_pedacos))
+    for indice in pedacos:
+        bitfield[indice >> 3] |= 0x80 >> (indice & 7)
+    return bitfield
+
+
+def definir_pedaco(bitfield, indice):
+    """Marca um pedaço como possuído, aumentando o bitfield se necessário"""
+    byte = indice >> 3
+    if byte >= len(bitfield):
+        bitfield.extend(bytes(byte + 1 - len(bitfield)))
+    bitfield[byte] |= 0x80 >> (indice & 7)
+
+
+def tem_pedaco(bitfield, indice):
+    """Verifica se o bitfield possui um pedaço"""
+    byte = indice >> 3
+    return byte < len(bitfield) and bool(bitfield[byte] & (0x80 >> (indice & 7)))
+
+
+def contar_pedacos(bitfield):
+    """Conta quantos pedaços estão marcados no bitfield"""
+    return int.from_bytes(bitfield, 'big').bit_count()
+
+
+def pedacos_do_bitfield(bitfield):
+    """Retorna a lista ordenada de pedaços marcados no bitfield"""
+    pedacos = []
+    for byte, valor in enumerate(bitfield):
+        if valor:
+            base = byte << 3
+            pedacos.extend(base + bit for bit in _BITS_DO_BYTE[valor])
+    return pedacos
+
+
+def diferenca_bitfields(antigo, novo):
+    """Retorna (ganhos, perdidos): pedaços que entraram e saíram de antigo para novo"""
+    ganhos, perdidos = [], []
+    tamanho = max(len(antigo), len(novo))
+    antigo = bytes(antigo).ljust(tamanho, b'\0')
+    novo = bytes(novo).ljust(tamanho, b'\0')
+
+    for byte, (a, n) in enumerate(zip(antigo, novo)):
+        if a != n:
+            base = byte << 3
+            ganhos.extend(base + bit for bit in _BITS_DO_BYTE[n & ~a & 0xFF])
+            perdidos.extend(base + bit for bit in _BITS_DO_BYTE[a & ~n & 0xFF])
+    return ganhos, perdidos
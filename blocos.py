@@ -0,0 +1,107 @@
+"""Download de um pedaço em blocos, requisitados a vários pares ao mesmo tempo."""
+import threading
+import time
+
+TAMANHO_BLOCO = 16 * 1024  # Tamanho de cada bloco requisitado (16KB)
+
+
+class PedacoEmAndamento:
+    """Estado dos blocos de um pedaço em download.
+
+    Os blocos são copiados para suas posições no buffer do pedaço à medida que
+    chegam, de qualquer fonte. Um bloco requisitado há mais de timeout_bloco
+    segundos pode ser pedido a outra fonte; no endgame, blocos pendentes são
+    pedidos a todas as fontes e as cópias excedentes são canceladas.
+    """
+
+    def __init__(self, indice, tamanho, buffer):
+        self.indice = indice
+        self.tamanho = tamanho
+        self.buffer = buffer  # memoryview com exatamente `tamanho` bytes
+        self.blocos = [(inicio, min(TAMANHO_BLOCO, tamanho - inicio))
+                       for inicio in range(0, tamanho, TAMANHO_BLOCO)]
+        self.faltantes = len(self.blocos)
+        self.fontes_rejeitadas = set()
+        self.fontes_lentas = set()  # Fontes com bloco sem resposta após timeout_bloco
+        self.ultimo_progresso = time.monotonic()
+        self.finalizado = False
+
+        self._recebidos = [False] * len(self.blocos)
+        self._requisicoes = {}    # {numero_bloco: {id_fonte: (instante, conexao)}}
+        self._por_fonte = {}      # {id_fonte: requisições pendentes}
+        self._lock = threading.Lock()
+
+    def em_andamento(self, id_fonte):
+        return self._por_fonte.get(id_fonte, 0)
+
+    def reservar_blocos(self, id_fonte, conexao, quantidade, endgame, timeout_bloco):
+        """Escolhe até `quantidade` blocos a pedir para a fonte e os marca como requisitados"""
+        agora = time.monotonic()
+        escolhidos = []
+        with self._lock:
+            if self.finalizado:
+                return escolhidos
+            for numero, recebido in enumerate(self._recebidos):
+                if len(escolhidos) >= quantidade:
+                    break
+                if recebido:
+                    continue
+                requisicoes = self._requisicoes.get(numero)
+                if requisicoes:
+                    if id_fonte in requisicoes:
+                        continue
+                    # Já pedido a outra fonte: só repete no endgame ou se travou
+                    travado = all(agora - instante > timeout_bloco
+                                  for instante, _ in requisicoes.values())
+                    if travado:
+                        self.fontes_lentas.update(requisicoes)
+                    elif not endgame:
+                        continue
+                self._requisicoes.setdefault(numero, {})[id_fonte] = (agora, conexao)
+                escolhidos.append(numero)
+            self._por_fonte[id_fonte] = self._por_fonte.get(id_fonte, 0) + len(escolhidos)
+        return escolhidos
+
+    def _remover_requisicao(self, numero, id_fonte):
+        requisicoes = self._requisicoes.get(numero)
+        if requisicoes and requisicoes.pop(id_fonte, None) is not None:
+            self._por_fonte[id_fonte] -= 1
+            if not requisicoes:
+                del self._requisicoes[numero]
+
+    def receber(self, numero, id_fonte, dados):
+        """Copia o bloco para o buffer; retorna as requisições duplicadas a cancelar"""
+        with self._lock:
+            self._remover_requisicao(numero, id_fonte)
+            if self.finalizado or self._recebidos[numero] or len(dados) != self.blocos[numero][1]:
+                return []
+
+            inicio, tamanho = self.blocos[numero]
+            self.buffer[inicio:inicio + tamanho] = dados
+            self._recebidos[numero] = True
+            self.faltantes -= 1
+            self.ultimo_progresso = time.monotonic()
+
+            duplicadas = []
+            for outra_fonte, (_, conexao) in self._requisicoes.pop(numero, {}).items():
+                self._por_fonte[outra_fonte] -= 1
+                duplicadas.append(conexao)
+            return duplicadas
+
+    def falhou(self, numero, id_fonte, rejeitado=False):
+        """Libera o bloco para ser pedido novamente; fontes que rejeitaram são descartadas"""
+        with self._lock:
+            self._remover_requisicao(numero, id_fonte)
+            if rejeitado:
+                self.fontes_rejeitadas.add(id_fonte)
+
+    def finalizar(self):
+        """Encerra o download; retorna [(conexao, numero_bloco)] ainda pendentes para cancelar"""
+        with self._lock:
+            self.finalizado = True
+            pendentes = [(conexao, numero)
+                         for numero, requisicoes in self._requisicoes.items()
+                         for _, conexao in requisicoes.values()]
+            self._requisicoes.clear()
+            self._por_fonte.clear()
+        return pendentes
@@ -0,0 +1,156 @@
+"""Teste de carga do servidor de um par: muitas conexões persistentes simultâneas.
+
+Sobe um tracker e um semeador (motor com threads de par.py ou motor asyncio
+de par_async.py) em processos separados e abre N conexões de clientes, cada
+uma requisitando blocos aleatórios em sequência. Ao final mostra as conexões
+aceitas, as respostas por segundo e a memória e as threads do processo do
+semeador (lidas de /proc, apenas Linux).
+
+Uso: python carga_conexoes.py [--motor asyncio] [--conexoes 2000] [--duracao 5] [--mb 16]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from blocos import TAMANHO_BLOCO
+from criar_arquivo import criar_arquivo_teste, criar_metainfo
+from protocolo import (MENSAGENS_ENXAME, MSG_BLOCO, MSG_HANDSHAKE, MSG_REQUISICAO, REQUISICAO,
+                       codificar_handshake, ler_cabecalho, ler_exato, montar_mensagem)
+from rastreador import criar_servidor
+
+
+def _servir_rastreador(fila_porta):
+    servidor, _ = criar_servidor('localhost', 0)
+    fila_porta.put(servidor.server_address[1])
+    servidor.serve_forever()
+
+
+def _servir_semeador(motor, diretorio, url_rastreador, porta):
+    # Processo do semeador: saída descartada para não medir o custo do terminal
+    import contextlib
+    import io
+    os.chdir(diretorio)
+    import par
+    par.URL_RASTREADOR = url_rastreador
+    # Todos os clientes são atendidos: mede o servidor, não o estrangulamento
+    par.SLOTS_DESESTRANGULADOS = 1 << 20
+    with contextlib.redirect_stdout(io.StringIO()):
+        if motor == 'asyncio':
+            import par_async
+            par_async.aumentar_limite_descritores()
+            asyncio.run(par_async.ParAsync('localhost', porta, True).executar())
+        else:
+            par.Par('localhost', porta, True)
+            while True:
+                time.sleep(60)
+
+
+def _status_processo(pid):
+    """(memória residente em MB, threads) do processo, ou (None, None) fora do Linux"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            campos = dict(linha.split(':', 1) for linha in f)
+        return int(campos['VmRSS'].split()[0]) / 1024, int(campos['Threads'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+async def _cliente(numero, porta, info_hash, total_pedacos, tamanho_pedaco, fim, contagem):
+    try:
+        leitor, escritor = await asyncio.open_connection('localhost', porta)
+        escritor.write(montar_mensagem(MSG_HANDSHAKE, codificar_handshake(info_hash, f"cliente-{numero}")))
+    except OSError:
+        contagem['recusadas'] += 1
+        return
+    contagem['abertas'] += 1
+    try:
+        while time.monotonic() < fim:
+            indice = random.randrange(total_pedacos)
+            inicio = random.randrange(tamanho_pedaco // TAMANHO_BLOCO) * TAMANHO_BLOCO
+            escritor.write(montar_mensagem(MSG_REQUISICAO,
+                                           REQUISICAO.pack(indice, inicio, TAMANHO_BLOCO)))
+            tipo = None
+            while tipo is None or tipo in MENSAGENS_ENXAME:
+                # Bitfield, TENHO e PEX do semeador não respondem a requisições
+                cabecalho = await ler_cabecalho(leitor)
+                if cabecalho is None:
+                    contagem['encerradas'] += 1
+                    return
+                tipo, tamanho = cabecalho
+                await ler_exato(leitor, tamanho)
+            contagem['blocos' if tipo == MSG_BLOCO else 'recusas'] += 1
+    except (OSError, ConnectionError):
+        contagem['encerradas'] += 1
+    finally:
+        escritor.close()
+
+
+async def _amostrar(pid, atraso, contagem):
+    # Memória e threads do semeador no meio da carga
+    await asyncio.sleep(atraso)
+    contagem['memoria'], contagem['threads'] = _status_processo(pid)
+
+
+async def _clientes(conexoes, porta, metainfo, duracao, pid):
+    contagem = dict.fromkeys(('abertas', 'recusadas', 'encerradas', 'blocos', 'recusas'), 0)
+    fim = time.monotonic() + duracao
+    await asyncio.gather(_amostrar(pid, duracao / 2, contagem),
+                         *(_cliente(i, porta, metainfo['info_hash'], len(metainfo['hashes']),
+                                    metainfo['tamanho_pedaco'], fim, contagem)
+                           for i in range(conexoes)))
+    return contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--motor', choices=('threads', 'asyncio'), default='asyncio')
+    parser.add_argument('--conexoes', type=int, default=2000)
+    parser.add_argument('--duracao', type=float, default=5)
+    parser.add_argument('--mb', type=int, default=16)
+    parser.add_argument('--porta', type=int, default=19500)
+    args = parser.parse_args()
+
+    try:
+        import resource
+        _, rigido = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (rigido, rigido))
+    except (ImportError, ValueError, OSError):
+        pass
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        import par
+        caminho = os.path.join(diretorio, par.NOME_ARQUIVO)
+        criar_arquivo_teste(caminho, args.mb)
+        metainfo = criar_metainfo(caminho, destino=os.path.join(diretorio, par.ARQUIVO_METAINFO))
+
+        fila_porta = multiprocessing.Queue()
+        rastreador = multiprocessing.Process(target=_servir_rastreador, args=(fila_porta,), daemon=True)
+        rastreador.start()
+        url = f"http://localhost:{fila_porta.get()}"
+
+        semeador = multiprocessing.Process(target=_servir_semeador, daemon=True,
+                                           args=(args.motor, diretorio, url, args.porta))
+        semeador.start()
+        time.sleep(2)
+        memoria_antes, _ = _status_processo(semeador.pid)
+
+        contagem = asyncio.run(_clientes(args.conexoes, args.porta, metainfo, args.duracao,
+                                         semeador.pid))
+        semeador.terminate()
+        rastreador.terminate()
+
+    print(f"\nMotor {args.motor}: {contagem['abertas']}/{args.conexoes} conexões abertas, "
+          f"{contagem['encerradas']} encerradas pelo semeador")
+    print(f"  {contagem['blocos'] / args.duracao:.0f} blocos/s e "
+          f"{contagem['recusas'] / args.duracao:.0f} recusas/s")
+    if contagem['memoria'] is not None:
+        print(f"  Semeador sob carga: {contagem['memoria']:.1f} MB residentes "
+              f"(ocioso: {memoria_antes:.1f} MB), {contagem['threads']} threads")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Teste de carga do rastreador: mede anúncios por segundo em cada modo de servidor.
+
+Compara o servidor original (SimpleXMLRPCServer, uma requisição por vez e uma
+conexão por chamada) com o servidor concorrente com keep-alive, via XML-RPC e
+via endpoint JSON. Servidor e clientes rodam em processos separados.
+
+Uso: python carga_rastreador.py [--processos 4] [--threads 8] [--duracao 5] [--pedacos 500]
+"""
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+import xmlrpc.client
+
+from bitfield import criar_bitfield
+from rastreador import criar_servidor
+from rpc_json import CAMINHO_JSON, conectar_rastreador
+
+CENARIOS = [
+    # (nome, servidor concorrente?, caminho do endpoint)
+    ('simples/xml-rpc', False, '/'),
+    ('concorrente/xml-rpc', True, '/'),
+    ('concorrente/json', True, CAMINHO_JSON),
+]
+
+
+def _servir(concorrente, fila_porta):
+    servidor, _ = criar_servidor('localhost', 0, concorrente=concorrente)
+    fila_porta.put(servidor.server_address[1])
+    servidor.serve_forever()
+
+
+def _cliente(url, id_par, total_pedacos, inicio, fim, resultados):
+    # Registra um bitfield parcial e anuncia um pedaço novo por chamada
+    rastreador = conectar_rastreador(url)
+    pedacos = list(range(total_pedacos))
+    random.shuffle(pedacos)
+    anuncios = erros = 0
+    versao = 0
+    try:
+        inicial = pedacos[:total_pedacos // 2]
+        rastreador.registrar_bitfield(id_par, xmlrpc.client.Binary(
+            bytes(criar_bitfield(inicial, total_pedacos))))
+    except Exception:
+        erros += 1
+
+    restantes = pedacos[total_pedacos // 2:] or [0]
+    time.sleep(max(0, inicio - time.time()))
+    while time.time() < fim:
+        try:
+            resposta = rastreador.anunciar(id_par, [restantes[anuncios % len(restantes)]], versao)
+            versao = resposta.get('versao', 0)
+            anuncios += 1
+        except Exception:
+            erros += 1
+    resultados.append((anuncios, erros))
+
+
+def _processo_clientes(url, prefixo, threads, total_pedacos, inicio, fim, fila_resultados):
+    resultados = []
+    trabalhadores = [
+        threading.Thread(target=_cliente,
+                         args=(url, f"{prefixo}-{i}", total_pedacos, inicio, fim, resultados))
+        for i in range(threads)
+    ]
+    for t in trabalhadores:
+        t.start()
+    for t in trabalhadores:
+        t.join()
+    fila_resultados.put((sum(a for a, _ in resultados), sum(e for _, e in resultados)))
+
+
+def executar_cenario(concorrente, caminho, processos, threads, duracao, total_pedacos):
+    """Executa um cenário e retorna (anúncios/s, erros)"""
+    fila_porta = multiprocessing.Queue()
+    servidor = multiprocessing.Process(target=_servir, args=(concorrente, fila_porta), daemon=True)
+    servidor.start()
+    url = f"http://localhost:{fila_porta.get()}{caminho}"
+
+    fila_resultados = multiprocessing.Queue()
+    # Todos os clientes começam juntos, depois de registrados
+    inicio = time.time() + 2
+    fim = inicio + duracao
+    clientes = [
+        multiprocessing.Process(target=_processo_clientes,
+                                args=(url, f"par{p}", threads, total_pedacos, inicio, fim,
+                                      fila_resultados))
+        for p in range(processos)
+    ]
+    for c in clientes:
+        c.start()
+    totais = [fila_resultados.get() for _ in clientes]
+    for c in clientes:
+        c.join()
+    servidor.terminate()
+    servidor.join()
+
+    anuncios = sum(a for a, _ in totais)
+    erros = sum(e for _, e in totais)
+    return anuncios / duracao, erros
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processos', type=int, default=4, help='processos de clientes')
+    parser.add_argument('--threads', type=int, default=8, help='clientes por processo')
+    parser.add_argument('--duracao', type=float, default=5, help='duração de cada cenário (s)')
+    parser.add_argument('--pedacos', type=int, default=500, help='pedaços do arquivo simulado')
+    args = parser.parse_args()
+
+    print(f"{args.processos * args.threads} clientes, {args.duracao:.0f}s por cenário\n")
+    print(f"{'cenário':<22} {'anúncios/s':>12} {'erros':>8}")
+    for nome, concorrente, caminho in CENARIOS:
+        taxa, erros = executar_cenario(concorrente, caminho, args.processos, args.threads,
+                                       args.duracao, args.pedacos)
+        print(f"{nome:<22} {taxa:>12.0f} {erros:>8}")
+
+
+if __name__ == "__main__":
+    main()
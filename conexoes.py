@@ -0,0 +1,249 @@
+"""Conexões persistentes com outros pares, com requisições em pipeline."""
+import socket
+import threading
+
+from armazenamento import receber_em
+from protocolo import (BLOCO, MENSAGENS_ENXAME, MSG_BLOCO, MSG_CANCELAR, MSG_ESTRANGULADO,
+                       MSG_HANDSHAKE, MSG_REJEITADO, MSG_REQUISICAO, REQUISICAO, ErroProtocolo,
+                       codificar_handshake, enviar_mensagem, montar_mensagem, receber_cabecalho,
+                       receber_exato)
+
+MAX_CONEXOES_POR_PAR = 2     # Conexões simultâneas abertas para um mesmo par remoto
+MAX_PIPELINE = 8             # Requisições pendentes por conexão antes de abrir outra
+TIMEOUT_CONEXAO = 10         # Timeout de conexão e de resposta (segundos)
+TAMANHO_BUFFER_BLOCO = 16 * 1024  # Buffer de recepção inicial de cada conexão
+
+
+class PedacoIndisponivel(Exception):
+    """O par remoto não possui o trecho requisitado"""
+
+
+class ParEstrangulado(PedacoIndisponivel):
+    """O par remoto não está nos atendendo no momento (choke)"""
+
+
+class SemVagasConexao(Exception):
+    """Todas as vagas de conexões abertas pelo processo estão em uso"""
+
+
+class ConexaoPar:
+    """Conexão TCP persistente com um par remoto.
+
+    Requisições são enviadas sem esperar as anteriores; uma thread leitora
+    recebe cada bloco (recv_into) em um buffer reutilizado pela conexão e
+    chama ao_concluir(dados, erro) da requisição correspondente. `dados` é uma
+    memoryview válida apenas durante a chamada: quem consome deve copiá-la.
+
+    O handshake identifica o torrent (info_hash) e o par local. Logo após ele
+    são enviadas as mensagens [(tipo, carga)] retornadas por ao_conectar();
+    mensagens do enxame recebidas (bitfield, TENHO, PEX) são repassadas a
+    ao_receber(id_remoto, tipo, carga). Quando a conexão fecha, por qualquer
+    motivo, ao_encerrar(id_remoto) é chamado uma vez.
+    """
+
+    def __init__(self, host, porta, id_local, info_hash, timeout=None,
+                 ao_conectar=None, ao_receber=None, ao_encerrar=None):
+        self.endereco = (host, porta)
+        self.id_remoto = f"{host}:{porta}"
+        self.ao_receber = ao_receber
+        self.ao_encerrar = ao_encerrar
+        self.timeout = TIMEOUT_CONEXAO if timeout is None else timeout
+        self.sock = socket.create_connection(self.endereco, timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock_envio = threading.Lock()
+        self._lock = threading.Lock()
+        self._pendentes = {}  # {(indice, inicio): ao_concluir}
+        self._buffer = bytearray(TAMANHO_BUFFER_BLOCO)
+        self.fechada = False
+
+        enviar_mensagem(self.sock, MSG_HANDSHAKE, codificar_handshake(info_hash, id_local))
+        for tipo, carga in (ao_conectar() if ao_conectar else ()):
+            enviar_mensagem(self.sock, tipo, carga)
+        threading.Thread(target=self._ler_respostas, daemon=True).start()
+
+    @property
+    def em_andamento(self):
+        return len(self._pendentes)
+
+    def requisitar(self, indice, inicio, tamanho, ao_concluir):
+        """Envia uma requisição; ao_concluir é chamado na thread leitora"""
+        chave = (indice, inicio)
+        with self._lock:
+            if self.fechada:
+                raise ConnectionError(f"Conexão com {self.endereco} encerrada")
+            self._pendentes[chave] = ao_concluir
+
+        self._enviar(MSG_REQUISICAO, REQUISICAO.pack(indice, inicio, tamanho))
+
+    def cancelar(self, indice, inicio, tamanho):
+        """Desiste de uma requisição; o par remoto a descarta se ainda não a atendeu"""
+        with self._lock:
+            if self._pendentes.pop((indice, inicio), None) is None or self.fechada:
+                return
+        self._enviar(MSG_CANCELAR, REQUISICAO.pack(indice, inicio, tamanho))
+
+    def enviar(self, tipo, carga=b''):
+        """Envia uma mensagem avulsa (ex: TENHO) pela conexão"""
+        if not self.fechada:
+            self._enviar(tipo, carga)
+
+    def _enviar(self, tipo, carga):
+        try:
+            with self._lock_envio:
+                self.sock.sendall(montar_mensagem(tipo, carga))
+        except OSError as e:
+            self._encerrar(e)
+
+    def _ler_respostas(self):
+        try:
+            while True:
+                try:
+                    cabecalho = receber_cabecalho(self.sock)
+                except socket.timeout:
+                    if self._pendentes:
+                        raise
+                    continue  # Conexão ociosa: continua aguardando
+                if cabecalho is None:
+                    raise ConnectionError("Conexão encerrada pelo par")
+
+                tipo, tamanho = cabecalho
+                if tipo == MSG_BLOCO:
+                    self._receber_bloco(tamanho)
+                    continue
+
+                carga = receber_exato(self.sock, tamanho)
+                if tipo == MSG_REJEITADO:
+                    indice, inicio, _ = REQUISICAO.unpack(carga)
+                    self._resolver((indice, inicio), None,
+                                   PedacoIndisponivel(f"Pedaço {indice} indisponível"))
+                elif tipo == MSG_ESTRANGULADO:
+                    indice, inicio, _ = REQUISICAO.unpack(carga)
+                    self._resolver((indice, inicio), None,
+                                   ParEstrangulado(f"{self.endereco} não está nos atendendo"))
+                elif tipo in MENSAGENS_ENXAME:
+                    if self.ao_receber:
+                        self.ao_receber(self.id_remoto, tipo, carga)
+                else:
+                    raise ErroProtocolo(f"Mensagem inesperada do tipo {tipo}")
+        except Exception as e:
+            self._encerrar(e)
+
+    def _receber_bloco(self, tamanho):
+        indice, inicio = BLOCO.unpack(receber_exato(self.sock, BLOCO.size))
+        tamanho_dados = tamanho - BLOCO.size
+        if tamanho_dados > len(self._buffer):
+            self._buffer = bytearray(tamanho_dados)
+
+        dados = memoryview(self._buffer)[:tamanho_dados]
+        receber_em(self.sock, dados)
+        # Blocos cancelados ainda podem chegar; são simplesmente descartados
+        self._resolver((indice, inicio), dados, None)
+
+    def _resolver(self, chave, dados, erro):
+        with self._lock:
+            ao_concluir = self._pendentes.pop(chave, None)
+        if ao_concluir is not None:
+            self._notificar(ao_concluir, dados, erro)
+
+    def _notificar(self, ao_concluir, dados, erro):
+        try:
+            ao_concluir(dados, erro)
+        except Exception as e:
+            print(f"Erro ao processar resposta de {self.endereco}: {e}")
+
+    def _encerrar(self, motivo):
+        # Marca a conexão como fechada e falha todas as requisições pendentes
+        with self._lock:
+            ja_fechada, self.fechada = self.fechada, True
+            pendentes, self._pendentes = self._pendentes, {}
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        erro = ConnectionError(f"Conexão com {self.endereco} perdida: {motivo}")
+        for ao_concluir in pendentes.values():
+            self._notificar(ao_concluir, None, erro)
+        if not ja_fechada and self.ao_encerrar:
+            self.ao_encerrar(self.id_remoto)
+
+    def fechar(self):
+        self._encerrar("fechada localmente")
+
+
+class PoolConexoes:
+    """Mantém até MAX_CONEXOES_POR_PAR conexões persistentes por par remoto, em um torrent.
+
+    Com reservar e liberar, cada conexão aberta ocupa uma vaga: reservar()
+    retorna se há vaga para mais uma, e liberar() a devolve quando ela fecha.
+    """
+
+    def __init__(self, id_local, info_hash, timeout=None, ao_conectar=None,
+                 ao_receber=None, ao_encerrar=None, reservar=None, liberar=None):
+        self.id_local = id_local
+        self.info_hash = info_hash
+        self.timeout = TIMEOUT_CONEXAO if timeout is None else timeout
+        self.ao_conectar = ao_conectar
+        self.ao_receber = ao_receber
+        self.ao_encerrar = ao_encerrar
+        self.reservar = reservar
+        self.liberar = liberar
+        self._conexoes = {}  # {(host, porta): [ConexaoPar]}
+        self._lock = threading.Lock()
+
+    def obter(self, host, porta):
+        """Retorna a conexão menos ocupada com o par, abrindo outra se necessário.
+
+        Sem vaga para abrir, fica com a existente ou levanta SemVagasConexao.
+        """
+        endereco = (host, porta)
+        with self._lock:
+            conexoes = [c for c in self._conexoes.get(endereco, []) if not c.fechada]
+            self._conexoes[endereco] = conexoes
+            melhor = min(conexoes, key=lambda c: c.em_andamento, default=None)
+            if melhor and (melhor.em_andamento < MAX_PIPELINE
+                           or len(conexoes) >= MAX_CONEXOES_POR_PAR):
+                return melhor
+
+        if self.reservar is not None and not self.reservar():
+            if melhor:
+                return melhor
+            raise SemVagasConexao(f"Sem vaga para abrir conexão com {host}:{porta}")
+        # Abre a nova conexão fora da trava para não bloquear os demais pares
+        try:
+            nova = ConexaoPar(host, porta, self.id_local, self.info_hash, self.timeout,
+                              self.ao_conectar, self.ao_receber, self._conexao_encerrada)
+        except BaseException:
+            if self.liberar is not None:
+                self.liberar()
+            raise
+        with self._lock:
+            self._conexoes.setdefault(endereco, []).append(nova)
+        return nova
+
+    def _conexao_encerrada(self, id_remoto):
+        if self.liberar is not None:
+            self.liberar()
+        if self.ao_encerrar is not None:
+            self.ao_encerrar(id_remoto)
+
+    def ceder(self):
+        """Fecha a conexão com menos requisições pendentes, devolvendo sua vaga"""
+        with self._lock:
+            abertas = [c for lista in self._conexoes.values() for c in lista if not c.fechada]
+        if abertas:
+            min(abertas, key=lambda c: c.em_andamento).fechar()
+
+    def conectadas(self):
+        """{id_remoto: conexão aberta}, uma por par remoto"""
+        with self._lock:
+            return {conexoes[0].id_remoto: conexoes[0]
+                    for conexoes in ([c for c in lista if not c.fechada]
+                                     for lista in self._conexoes.values())
+                    if conexoes}
+
+    def fechar_todas(self):
+        with self._lock:
+            conexoes = [c for lista in self._conexoes.values() for c in lista]
+            self._conexoes.clear()
+        for conexao in conexoes:
+            conexao.fechar()
@@ -0,0 +1,81 @@
+"""Controle adaptativo de concorrência (AIMD) guiado por vazão útil e falhas."""
+import threading
+import time
+
+FATOR_REDUCAO = 0.5       # Redução multiplicativa da janela após falha ou queda de vazão
+TOLERANCIA_VAZAO = 0.25   # Queda relativa de vazão entre rodadas que indica saturação
+
+
+class ControleAIMD:
+    """Janela de concorrência com aumento aditivo e redução multiplicativa.
+
+    Como no controle de congestionamento do TCP, a janela começa em partida
+    lenta (cresce `incremento` a cada conclusão, dobrando por rodada) até a
+    primeira redução; depois, cada conclusão bem-sucedida aumenta a janela em
+    incremento/janela (cerca de `incremento` por rodada de `janela`
+    conclusões). A janela é multiplicada por `fator_reducao` quando há falhas
+    ou quando a vazão útil de uma rodada cai em relação à anterior, sinal de
+    que a concorrência extra só está gerando disputa. No máximo uma redução é
+    aplicada por rodada.
+    """
+
+    def __init__(self, inicial, minimo=1, maximo=64, incremento=1.0,
+                 fator_reducao=FATOR_REDUCAO, tolerancia_vazao=TOLERANCIA_VAZAO):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.incremento = incremento
+        self.fator_reducao = fator_reducao
+        self.tolerancia_vazao = tolerancia_vazao
+        self.janela = float(min(max(inicial, minimo), maximo))
+
+        self._partida_lenta = True
+        self._lock = threading.Lock()
+        self._iniciar_rodada(time.monotonic())
+        self._vazao_anterior = None
+
+    def _iniciar_rodada(self, agora):
+        self._inicio_rodada = agora
+        self._concluidos = 0
+        self._bytes = 0
+        self._reduziu = False
+
+    def _reduzir(self):
+        if not self._reduziu:
+            self.janela = max(self.minimo, self.janela * self.fator_reducao)
+            self._reduziu = True
+            self._partida_lenta = False
+
+    def limite(self):
+        """Quantidade de operações simultâneas permitida agora"""
+        return int(self.janela)
+
+    def vazao(self):
+        """Vazão útil (bytes/s) da última rodada completa"""
+        return self._vazao_anterior or 0.0
+
+    def sucesso(self, quantidade):
+        """Registra uma conclusão que entregou `quantidade` bytes úteis"""
+        with self._lock:
+            aumento = self.incremento if self._partida_lenta else self.incremento / self.janela
+            self.janela = min(self.maximo, self.janela + aumento)
+            self._concluidos += 1
+            self._bytes += quantidade
+            if self._concluidos >= self.janela:
+                self._fechar_rodada()
+
+    def falha(self):
+        """Registra uma falha (timeout, conexão perdida, dado inválido)"""
+        with self._lock:
+            self._reduzir()
+
+    def _fechar_rodada(self):
+        # Compara a vazão da rodada com a anterior e começa uma nova
+        agora = time.monotonic()
+        decorrido = agora - self._inicio_rodada
+        if decorrido > 0:
+            vazao = self._bytes / decorrido
+            anterior = self._vazao_anterior
+            if anterior and vazao < anterior * (1 - self.tolerancia_vazao):
+                self._reduzir()
+            self._vazao_anterior = vazao
+        self._iniciar_rodada(agora)
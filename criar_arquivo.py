@@ -1,28 +1,138 @@
-﻿import os
+﻿import hashlib
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
 
-def criar_arquivo_teste(nome_arquivo, tamanho_mb):
+TAMANHO_PEDACO_PADRAO = 1024 * 1024   # Tamanho de cada pedaço (1MB)
+ALGORITMO_PADRAO = 'sha1'             # Algoritmo de hash dos pedaços (sha1 ou sha256)
+EXTENSAO_METAINFO = '.torrent'        # Metainfo é salvo ao lado do arquivo
+PEDACOS_POR_TAREFA = 16               # Pedaços hasheados por tarefa do pool de processos
+INICIO_PROCESSOS = 'spawn'            # Sem fork: o processo que verifica pode já ter threads rodando
+
+def criar_arquivo_teste(nome_arquivo, tamanho_mb, semente=0):
     """
-    Cria um arquivo de teste com tamanho específico preenchido com bytes nulos.
+    Cria um arquivo de teste com tamanho específico preenchido com bytes
+    pseudoaleatórios (determinísticos pela semente), para que cada pedaço
+    tenha um hash distinto.
     """
     tamanho_bytes = tamanho_mb * 1024 * 1024
 
     if os.path.exists(nome_arquivo):
         print(f"O arquivo '{nome_arquivo}' já existe.")
         return
-        
+
     print(f"Criando o arquivo de teste '{nome_arquivo}' com {tamanho_mb} MB...")
-    
+
+    gerador = random.Random(semente)
     with open(nome_arquivo, 'wb') as f:
         tamanho_bloco = 1024 * 1024  # 1 MB
         numero_blocos = tamanho_mb
-        
+
         for _ in range(numero_blocos):
-            f.write(b'\0' * tamanho_bloco)
-            
+            f.write(gerador.randbytes(tamanho_bloco))
+
     print("Arquivo de teste criado com sucesso!")
 
+def hash_pedaco(dados, algoritmo=ALGORITMO_PADRAO):
+    """
+    Calcula o hash (em bytes) de um pedaço.
+    """
+    return hashlib.new(algoritmo, dados).digest()
+
+def _hashear_lote(caminho, primeiro, ultimo, tamanho_pedaco, algoritmo):
+    # Executado em um processo do pool: hasheia os pedaços [primeiro, ultimo)
+    hashes = []
+    with open(caminho, 'rb') as f:
+        f.seek(primeiro * tamanho_pedaco)
+        for _ in range(primeiro, ultimo):
+            hashes.append(hash_pedaco(f.read(tamanho_pedaco), algoritmo))
+    return hashes
+
+def calcular_hashes(caminho, tamanho_pedaco, total_pedacos, algoritmo=ALGORITMO_PADRAO,
+                    processos=None):
+    """
+    Calcula o hash de cada pedaço do arquivo em paralelo, usando todos os
+    núcleos disponíveis por padrão.
+    """
+    lotes = [(inicio, min(inicio + PEDACOS_POR_TAREFA, total_pedacos))
+             for inicio in range(0, total_pedacos, PEDACOS_POR_TAREFA)]
+    if not lotes:
+        return []
+
+    with ProcessPoolExecutor(max_workers=processos,
+                             mp_context=multiprocessing.get_context(INICIO_PROCESSOS)) as executor:
+        resultados = executor.map(_hashear_lote,
+                                  [caminho] * len(lotes),
+                                  [primeiro for primeiro, _ in lotes],
+                                  [ultimo for _, ultimo in lotes],
+                                  [tamanho_pedaco] * len(lotes),
+                                  [algoritmo] * len(lotes))
+        return [h for lote in resultados for h in lote]
+
+def caminho_metainfo(nome_arquivo):
+    """
+    Caminho padrão do metainfo de um arquivo.
+    """
+    return nome_arquivo + EXTENSAO_METAINFO
+
+def criar_metainfo(nome_arquivo, tamanho_pedaco=TAMANHO_PEDACO_PADRAO,
+                   algoritmo=ALGORITMO_PADRAO, destino=None, processos=None):
+    """
+    Gera o metainfo (estilo .torrent) do arquivo: tamanho, tamanho do pedaço
+    e o hash de cada pedaço. O resultado é salvo em JSON e retornado.
+    """
+    tamanho = os.path.getsize(nome_arquivo)
+    total_pedacos = (tamanho + tamanho_pedaco - 1) // tamanho_pedaco
+
+    print(f"Calculando hashes {algoritmo} de {total_pedacos} pedaços de '{nome_arquivo}'...")
+    hashes = calcular_hashes(nome_arquivo, tamanho_pedaco, total_pedacos, algoritmo, processos)
+
+    info = {
+        'nome': os.path.basename(nome_arquivo),
+        'tamanho': tamanho,
+        'tamanho_pedaco': tamanho_pedaco,
+        'algoritmo': algoritmo,
+        'hashes': [h.hex() for h in hashes],
+    }
+    # Identificador do conteúdo: hash da forma canônica das informações
+    info_hash = hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()
+    metainfo = dict(info, info_hash=info_hash)
+
+    destino = destino or caminho_metainfo(nome_arquivo)
+    with open(destino, 'w', encoding='utf-8') as f:
+        json.dump(metainfo, f)
+    print(f"Metainfo salvo em '{destino}' (info_hash {info_hash})")
+    return metainfo
+
+def carregar_metainfo(caminho):
+    """
+    Lê um metainfo gerado por criar_metainfo.
+    """
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def verificar_pedacos(caminho, metainfo, processos=None):
+    """
+    Re-hasheia em paralelo um arquivo existente (possivelmente parcial) e
+    retorna o conjunto de pedaços que conferem com o metainfo.
+    """
+    tamanho_pedaco = metainfo['tamanho_pedaco']
+    esperados = [bytes.fromhex(h) for h in metainfo['hashes']]
+    calculados = calcular_hashes(caminho, tamanho_pedaco, len(esperados),
+                                 metainfo['algoritmo'], processos)
+    return {indice for indice, (obtido, esperado) in enumerate(zip(calculados, esperados))
+            if obtido == esperado}
+
 if __name__ == "__main__":
-    NOME_ARQUIVO = "ubuntu-teste.iso"
-    TAMANHO_ARQUIVO_MB = 500
-    
-    criar_arquivo_teste(NOME_ARQUIVO, TAMANHO_ARQUIVO_MB)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Cria o arquivo de teste e seu metainfo")
+    parser.add_argument('--nome', default="ubuntu-teste.iso", help='arquivo a criar')
+    parser.add_argument('--mb', type=int, default=500, help='tamanho do arquivo (MB)')
+    parser.add_argument('--pedaco-kb', type=int, default=TAMANHO_PEDACO_PADRAO // 1024,
+                        help='tamanho de cada pedaço (KB)')
+    args = parser.parse_args()
+
+    criar_arquivo_teste(args.nome, args.mb)
+    criar_metainfo(args.nome, args.pedaco_kb * 1024)
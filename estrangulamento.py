@@ -0,0 +1,160 @@
+"""Taxas de transferência por par e estrangulamento (choking) no envio.
+
+Cada par mede, com médias móveis exponenciais, quanto baixa de cada fonte e
+quanto envia a cada par. As fontes de um pedaço são sorteadas com peso
+proporcional à taxa medida, e o envio só atende um conjunto limitado de pares
+(desestrangulados): os que mais retribuem, mais um otimista que muda
+periodicamente para dar chance a pares novos.
+"""
+import math
+import random
+import threading
+import time
+
+JANELA_TAXA = 10.0          # Constante de tempo da média móvel (segundos)
+PERIODO_AMOSTRA = 1.0       # Intervalo mínimo entre amostras da média (segundos)
+SLOTS_DESESTRANGULADOS = 3  # Pares atendidos por reciprocidade
+INTERVALO_REAVALIACAO = 10  # Intervalo entre reavaliações do conjunto atendido (segundos)
+ROTACOES_OTIMISTA = 3       # Reavaliações entre trocas do par otimista
+TEMPO_INTERESSE = 30        # Par sem requisições há esse tempo deixa de concorrer (segundos)
+
+
+class TaxaEWMA:
+    """Taxa de transferência (bytes/s) suavizada por média móvel exponencial"""
+
+    def __init__(self, janela=None):
+        self.janela = JANELA_TAXA if janela is None else janela
+        self._taxa = 0.0
+        self._acumulado = 0
+        self._inicio = time.monotonic()
+
+    def _atualizar(self, agora):
+        # Incorpora os bytes acumulados desde a última amostra (períodos ociosos contam como zero)
+        decorrido = agora - self._inicio
+        if decorrido < PERIODO_AMOSTRA:
+            return
+        peso = math.exp(-decorrido / self.janela)
+        self._taxa = self._taxa * peso + (self._acumulado / decorrido) * (1 - peso)
+        self._acumulado = 0
+        self._inicio = agora
+
+    def registrar(self, quantidade):
+        self._atualizar(time.monotonic())
+        self._acumulado += quantidade
+
+    def taxa(self):
+        self._atualizar(time.monotonic())
+        return self._taxa
+
+
+class MedidorTaxas:
+    """Uma TaxaEWMA por par, criada no primeiro registro"""
+
+    def __init__(self, janela=None):
+        self.janela = JANELA_TAXA if janela is None else janela
+        self._taxas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, id_par, quantidade):
+        with self._lock:
+            taxa = self._taxas.get(id_par)
+            if taxa is None:
+                taxa = self._taxas[id_par] = TaxaEWMA(self.janela)
+            taxa.registrar(quantidade)
+
+    def taxa(self, id_par):
+        with self._lock:
+            taxa = self._taxas.get(id_par)
+            return taxa.taxa() if taxa else 0.0
+
+    def taxas(self):
+        with self._lock:
+            return {id_par: taxa.taxa() for id_par, taxa in self._taxas.items()}
+
+
+def ordenar_por_taxa(ids_pares, medidor):
+    """Ordena pares por sorteio ponderado pela taxa medida (mais rápidos tendem a vir antes).
+
+    Pares sem medição recebem o peso médio dos medidos, para que também sejam
+    experimentados e tenham sua taxa conhecida.
+    """
+    taxas = {id_par: medidor.taxa(id_par) for id_par in ids_pares}
+    medidas = [t for t in taxas.values() if t > 0]
+    piso = sum(medidas) / len(medidas) if medidas else 1.0
+    # Amostragem ponderada sem reposição (Efraimidis-Spirakis): chave = u^(1/peso)
+    chaves = {id_par: random.random() ** (1.0 / max(taxa, piso)) for id_par, taxa in taxas.items()}
+    return sorted(ids_pares, key=chaves.__getitem__, reverse=True)
+
+
+class Estrangulador:
+    """Decide quais pares são atendidos pelo servidor de envio.
+
+    taxa_reciproca(id_par) dá o critério de reciprocidade: quanto baixamos do
+    par (ou, para quem já tem tudo, quanto ele consegue baixar de nós). Os
+    `slots` melhores entre os interessados são atendidos, mais um otimista
+    sorteado entre os demais a cada `rotacoes_otimista` reavaliações. Enquanto
+    houver vaga, pares novos são atendidos de imediato.
+    """
+
+    def __init__(self, taxa_reciproca, slots=None, intervalo=None, rotacoes_otimista=None):
+        # Padrões lidos aqui, e não na definição, para valerem sobrescritas das constantes
+        self.taxa_reciproca = taxa_reciproca
+        self.slots = SLOTS_DESESTRANGULADOS if slots is None else slots
+        self.intervalo = INTERVALO_REAVALIACAO if intervalo is None else intervalo
+        self.rotacoes_otimista = ROTACOES_OTIMISTA if rotacoes_otimista is None else rotacoes_otimista
+
+        self._interessados = {}       # {id_par: instante da última requisição}
+        self._desestrangulados = set()
+        self._otimista = None
+        self._rodada = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def permitir(self, id_par):
+        """Registra o interesse do par e diz se ele pode ser atendido agora"""
+        with self._lock:
+            self._interessados[id_par] = time.monotonic()
+            if id_par in self._desestrangulados:
+                return True
+            if len(self._desestrangulados) < self.slots + 1:
+                self._desestrangulados.add(id_par)
+                return True
+            return False
+
+    def desestrangulados(self):
+        with self._lock:
+            return set(self._desestrangulados)
+
+    def reavaliar(self):
+        """Recalcula o conjunto atendido: melhores por reciprocidade mais o otimista"""
+        agora = time.monotonic()
+        with self._lock:
+            self._interessados = {id_par: instante for id_par, instante in self._interessados.items()
+                                  if agora - instante <= TEMPO_INTERESSE}
+            candidatos = list(self._interessados)
+
+        random.shuffle(candidatos)  # Desempate aleatório entre taxas iguais
+        taxas = {id_par: self.taxa_reciproca(id_par) for id_par in candidatos}
+        candidatos.sort(key=taxas.__getitem__, reverse=True)
+        regulares = set(candidatos[:self.slots])
+        restantes = candidatos[self.slots:]
+
+        with self._lock:
+            self._rodada += 1
+            if (self._otimista not in restantes
+                    or self._rodada % self.rotacoes_otimista == 0):
+                self._otimista = random.choice(restantes) if restantes else None
+            self._desestrangulados = regulares | ({self._otimista} if self._otimista else set())
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.reavaliar()
+            except Exception as e:
+                print(f"Erro ao reavaliar estrangulamento: {e}")
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,297 @@
+"""Métricas (contadores, histogramas e medidores) no formato texto do Prometheus.
+
+Cada componente (Rastreador, Par) tem seu RegistroMetricas. Registrar um valor
+custa uma trava e algumas operações aritméticas; a formatação só acontece
+quando o endpoint é consultado. Um processo com vários torrents exporta os
+registros de todos juntos (ConjuntoRegistros), distinguidos por rótulos fixos.
+O mesmo endpoint HTTP oferece um perfilador por amostragem de pilhas (/perfil),
+que pode ser usado com o processo rodando.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CAMINHO_METRICAS = '/metrics'  # Formato texto do Prometheus
+CAMINHO_PERFIL = '/perfil'     # Perfil por amostragem: /perfil?segundos=5
+
+# Limites superiores dos baldes dos histogramas
+BALDES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BALDES_ESPERA_TRAVA = (1e-6, 1e-5, 1e-4, 1e-3, 0.01, 0.1, 1)
+BALDES_TAMANHO_FILA = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+INTERVALO_AMOSTRA_PERFIL = 0.01  # Intervalo entre amostras de pilhas (segundos)
+MAX_SEGUNDOS_PERFIL = 60         # Duração máxima de um perfil pedido pelo endpoint
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(nomes, valores, extras=()):
+    pares = [*zip(nomes, valores), *extras]
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + '}'
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Contador monotônico; com rótulos, um total para cada combinação de valores"""
+
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.fixos = ()     # Rótulos [(nome, valor)] do registro, comuns a todas as séries
+        self._valores = {}  # {valores dos rótulos: total}
+        self._lock = threading.Lock()
+
+    def incrementar(self, quantidade=1, *valores_rotulos):
+        with self._lock:
+            self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + quantidade
+
+    def valor(self, *valores_rotulos):
+        with self._lock:
+            return self._valores.get(valores_rotulos, 0)
+
+    def _linhas(self):
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for valores, total in itens:
+            yield f"{self.nome}{_rotulos(self.rotulos, valores, self.fixos)} {_numero(total)}"
+
+
+class Histograma:
+    """Distribuição de valores em baldes cumulativos, mais soma e contagem"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, baldes=BALDES_LATENCIA, rotulos=()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.baldes = tuple(sorted(baldes))
+        self.rotulos = tuple(rotulos)
+        self.fixos = ()
+        self._series = {}  # {valores dos rótulos: [contagem por balde (último = +Inf), soma]}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_rotulos):
+        balde = bisect.bisect_left(self.baldes, valor)
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * (len(self.baldes) + 1), 0.0]
+            serie[0][balde] += 1
+            serie[1] += valor
+
+    def contagem(self, *valores_rotulos):
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            return sum(serie[0]) if serie else 0
+
+    def _linhas(self):
+        with self._lock:
+            itens = sorted((valores, (list(contagens), soma))
+                           for valores, (contagens, soma) in self._series.items())
+        for valores, (contagens, soma) in itens:
+            acumulado = 0
+            for limite, quantidade in zip((*self.baldes, float('inf')), contagens):
+                acumulado += quantidade
+                rotulos = _rotulos(self.rotulos, valores, [*self.fixos, ('le', _numero(limite))])
+                yield f"{self.nome}_bucket{rotulos} {acumulado}"
+            rotulos = _rotulos(self.rotulos, valores, self.fixos)
+            yield f"{self.nome}_sum{rotulos} {_numero(soma)}"
+            yield f"{self.nome}_count{rotulos} {acumulado}"
+
+
+class Medidor:
+    """Valor instantâneo lido por uma função no momento da consulta (custo zero fora dela)"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nome, ajuda, funcao):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.funcao = funcao
+        self.fixos = ()
+
+    def _linhas(self):
+        yield f"{self.nome}{_rotulos((), (), self.fixos)} {_numero(self.funcao())}"
+
+
+class TravaMedida:
+    """Trava que registra em um histograma quanto tempo cada aquisição esperou"""
+
+    def __init__(self, trava, histograma, *valores_rotulos):
+        self._trava = trava
+        self._histograma = histograma
+        self._valores_rotulos = valores_rotulos
+
+    def acquire(self, blocking=True, timeout=-1):
+        inicio = time.perf_counter()
+        obtida = self._trava.acquire(blocking, timeout)
+        self._histograma.observar(time.perf_counter() - inicio, *self._valores_rotulos)
+        return obtida
+
+    def release(self):
+        self._trava.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class RegistroMetricas:
+    """Conjunto de métricas de um componente, exportado no formato do Prometheus"""
+
+    def __init__(self, rotulos_fixos=()):
+        self.rotulos_fixos = tuple(rotulos_fixos)  # [(nome, valor)] acrescentados a toda série
+        self._metricas = []
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica):
+        metrica.fixos = self.rotulos_fixos
+        with self._lock:
+            self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=()):
+        return self._registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome, ajuda, baldes=BALDES_LATENCIA, rotulos=()):
+        return self._registrar(Histograma(nome, ajuda, baldes, rotulos))
+
+    def medidor(self, nome, ajuda, funcao):
+        return self._registrar(Medidor(nome, ajuda, funcao))
+
+    def metricas(self):
+        with self._lock:
+            return list(self._metricas)
+
+    def exportar(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        return exportar_metricas(self.metricas())
+
+
+class ConjuntoRegistros:
+    """Vários registros (ex: o da sessão e um por torrent) exportados como um só"""
+
+    def __init__(self, *registros):
+        self._registros = list(registros)
+        self._lock = threading.Lock()
+
+    def adicionar(self, registro):
+        with self._lock:
+            self._registros.append(registro)
+
+    def remover(self, registro):
+        with self._lock:
+            if registro in self._registros:
+                self._registros.remove(registro)
+
+    def exportar(self):
+        with self._lock:
+            registros = list(self._registros)
+        return exportar_metricas([metrica for registro in registros
+                                  for metrica in registro.metricas()])
+
+
+def exportar_metricas(metricas):
+    """Texto no formato do Prometheus; métricas de mesmo nome formam uma única família"""
+    familias = {}  # {nome: [métricas]}, na ordem do primeiro registro
+    for metrica in metricas:
+        familias.setdefault(metrica.nome, []).append(metrica)
+    linhas = []
+    for nome, grupo in familias.items():
+        linhas.append(f"# HELP {nome} {grupo[0].ajuda}")
+        linhas.append(f"# TYPE {nome} {grupo[0].tipo}")
+        for metrica in grupo:
+            try:
+                linhas.extend(metrica._linhas())
+            except Exception as e:
+                linhas.append(f"# erro ao ler {nome}: {e}")
+    return '\n'.join(linhas) + '\n'
+
+
+def perfilar(segundos, intervalo=INTERVALO_AMOSTRA_PERFIL):
+    """Perfil de tempo de parede por amostragem das pilhas de todas as threads.
+
+    Retorna uma linha 'funcao (arquivo);funcao (arquivo);... amostras' por
+    pilha distinta, das mais frequentes às menos (formato "collapsed" aceito
+    por geradores de flame graph). Threads bloqueadas também aparecem.
+    """
+    propria = threading.get_ident()
+    contagens = Counter()
+    fim = time.monotonic() + segundos
+    while time.monotonic() < fim:
+        for ident, quadro in sys._current_frames().items():
+            if ident == propria:
+                continue
+            pilha = []
+            while quadro is not None:
+                codigo = quadro.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)})")
+                quadro = quadro.f_back
+            contagens[';'.join(reversed(pilha))] += 1
+        time.sleep(intervalo)
+    return ''.join(f"{pilha} {amostras}\n" for pilha, amostras in contagens.most_common())
+
+
+def responder_get(manipulador, registro):
+    """Atende GET /metrics e /perfil em um BaseHTTPRequestHandler (ex: o do rastreador).
+
+    `registro` é um RegistroMetricas ou um ConjuntoRegistros.
+    """
+    url = urlparse(manipulador.path)
+    if url.path == CAMINHO_METRICAS:
+        corpo, tipo = registro.exportar(), 'text/plain; version=0.0.4; charset=utf-8'
+    elif url.path == CAMINHO_PERFIL:
+        try:
+            segundos = float(parse_qs(url.query).get('segundos', ['5'])[0])
+        except ValueError:
+            manipulador.send_error(400, "segundos inválido")
+            return
+        corpo = perfilar(min(max(segundos, 0), MAX_SEGUNDOS_PERFIL))
+        tipo = 'text/plain; charset=utf-8'
+    else:
+        manipulador.send_error(404)
+        return
+
+    dados = corpo.encode()
+    manipulador.send_response(200)
+    manipulador.send_header('Content-Type', tipo)
+    manipulador.send_header('Content-Length', str(len(dados)))
+    manipulador.end_headers()
+    manipulador.wfile.write(dados)
+
+
+class _ManipuladorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        responder_get(self, self.server.registro)
+
+    def log_message(self, *_):
+        pass  # Sem log por requisição
+
+
+def servir_metricas(registro, host='localhost', porta=0):
+    """Sobe o endpoint HTTP em uma thread; a porta real fica em server_address[1]"""
+    servidor = ThreadingHTTPServer((host, porta), _ManipuladorMetricas)
+    servidor.daemon_threads = True
+    servidor.registro = registro
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
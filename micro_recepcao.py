@@ -0,0 +1,95 @@
+"""Microbenchmark do caminho de recepção: CPU gasta por GB recebido.
+
+Compara a recepção original (bytes concatenados com `dados += pacote` e
+arquivo reaberto a cada pedaço) com a atual (recv_into em buffers do pool e
+escrita posicional no descritor da sessão). Um par de sockets locais simula a
+conexão; apenas o tempo de CPU da thread receptora é medido.
+
+Uso: python micro_recepcao.py [--mb 256] [--pedaco-kb 1024]
+"""
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from armazenamento import CacheDescritores, PoolBuffers, escrever_trecho, receber_em
+
+BUFFER_SIZE = 64 * 1024  # Tamanho de cada recv no caminho original
+
+
+def _enviar(sock, total_pedacos, tamanho_pedaco):
+    dados = os.urandom(tamanho_pedaco)
+    for _ in range(total_pedacos):
+        sock.sendall(dados)
+    sock.shutdown(socket.SHUT_WR)
+
+
+def receber_original(sock, caminho, total_pedacos, tamanho_pedaco):
+    for indice in range(total_pedacos):
+        dados = b''
+        while len(dados) < tamanho_pedaco:
+            pacote = sock.recv(min(BUFFER_SIZE, tamanho_pedaco - len(dados)))
+            if not pacote:
+                break
+            dados += pacote
+        with open(caminho, 'r+b') as f:
+            f.seek(indice * tamanho_pedaco)
+            f.write(dados)
+
+
+def receber_atual(sock, caminho, total_pedacos, tamanho_pedaco):
+    buffers = PoolBuffers(tamanho_pedaco)
+    cache = CacheDescritores()
+    fd = cache.obter(caminho)
+    try:
+        for indice in range(total_pedacos):
+            buffer = buffers.obter()
+            visao = memoryview(buffer)[:tamanho_pedaco]
+            receber_em(sock, visao)
+            escrever_trecho(cache, fd, indice * tamanho_pedaco, visao)
+            buffers.devolver(buffer)
+    finally:
+        cache.fechar_todos()
+
+
+def medir(receptor, total_pedacos, tamanho_pedaco):
+    """Retorna (segundos de CPU da thread receptora, segundos de parede)"""
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        f.truncate(total_pedacos * tamanho_pedaco)
+        caminho = f.name
+    envio, recepcao = socket.socketpair()
+    try:
+        remetente = threading.Thread(target=_enviar, args=(envio, total_pedacos, tamanho_pedaco))
+        remetente.start()
+        cpu, parede = time.thread_time(), time.perf_counter()
+        receptor(recepcao, caminho, total_pedacos, tamanho_pedaco)
+        cpu, parede = time.thread_time() - cpu, time.perf_counter() - parede
+        remetente.join()
+    finally:
+        envio.close()
+        recepcao.close()
+        os.remove(caminho)
+    return cpu, parede
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mb', type=int, default=256, help='total de dados recebidos (MB)')
+    parser.add_argument('--pedaco-kb', type=int, default=1024, help='tamanho do pedaço (KB)')
+    args = parser.parse_args()
+
+    tamanho_pedaco = args.pedaco_kb * 1024
+    total_pedacos = args.mb * 1024 // args.pedaco_kb
+    gb = total_pedacos * tamanho_pedaco / 1024 ** 3
+
+    print(f"{args.mb} MB em pedaços de {args.pedaco_kb} KB\n")
+    print(f"{'recepção':<10} {'CPU s/GB':>10} {'MB/s':>10}")
+    for nome, receptor in (('original', receber_original), ('atual', receber_atual)):
+        cpu, parede = medir(receptor, total_pedacos, tamanho_pedaco)
+        print(f"{nome:<10} {cpu / gb:>10.3f} {args.mb / parede:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
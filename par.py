@@ -4,167 +4,839 @@ import threading
 import time
 import os
 import random
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import select
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from functools import partial
+
+from armazenamento import CacheDescritores, PoolBuffers, enviar_trecho, escrever_trecho
+from banda import EscalonadorJusto
+from bitfield import criar_bitfield, dados_binarios, pedacos_do_bitfield
+from blocos import TAMANHO_BLOCO, PedacoEmAndamento
+from controle import ControleAIMD
+from conexoes import ParEstrangulado, PedacoIndisponivel, PoolConexoes, SemVagasConexao
+from estrangulamento import INTERVALO_REAVALIACAO, Estrangulador, MedidorTaxas, ordenar_por_taxa
+from metricas import (BALDES_ESPERA_TRAVA, BALDES_LATENCIA, BALDES_TAMANHO_FILA,
+                      ConjuntoRegistros, RegistroMetricas, TravaMedida, servir_metricas)
+from seletor import SeletorPedacos
+from criar_arquivo import (caminho_metainfo, carregar_metainfo, criar_metainfo, hash_pedaco,
+                           verificar_pedacos)
+from protocolo import (MENSAGENS_ENXAME, MSG_BITFIELD, MSG_CANCELAR, MSG_ESTRANGULADO,
+                       MSG_HANDSHAKE, MSG_PARES, MSG_REJEITADO, MSG_REQUISICAO, MSG_TENHO,
+                       REQUISICAO, TENHO, ErroProtocolo, cabecalho_bloco, codificar_pares,
+                       decodificar_handshake, decodificar_pares, enviar_com_prazo, enviar_mensagem,
+                       montar_mensagem, receber_cabecalho, receber_exato)
+from rpc_json import conectar_rastreador
 
 # Configurações do sistema
-URL_RASTREADOR = "http://localhost:8000"  # URL do servidor tracker
+URL_RASTREADOR = "http://localhost:8000"  # URL do servidor tracker (use /json para o endpoint JSON)
 NOME_ARQUIVO = "ubuntu-teste.iso"         # Nome do arquivo compartilhado
-TAMANHO_ARQUIVO_MB = 500                  # Tamanho total do arquivo em MB
-TAMANHO_PEDACO = 1024 * 1024              # Tamanho de cada pedaço (1MB)
-TOTAL_PEDACOS = TAMANHO_ARQUIVO_MB        # Total de pedaços do arquivo
+ARQUIVO_METAINFO = caminho_metainfo(NOME_ARQUIVO)  # Metainfo com tamanhos e hashes dos pedaços
+TAMANHO_PEDACO = 1024 * 1024              # Tamanho de cada pedaço ao gerar o metainfo (1MB)
 
 # Configurações de otimização de download
-BASE_DOWNLOADS_SIMULTANEOS = 5            # Número base de downloads simultâneos
-INCREMENTO_POR_SEED = 5                   # Incremento por seed disponível
-INCREMENTO_POR_PEER = 2                   # Incremento por peer disponível
-MAX_CONEXOES_SERVIDOR = 50                # Máximo de conexões do servidor
-INTERVALO_ATUALIZACAO = 1                 # Intervalo de atualização do tracker (segundos)
+DOWNLOADS_INICIAIS = 4                    # Janela inicial de pedaços baixados ao mesmo tempo
+MAX_DOWNLOADS_SIMULTANEOS = 32            # Teto da janela (e threads do pool de downloads do processo)
+MAX_CONEXOES_SERVIDOR = 50                # Máximo de conexões persistentes atendidas pelo processo
+MAX_HANDSHAKES_PENDENTES = MAX_CONEXOES_SERVIDOR  # Conexões recebidas ainda sem handshake (uma thread cada)
+MAX_CONEXOES_SAIDA = 100                  # Máximo de conexões abertas pelo processo (uma thread leitora cada)
+INTERVALO_ATUALIZACAO = 1                 # Intervalo do laço de download e da manutenção (segundos)
+INTERVALO_RASTREADOR = 30                 # Intervalo entre anúncios ao tracker: bootstrap e sinal de vida (segundos)
+INTERVALO_RASTREADOR_ISOLADO = 1          # Primeiro intervalo quando não conhecemos nenhum par (dobra até o normal)
+INTERVALO_PEX = 30                        # Intervalo entre envios da lista de pares conhecidos (segundos)
+MAX_VIZINHOS = 20                         # Pares aos quais um leecher se conecta para trocar bitfields e TENHOs
+MAX_PARES_PEX = 50                        # Pares enviados em cada mensagem de PEX
 TIMEOUT_CONEXAO = 10                      # Timeout das conexões (segundos)
-BUFFER_SIZE = 64 * 1024                   # Tamanho do buffer de transferência
+TIMEOUT_OCIOSO = 12 * TIMEOUT_CONEXAO     # Conexão recebida sem mensagens por esse tempo é fechada (o PEX chega a cada 30s)
+TIMEOUT_DIFUSAO = 2                       # Vizinho que não lê uma mensagem difundida nesse tempo é desconectado
+MAX_BUFFERS_LIVRES = 32                   # Buffers de pedaço mantidos para reutilização
+BLOCOS_POR_FONTE = 4                      # Janela inicial de blocos pendentes por fonte em cada pedaço
+MAX_BLOCOS_POR_FONTE = 16                 # Teto da janela de blocos por fonte
+TIMEOUT_BLOCO = 3                         # Bloco sem resposta após esse tempo é pedido a outra fonte (segundos)
+INTERVALO_VERIFICACAO_BLOCOS = 0.2        # Espera máxima entre verificações de um pedaço (segundos)
+MAX_FONTES_POR_PEDACO = 4                 # Fontes usadas ao mesmo tempo para um pedaço
+SLOTS_DESESTRANGULADOS = 3                # Pares atendidos por reciprocidade (mais um otimista)
+VERBOSO = False                           # Imprime cada bloco enviado, pedaço salvo e lote de downloads
+
+# Limites do processo, somando todos os torrents e repartidos entre eles
+TAXA_UPLOAD = None                        # Bytes/s enviados (None = ilimitado)
+TAXA_DOWNLOAD = None                      # Bytes/s recebidos (None = ilimitado)
+
+def remover_requisicao(fila, requisicao):
+    """Remove da fila do servidor [(requisicao, chegada)] uma requisição cancelada"""
+    for item in fila:
+        if item[0] == requisicao:
+            fila.remove(item)
+            return
+    # Já atendida
+
+class Sessao:
+    """Recursos de um processo compartilhados por todos os torrents que ele serve.
+
+    Um único socket de escuta recebe as conexões de todos os torrents, e o
+    handshake diz a qual info_hash cada uma pertence. O pool de downloads, a
+    manutenção (tracker, PEX e vizinhos), a difusão de mensagens e os limites
+    de banda e de conexões são comuns; o EscalonadorJusto os reparte entre os
+    torrents. Um Par criado sem sessão cria uma só sua.
+    """
+
+    def __init__(self, host, porta=0, url_rastreador=None, taxa_upload=None, taxa_download=None,
+                 porta_metricas=None, verboso=None):
+        self.host = host
+        self.url_rastreador = url_rastreador or URL_RASTREADOR
+        self.verboso = VERBOSO if verboso is None else verboso
+        # O socket do servidor é aberto já aqui: com porta 0 o sistema escolhe uma
+        # porta livre, e o id do par precisa da porta real
+        self._socket_servidor = self._abrir_socket_servidor(host, porta)
+        self.porta = self._socket_servidor.getsockname()[1]
+        self.id_par = f"{host}:{self.porta}"
+        self._parado = threading.Event()
+
+        self.torrents = {}  # Torrents em execução {info_hash: Par}
+        self._lock = threading.Lock()
+        self._iniciada = False
+        # Antes do handshake a conexão ainda não é de nenhum torrent: o limite é da sessão
+        self._handshakes = threading.BoundedSemaphore(MAX_HANDSHAKES_PENDENTES)
+        self.escalonador = EscalonadorJusto(
+            taxa_upload or TAXA_UPLOAD, taxa_download or TAXA_DOWNLOAD,
+            {'conexoes': MAX_CONEXOES_SERVIDOR, 'saidas': MAX_CONEXOES_SAIDA,
+             'downloads': MAX_DOWNLOADS_SIMULTANEOS})
+        self.executor_downloads = self._criar_executor_downloads()
+        self._fila_difusao = queue.Queue()  # (par, tipo, carga) a difundir aos vizinhos do torrent
+
+        # Endpoint HTTP opcional com as métricas (/metrics) de todos os torrents e o perfil (/perfil)
+        self.metricas = ConjuntoRegistros()
+        self.servidor_metricas = None
+        if porta_metricas is not None:
+            self.servidor_metricas = servir_metricas(self.metricas, host, porta_metricas)
+            print(f"Métricas de {self.id_par} em http://{host}:"
+                  f"{self.servidor_metricas.server_address[1]}/metrics")
+
+    def _criar_executor_downloads(self):
+        # Pool de downloads do processo, do tamanho do teto da janela
+        return ThreadPoolExecutor(max_workers=MAX_DOWNLOADS_SIMULTANEOS)
+
+    @staticmethod
+    def _abrir_socket_servidor(host, porta):
+        socket_servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        socket_servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        socket_servidor.bind((host, porta))
+        socket_servidor.listen(MAX_CONEXOES_SERVIDOR)
+        return socket_servidor
+
+    def adicionar(self, par):
+        """Passa a atender o torrent do par; inicia as threads da sessão no primeiro"""
+        with self._lock:
+            if par.info_hash in self.torrents:
+                raise ValueError(f"Torrent {par.info_hash} já está na sessão {self.id_par}")
+            self.torrents[par.info_hash] = par
+            iniciar, self._iniciada = not self._iniciada, True
+        self.metricas.adicionar(par.metricas)
+        if iniciar:
+            self._iniciar_execucao()
+
+    def remover(self, par):
+        with self._lock:
+            if self.torrents.get(par.info_hash) is par:
+                del self.torrents[par.info_hash]
+        self.metricas.remover(par.metricas)
+        self.escalonador.upload.esquecer(par.info_hash)
+        self.escalonador.download.esquecer(par.info_hash)
+
+    def listar(self):
+        with self._lock:
+            return list(self.torrents.values())
+
+    def cota_downloads(self, par):
+        """Pedaços que o torrent pode baixar ao mesmo tempo: o pool repartido entre as janelas AIMD"""
+        demandas = {p.info_hash: p.controle_downloads.limite() for p in self.listar()
+                    if len(p.meus_pedacos) < p.total_pedacos}
+        return max(1, int(self.escalonador.cota('downloads', par.info_hash, demandas)))
+
+    def _iniciar_execucao(self):
+        """Inicia as threads do servidor, da manutenção e da difusão"""
+        threading.Thread(target=self.executar_servidor, daemon=True).start()
+        threading.Thread(target=self._executar_manutencao, daemon=True).start()
+        threading.Thread(target=self._executar_difusao, daemon=True).start()
+
+    def executar_servidor(self):
+        """Servidor para atender requisições de outros peers, de todos os torrents"""
+        print(f"Servidor {self.id_par} escutando em {self.host}:{self.porta}")
+        while not self._parado.is_set():
+            try:
+                socket_cliente, _ = self._socket_servidor.accept()
+                if not self._handshakes.acquire(blocking=False):
+                    socket_cliente.close()
+                    continue
+                threading.Thread(target=self._atender_conexao, args=(socket_cliente,),
+                                 daemon=True).start()
+            except Exception as e:
+                if self._parado.is_set():
+                    break
+                print(f"Erro ao aceitar conexão: {e}")
+
+    def _atender_conexao(self, socket_cliente):
+        """Lê o handshake e entrega a conexão ao torrent, se houver vaga para ele"""
+        info_hash = None
+        admitida = False
+        try:
+            try:
+                socket_cliente.settimeout(TIMEOUT_CONEXAO)
+                cabecalho = receber_cabecalho(socket_cliente)
+                if cabecalho is None:
+                    return
+                tipo, tamanho = cabecalho
+                if tipo != MSG_HANDSHAKE:
+                    raise ErroProtocolo(f"Esperado handshake, recebida mensagem do tipo {tipo}")
+                info_hash, id_remoto = decodificar_handshake(receber_exato(socket_cliente, tamanho))
+            finally:
+                self._handshakes.release()
+            par = self.torrents.get(info_hash)
+            if par is None:
+                raise ErroProtocolo(f"Torrent {info_hash} não é servido por {self.id_par}")
+
+            admitida, cedente = self.escalonador.admitir('conexoes', info_hash)
+            if not admitida:
+                return
+            if cedente is not None:
+                self._ceder_conexao(cedente)
+            par.lidar_com_conexao(socket_cliente, id_remoto)
+        except Exception as e:
+            print(f"Erro na conexão recebida por {self.id_par}: {e}")
+        finally:
+            if admitida:
+                self.escalonador.liberar('conexoes', info_hash)
+            try:
+                socket_cliente.close()
+            except OSError:
+                pass
+
+    def _ceder_conexao(self, info_hash):
+        # Torrent acima da sua parcela de conexões fecha uma para outro torrent
+        par = self.torrents.get(info_hash)
+        if par is not None:
+            par._ceder_conexao()
+
+    def reservar_saida(self, info_hash):
+        """Ocupa uma vaga de conexão aberta pelo processo; False se o torrent não tem direito a ela"""
+        admitida, cedente = self.escalonador.admitir('saidas', info_hash)
+        if cedente is not None:
+            par = self.torrents.get(cedente)
+            if par is not None:
+                par._ceder_saida()
+        return admitida
+
+    def liberar_saida(self, info_hash):
+        self.escalonador.liberar('saidas', info_hash)
+
+    def _executar_manutencao(self):
+        """Anúncios ao tracker, PEX e conexões com vizinhos de todos os torrents"""
+        while not self._parado.is_set():
+            for par in self.listar():
+                par._manter()
+            self._parado.wait(INTERVALO_ATUALIZACAO)
+
+    def _executar_difusao(self):
+        """Entrega as mensagens difundidas pelos torrents às suas conexões"""
+        while True:
+            item = self._fila_difusao.get()
+            if item is None:  # Sessão encerrada
+                return
+            par, tipo, carga = item
+            par._entregar_difusao(tipo, carga)
+
+    def parar(self):
+        """Encerra o servidor, o pool de downloads e o endpoint de métricas (após os torrents)"""
+        if self._parado.is_set():
+            return
+        self._parado.set()
+        self._fila_difusao.put(None)
+        # shutdown acorda a thread bloqueada em accept; close sozinho não
+        try:
+            self._socket_servidor.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket_servidor.close()
+        self.executor_downloads.shutdown(wait=True, cancel_futures=True)
+        if self.servidor_metricas is not None:
+            self.servidor_metricas.shutdown()
+            self.servidor_metricas.server_close()
 
 class Par:
-    def __init__(self, host_servidor, porta_servidor, eh_semeador=False):
-        self.host_servidor = host_servidor
-        self.porta_servidor = porta_servidor
-        self.id_par = f"{host_servidor}:{porta_servidor}"
-        self.rastreador = xmlrpc.client.ServerProxy(URL_RASTREADOR)  # Cliente do tracker
+    """Um torrent semeado ou baixado pelo processo.
+
+    Vários Par podem dividir uma Sessao (mesma porta, pool de downloads e
+    limites de banda); sem sessão, o par cria uma só sua com host, porta,
+    url_rastreador, porta_metricas e verboso.
+    """
+
+    classe_sessao = Sessao  # Sessão criada quando nenhuma é passada
+
+    def __init__(self, host_servidor, porta_servidor, eh_semeador=False,
+                 url_rastreador=None, nome_arquivo=None, modelador=None, porta_metricas=None,
+                 verboso=None, sessao=None):
+        self._sessao_propria = sessao is None
+        if sessao is None:
+            sessao = self.classe_sessao(host_servidor, porta_servidor, url_rastreador,
+                                        porta_metricas=porta_metricas, verboso=verboso)
+        self.sessao = sessao
+
+        # Configurações por instância; sem elas valem as da sessão e as constantes do módulo
+        self.verboso = sessao.verboso if verboso is None else verboso
+        self.nome_arquivo = nome_arquivo or NOME_ARQUIVO
+        self.arquivo_metainfo = caminho_metainfo(self.nome_arquivo)
+        # Gancho opcional de emulação de rede: modelador(origem, destino, tamanho, chegada)
+        # devolve quantos segundos esperar antes de enviar um bloco (ver benchmark_enxame.py)
+        self.modelador = modelador
+
+        # Todos os torrents da sessão escutam na mesma porta e têm o mesmo id
+        self.host_servidor = sessao.host
+        self.porta_servidor = sessao.porta
+        self.id_par = sessao.id_par
+        self.rastreador = conectar_rastreador(url_rastreador or sessao.url_rastreador)  # Cliente do tracker
+        self._parado = threading.Event()  # Sinaliza às threads que o par foi encerrado
 
         self.eh_semeador_inicial = eh_semeador
+        # Semeador inicial serve o arquivo original; leechers, sua própria cópia (no mesmo diretório)
+        diretorio, nome = os.path.split(self.nome_arquivo)
+        self.caminho_arquivo = (self.nome_arquivo if eh_semeador else
+                                os.path.join(diretorio, self.id_par.replace(":", "_") + "_" + nome))
+        self.descritores = CacheDescritores()  # Descritores abertos durante a sessão
+
+        # Metainfo: tamanho do arquivo, dos pedaços e hash esperado de cada pedaço
+        self.metainfo = self._carregar_metainfo()
+        self.tamanho_arquivo = self.metainfo['tamanho']
+        self.tamanho_pedaco = self.metainfo['tamanho_pedaco']
+        self.hashes = [bytes.fromhex(h) for h in self.metainfo['hashes']]
+        self.total_pedacos = len(self.hashes)
+        self.info_hash = self.metainfo['info_hash']  # Identifica o torrent no tracker e no handshake
+
+        self._criar_metricas()
+
         self.meus_pedacos = set()          # Conjunto de pedaços possuídos
         self.pedacos_sendo_baixados = set()  # Pedaços em download
-        self.lock_pedacos = threading.Lock()  # Lock para operações nos conjuntos
+        # Lock para operações nos conjuntos; a espera por ele vai para as métricas
+        self.lock_pedacos = TravaMedida(threading.Lock(), self._espera_trava, 'lock_pedacos')
+
+        # Estado do anúncio incremental ao tracker
+        self.info_pares = {}                 # Cópia local {id_par: set(pedacos)} do enxame
+        self._versao_rastreador = 0          # Última versão do enxame recebida do tracker
+        self._registrado_no_rastreador = False
+        self._pedacos_nao_anunciados = []    # Pedaços obtidos desde o último anúncio
+        self._lock_rastreador = threading.RLock()  # Um anúncio ao tracker por vez
+
+        # Troca de informações do enxame diretamente entre pares (bitfield, TENHO e PEX)
+        self._lock_enxame = threading.Lock()  # Protege info_pares e os conjuntos abaixo
+        self._pares_conhecidos = set()       # Pares aprendidos pelo tracker, PEX ou conexões recebidas
+        self._vizinhos_diretos = set()       # Pares cujo bitfield recebemos por conexão direta
+        self._conectando = set()             # Vizinhos com conexão em abertura
+        self._entradas = {}                  # Conexões recebidas {socket: (id_remoto, lock_envio, avisos)}
+        self._ultimo_anuncio = self._ultimo_pex = float('-inf')  # Manutenção feita pela sessão
+        self._intervalo_isolado = None       # Espera entre anúncios enquanto não conhecemos pares
 
         # Gerenciamento de downloads
-        self.max_downloads_atual = BASE_DOWNLOADS_SIMULTANEOS
         self.downloads_ativos = {}         # Downloads em andamento
-        # Thread pool para executar downloads em paralelo
-        self.executor_downloads = ThreadPoolExecutor(max_workers=100)
+        self._evento_download = threading.Event()  # Acorda o loop quando um download termina
+        # Janelas AIMD: pedaços simultâneos e blocos pendentes por fonte
+        self.controle_downloads = ControleAIMD(DOWNLOADS_INICIAIS, maximo=MAX_DOWNLOADS_SIMULTANEOS)
+        self._controles_fonte = {}         # {id_par: ControleAIMD}
+        self._lock_controles = threading.Lock()
+        # Pool de threads de download da sessão, dividido entre os torrents
+        self.executor_downloads = sessao.executor_downloads
+        self._thread_download = None
+        # Buffers de recepção reutilizáveis
+        self.buffers = PoolBuffers(self.tamanho_pedaco, MAX_BUFFERS_LIVRES)
+        # Conexões persistentes com os outros pares do torrent, dentro das vagas da sessão
+        self.conexoes = PoolConexoes(self.id_par, self.info_hash, TIMEOUT_CONEXAO,
+                                     self._mensagens_iniciais, self._processar_mensagem_enxame,
+                                     self._vizinho_desconectado,
+                                     partial(sessao.reservar_saida, self.info_hash),
+                                     partial(sessao.liberar_saida, self.info_hash))
+
+        # Taxas medidas por par e estrangulamento (choking) do envio
+        self.taxas_download = MedidorTaxas()  # Quanto baixamos de cada fonte
+        self.taxas_upload = MedidorTaxas()    # Quanto enviamos a cada par
+        self._fontes_suspensas = {}           # {id_par: instante em que nos recusou ou travou}
+        self.estrangulador = Estrangulador(self._taxa_reciproca, SLOTS_DESESTRANGULADOS)
 
         # Inicialização do peer
         if self.eh_semeador_inicial:
             # Semeador começa com todos os pedaços
-            self.meus_pedacos = set(range(TOTAL_PEDACOS))
-            print(f"Par {self.id_par} iniciado como SEMEADOR com {TOTAL_PEDACOS} pedaços.")
+            self.meus_pedacos = set(range(self.total_pedacos))
+            print(f"Par {self.id_par} iniciado como SEMEADOR com {self.total_pedacos} pedaços.")
+        elif os.path.exists(self.caminho_arquivo):
+            # Retomada: re-hasheia o arquivo parcial e mantém só os pedaços íntegros
+            if os.path.getsize(self.caminho_arquivo) != self.tamanho_arquivo:
+                os.truncate(self.caminho_arquivo, self.tamanho_arquivo)
+            self.meus_pedacos = verificar_pedacos(self.caminho_arquivo, self.metainfo)
+            print(f"Par {self.id_par} retomado com {len(self.meus_pedacos)}/{self.total_pedacos} pedaços verificados.")
         else:
             # Leecher cria arquivo vazio do tamanho correto
-            caminho_arquivo_destino = self.id_par.replace(":", "_") + "_" + NOME_ARQUIVO
-            if not os.path.exists(caminho_arquivo_destino):
-                with open(caminho_arquivo_destino, 'wb') as f:
-                    f.truncate(TAMANHO_ARQUIVO_MB * 1024 * 1024)
+            with open(self.caminho_arquivo, 'wb') as f:
+                f.truncate(self.tamanho_arquivo)
 
-        # Inicia threads do servidor e cliente
-        threading.Thread(target=self.executar_servidor, daemon=True).start()
-        threading.Thread(target=self.iniciar_download, daemon=True).start()
+        # Disponibilidade dos pedaços no enxame, atualizada a cada alteração do tracker
+        self.seletor = SeletorPedacos(self.total_pedacos,
+                                      set(range(self.total_pedacos)) - self.meus_pedacos)
 
-    def calcular_downloads_otimos(self, info_todos_pares):
-        """Calcula número ideal de downloads com base na disponibilidade de peers"""
-        if not info_todos_pares:
-            return BASE_DOWNLOADS_SIMULTANEOS
+        self._iniciar_execucao()
 
-        total_seeds = sum(1 for id_par, pedacos in info_todos_pares.items() 
-                         if id_par != self.id_par and len(pedacos) == TOTAL_PEDACOS)
-        total_peers = sum(1 for id_par, pedacos in info_todos_pares.items() 
-                         if id_par != self.id_par and 0 < len(pedacos) < TOTAL_PEDACOS)
-        
-        downloads_otimos = min(100, BASE_DOWNLOADS_SIMULTANEOS + 
-                              (total_seeds * INCREMENTO_POR_SEED) + 
-                              (total_peers * INCREMENTO_POR_PEER))
-        
-        print(f"Seeds: {total_seeds}, Peers: {total_peers}, Downloads: {downloads_otimos}")
-        return downloads_otimos
+    def _criar_metricas(self):
+        """Contadores e histogramas do par; medidores são lidos só na consulta ao endpoint"""
+        # O rótulo do torrent distingue as séries quando a sessão exporta vários
+        self.metricas = metricas = RegistroMetricas([('torrent', self.info_hash[:8])])
+        self._bytes_enviados = metricas.contador(
+            'par_bytes_enviados_total', 'Bytes de blocos enviados, por par de destino', ('par',))
+        self._bytes_recebidos = metricas.contador(
+            'par_bytes_recebidos_total', 'Bytes de blocos recebidos, por fonte', ('par',))
+        self._recusas_enviadas = metricas.contador(
+            'par_recusas_enviadas_total', 'Requisições recusadas pelo servidor', ('motivo',))
+        self._pedacos_baixados = metricas.contador(
+            'par_pedacos_baixados_total', 'Downloads de pedaços por resultado', ('resultado',))
+        self._latencia_bloco = metricas.histograma(
+            'par_latencia_bloco_segundos', 'Tempo entre a requisição de um bloco e sua chegada')
+        self._duracao_pedaco = metricas.histograma(
+            'par_duracao_pedaco_segundos', 'Tempo para baixar, verificar e gravar um pedaço',
+            BALDES_LATENCIA + (30, 60))
+        self._fila_envio = metricas.histograma(
+            'par_fila_requisicoes', 'Requisições na fila da conexão quando uma delas é atendida',
+            BALDES_TAMANHO_FILA)
+        self._espera_trava = metricas.histograma(
+            'par_espera_trava_segundos', 'Espera para adquirir as travas do par',
+            BALDES_ESPERA_TRAVA, ('trava',))
+        metricas.medidor('par_pedacos_possuidos', 'Pedaços verificados no disco',
+                         lambda: len(self.meus_pedacos))
+        metricas.medidor('par_downloads_ativos', 'Pedaços em download',
+                         lambda: len(self.pedacos_sendo_baixados))
+        metricas.medidor('par_janela_downloads', 'Janela AIMD de pedaços simultâneos',
+                         lambda: self.controle_downloads.limite())
+        metricas.medidor('par_conexoes_recebidas', 'Conexões de outros pares sendo atendidas',
+                         lambda: self.sessao.escalonador.ocupadas('conexoes', self.info_hash))
+        metricas.medidor('par_conexoes_abertas', 'Conexões abertas por nós com outros pares',
+                         lambda: self.sessao.escalonador.ocupadas('saidas', self.info_hash))
+        metricas.medidor('par_pares_conhecidos', 'Pares conhecidos pelo tracker, PEX ou conexões',
+                         lambda: len(self._pares_conhecidos))
 
-    def executar_servidor(self):
-        """Servidor para atender requisições de outros peers"""
-        socket_servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        socket_servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        socket_servidor.bind((self.host_servidor, self.porta_servidor))
-        socket_servidor.listen(MAX_CONEXOES_SERVIDOR)
-        print(f"Servidor {self.id_par} escutando em {self.host_servidor}:{self.porta_servidor}")
-        
-        executor_servidor = ThreadPoolExecutor(max_workers=MAX_CONEXOES_SERVIDOR)
-        
-        while True:
-            try:
-                socket_cliente, _ = socket_servidor.accept()
-                executor_servidor.submit(self.lidar_com_requisicao, socket_cliente)
-            except Exception as e:
-                print(f"Erro ao aceitar conexão: {e}")
+    def _iniciar_execucao(self):
+        """Entra na sessão e inicia as threads do cliente e do estrangulamento"""
+        self.sessao.adicionar(self)
+        self.estrangulador.iniciar()
+        self._thread_download = threading.Thread(target=self.iniciar_download, daemon=True)
+        self._thread_download.start()
+
+    def _carregar_metainfo(self):
+        """Carrega o metainfo; o semeador inicial o gera a partir do arquivo se não existir"""
+        if not os.path.exists(self.arquivo_metainfo):
+            if not self.eh_semeador_inicial:
+                raise FileNotFoundError(f"Metainfo '{self.arquivo_metainfo}' não encontrado. "
+                                        "Execute criar_arquivo.py para gerá-lo.")
+            return criar_metainfo(self.nome_arquivo, TAMANHO_PEDACO, destino=self.arquivo_metainfo)
+        return carregar_metainfo(self.arquivo_metainfo)
 
-    def lidar_com_requisicao(self, socket_cliente):
-        """Processa requisição de envio de pedaço"""
+    def _tamanho_do_pedaco(self, indice_pedaco):
+        """Tamanho de um pedaço (o último pode ser menor que os demais)"""
+        return min(self.tamanho_pedaco, self.tamanho_arquivo - indice_pedaco * self.tamanho_pedaco)
+
+    def _taxa_reciproca(self, id_par):
+        """Critério do estrangulamento: quanto o par nos envia, ou quanto recebe se já temos tudo"""
+        if len(self.meus_pedacos) == self.total_pedacos:
+            return self.taxas_upload.taxa(id_par)
+        return self.taxas_download.taxa(id_par)
+
+    def _fonte_suspensa(self, id_par):
+        """Se o par recusou (estrangulou) ou deixou travar blocos recentemente"""
+        instante = self._fontes_suspensas.get(id_par)
+        return instante is not None and time.monotonic() - instante < INTERVALO_REAVALIACAO
+
+    def _controle_fonte(self, id_par):
+        """Janela AIMD de blocos pendentes da fonte, criada no primeiro uso"""
+        with self._lock_controles:
+            controle = self._controles_fonte.get(id_par)
+            if controle is None:
+                controle = self._controles_fonte[id_par] = ControleAIMD(
+                    BLOCOS_POR_FONTE, maximo=MAX_BLOCOS_POR_FONTE)
+            return controle
+
+    def lidar_com_conexao(self, socket_cliente, id_remoto):
+        """Atende as requisições de uma conexão persistente até o par encerrá-la.
+
+        Chamada pela sessão, na thread da conexão, depois do handshake.
+        """
+        fila = deque()  # Requisições recebidas e ainda não atendidas
+        lock_envio = threading.Lock()  # Blocos e mensagens difundidas não se intercalam
+        avisos = deque()  # Mensagens difundidas à espera de quem tiver lock_envio
         try:
-            socket_cliente.settimeout(TIMEOUT_CONEXAO)
-            requisicao = socket_cliente.recv(1024).decode()
-            if requisicao.startswith("GET"):
-                indice_pedaco = int(requisicao.split(" ")[1])
-                
-                with self.lock_pedacos:
-                    if indice_pedaco in self.meus_pedacos:
-                        # Define arquivo fonte dependendo se é seed ou leecher
-                        arquivo_origem = NOME_ARQUIVO if self.eh_semeador_inicial else self.id_par.replace(":", "_") + "_" + NOME_ARQUIVO
-                        
-                        with open(arquivo_origem, 'rb') as f:
-                            f.seek(indice_pedaco * TAMANHO_PEDACO)
-                            dados = f.read(TAMANHO_PEDACO)
-                            
-                            # Envia dados em chunks
-                            bytes_enviados = 0
-                            while bytes_enviados < len(dados):
-                                chunk = dados[bytes_enviados:bytes_enviados + BUFFER_SIZE]
-                                socket_cliente.sendall(chunk)
-                                bytes_enviados += len(chunk)
-
-                        print(f"Enviado pedaço {indice_pedaco}")
+            socket_cliente.settimeout(TIMEOUT_OCIOSO)
+            socket_cliente.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._vizinho_conectado(id_remoto)
+            with lock_envio:
+                for tipo_inicial, carga_inicial in self._mensagens_iniciais():
+                    enviar_mensagem(socket_cliente, tipo_inicial, carga_inicial)
+            self._entradas[socket_cliente] = (id_remoto, lock_envio, avisos)
+            while True:
+                # Lê todas as mensagens já disponíveis antes de atender a próxima
+                # requisição, para que cancelamentos alcancem as que estão na fila
+                while not fila or select.select([socket_cliente], [], [], 0)[0]:
+                    cabecalho = receber_cabecalho(socket_cliente)
+                    if cabecalho is None:
+                        return
+                    tipo, tamanho = cabecalho
+                    carga = receber_exato(socket_cliente, tamanho)
+
+                    if tipo in MENSAGENS_ENXAME:
+                        self._processar_mensagem_enxame(id_remoto, tipo, carga)
+                    elif tipo == MSG_REQUISICAO:
+                        fila.append((REQUISICAO.unpack(carga), time.monotonic()))
+                    elif tipo == MSG_CANCELAR:
+                        remover_requisicao(fila, REQUISICAO.unpack(carga))
                     else:
-                        socket_cliente.sendall(b"ERRO: Pedaco nao encontrado")
+                        raise ErroProtocolo(f"Mensagem inesperada do tipo {tipo}")
+
+                socket_cliente.settimeout(TIMEOUT_CONEXAO)
+                self._fila_envio.observar(len(fila))
+                requisicao, chegada = fila.popleft()
+                self.lidar_com_requisicao(socket_cliente, lock_envio, id_remoto, *requisicao, chegada)
+                self._enviar_avisos(socket_cliente, lock_envio, avisos)
+                socket_cliente.settimeout(TIMEOUT_OCIOSO)
         except Exception as e:
-            print(f"Erro na requisição: {e}")
+            print(f"Erro na conexão com {id_remoto}: {e}")
         finally:
+            self._entradas.pop(socket_cliente, None)
             try:
                 socket_cliente.close()
             except:
                 pass
+            self._vizinho_desconectado(id_remoto)
+
+    def _ceder_saida(self):
+        """Fecha uma conexão aberta por este torrent, para outro torrent da sessão"""
+        self.conexoes.ceder()
+
+    @staticmethod
+    def _enviar_avisos(socket_cliente, lock_envio, avisos):
+        """Envia as mensagens difundidas pendentes, se nenhum envio estiver em curso.
+
+        Quem está com lock_envio chama de novo ao terminar, então nenhuma fica para trás.
+        """
+        while avisos and lock_envio.acquire(blocking=False):
+            try:
+                while avisos:
+                    enviar_com_prazo(socket_cliente, avisos.popleft(), TIMEOUT_DIFUSAO)
+            finally:
+                lock_envio.release()
+
+    def _ceder_conexao(self):
+        """Fecha uma conexão recebida, de preferência de um par estrangulado, para outro torrent"""
+        desestrangulados = self.estrangulador.desestrangulados()
+        entradas = sorted(list(self._entradas.items()),
+                          key=lambda item: item[1][0] in desestrangulados)
+        if entradas:
+            try:
+                entradas[0][0].shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def lidar_com_requisicao(self, socket_cliente, lock_envio, id_remoto, indice_pedaco, inicio,
+                             tamanho, chegada=None):
+        """Processa requisição de envio de um trecho de pedaço.
+
+        lock_envio é tomado só durante cada envio: a espera pela banda fica fora
+        dele, para não atrasar as mensagens difundidas pela mesma conexão.
+        """
+        # Pares fora do conjunto atendido recebem a recusa e procuram outras fontes
+        if not self.estrangulador.permitir(id_remoto):
+            self._recusas_enviadas.incrementar(1, 'estrangulado')
+            with lock_envio:
+                enviar_mensagem(socket_cliente, MSG_ESTRANGULADO,
+                                REQUISICAO.pack(indice_pedaco, inicio, tamanho))
+            return
+
+        # A trava protege apenas a consulta; leitura e envio ocorrem sem ela
+        with self.lock_pedacos:
+            disponivel = indice_pedaco in self.meus_pedacos
+
+        if not disponivel or inicio + tamanho > self._tamanho_do_pedaco(indice_pedaco):
+            self._recusas_enviadas.incrementar(1, 'indisponivel')
+            with lock_envio:
+                enviar_mensagem(socket_cliente, MSG_REJEITADO,
+                                REQUISICAO.pack(indice_pedaco, inicio, tamanho))
+            return
+
+        # Espera a vez na banda de envio da sessão e, se houver, no enlace emulado
+        atraso = self.sessao.escalonador.upload.reservar(self.info_hash, tamanho)
+        if self.modelador is not None:
+            atraso = max(atraso, self.modelador(self.id_par, id_remoto, tamanho, chegada))
+        if atraso > 0:
+            time.sleep(atraso)
+
+        # Envia cabeçalho e depois os dados direto do arquivo (sendfile)
+        fd = self.descritores.obter(self.caminho_arquivo)
+        with lock_envio:
+            socket_cliente.sendall(cabecalho_bloco(indice_pedaco, inicio, tamanho))
+            enviar_trecho(socket_cliente, self.descritores, fd,
+                          indice_pedaco * self.tamanho_pedaco + inicio, tamanho)
+        self.taxas_upload.registrar(id_remoto, tamanho)
+        self._bytes_enviados.incrementar(tamanho, id_remoto)
+
+        if self.verboso:
+            print(f"Enviado pedaço {indice_pedaco}")
 
     def iniciar_download(self):
-        """Loop principal de download do peer"""
+        """Loop principal de download do peer, acordado a cada pedaço concluído"""
         if self.eh_semeador_inicial:
             print(f"Semeador {self.id_par} aguardando conexões.")
-            self.rastreador.registrar(self.id_par, list(self.meus_pedacos))
             return
 
-        ultima_atualizacao_pool = 0
+        ultimo_progresso = 0
         
         # Loop até completar download
-        while len(self.meus_pedacos) < TOTAL_PEDACOS:
-            print(f"\nProgresso {self.id_par}: {len(self.meus_pedacos)}/{TOTAL_PEDACOS} ({(len(self.meus_pedacos)/TOTAL_PEDACOS)*100:.1f}%)")
-            
-            # Atualiza estado no tracker
-            with self.lock_pedacos:
-                self.rastreador.registrar(self.id_par, list(self.meus_pedacos))
-            
-            info_todos_pares = self.rastreador.obter_pares()
-            
-            # Atualiza número de downloads a cada 5 segundos
-            tempo_atual = time.time()
-            if tempo_atual - ultima_atualizacao_pool > 5:
-                self.max_downloads_atual = self.calcular_downloads_otimos(info_todos_pares)
-                ultima_atualizacao_pool = tempo_atual
+        while len(self.meus_pedacos) < self.total_pedacos:
+            if self._parado.is_set():
+                return
+            if time.monotonic() - ultimo_progresso >= INTERVALO_ATUALIZACAO:
+                print(f"\nProgresso {self.id_par}: {len(self.meus_pedacos)}/{self.total_pedacos} ({(len(self.meus_pedacos)/self.total_pedacos)*100:.1f}%) - janela {self.controle_downloads.limite()}")
+                ultimo_progresso = time.monotonic()
             
-            # Limpa downloads concluídos
+            # Limpa downloads concluídos e preenche as vagas liberadas
             self._processar_downloads_concluidos()
+            self._iniciar_novos_downloads()
             
-            # Inicia novos downloads
-            self._iniciar_novos_downloads(info_todos_pares)
-            
-            time.sleep(INTERVALO_ATUALIZACAO)
+            # Dorme até um download terminar, chegar um pedaço novo no enxame ou o próximo ciclo
+            self._evento_download.wait(INTERVALO_ATUALIZACAO)
+            self._evento_download.clear()
         
         print(f"\n*** {self.id_par}: DOWNLOAD COMPLETO! ***")
-        self.rastreador.registrar(self.id_par, list(self.meus_pedacos))
+        self._anunciar_ao_rastreador()
         
-        # Transforma-se em seed após completar
-        while True:
-            time.sleep(60)
+        # Transforma-se em seed após completar: o servidor continua atendendo
+
+    def _acordar_download(self):
+        """Acorda o laço de download (ex: um vizinho anunciou um pedaço novo)"""
+        self._evento_download.set()
+
+    def _manter(self):
+        """Anúncios periódicos ao tracker, PEX e conexões com vizinhos (a cada ciclo da sessão)"""
+        agora = time.monotonic()
+        try:
+            # O tracker só é usado para bootstrap e sinal de vida; o resto vem dos vizinhos.
+            # Sem nenhum par conhecido, volta a ele logo, com espera crescente
+            with self._lock_enxame:
+                isolado = not self._pares_conhecidos
+            if not isolado:
+                self._intervalo_isolado = None
+            intervalo = (INTERVALO_RASTREADOR if not isolado else
+                         self._intervalo_isolado or INTERVALO_RASTREADOR_ISOLADO)
+            if agora - self._ultimo_anuncio >= intervalo:
+                self._anunciar_ao_rastreador()
+                self._ultimo_anuncio = agora
+                if isolado:
+                    self._intervalo_isolado = min(intervalo * 2, INTERVALO_RASTREADOR)
+            if agora - self._ultimo_pex >= INTERVALO_PEX:
+                self._difundir(MSG_PARES, codificar_pares(self._amostra_pares()))
+                self._ultimo_pex = agora
+            if len(self.meus_pedacos) < self.total_pedacos:
+                self._conectar_vizinhos()
+        except Exception as e:
+            print(f"Erro na manutenção de {self.id_par}: {e}")
+
+    def _mensagens_iniciais(self):
+        """Mensagens enviadas logo após o handshake: nosso bitfield e pares conhecidos"""
+        with self.lock_pedacos:
+            bitfield = bytes(criar_bitfield(self.meus_pedacos, self.total_pedacos))
+        return [(MSG_BITFIELD, bitfield), (MSG_PARES, codificar_pares(self._amostra_pares()))]
+
+    def _amostra_pares(self):
+        """Até MAX_PARES_PEX pares conhecidos, sorteados, para uma mensagem de PEX"""
+        with self._lock_enxame:
+            conhecidos = list(self._pares_conhecidos)
+        return random.sample(conhecidos, min(MAX_PARES_PEX, len(conhecidos)))
+
+    def _vizinho_conectado(self, id_par):
+        """Registra um par que se conectou a nós como conhecido"""
+        if id_par != self.id_par:
+            with self._lock_enxame:
+                self._pares_conhecidos.add(id_par)
+
+    def _vizinho_desconectado(self, id_par):
+        """Esquece os pedaços de um vizinho quando a última conexão com ele fecha.
+
+        O par continua conhecido: _conectar_vizinhos tenta de novo e recebe um
+        bitfield atual, ou o descarta se estiver inalcançável.
+        """
+        if self._parado.is_set() or id_par in self._conexoes_saida() \
+                or id_par in self._conexoes_entrada():
+            return
+        with self._lock_enxame:
+            self._vizinhos_diretos.discard(id_par)
+            self.seletor.remover_pedacos(id_par, self.info_pares.pop(id_par, ()))
+
+    def _processar_mensagem_enxame(self, id_remoto, tipo, carga):
+        """Aplica um bitfield, TENHO ou PEX recebido diretamente de um vizinho"""
+        if tipo == MSG_PARES:
+            novos = set(decodificar_pares(carga)) - {self.id_par}
+            with self._lock_enxame:
+                self._pares_conhecidos.update(novos)
+        elif tipo == MSG_BITFIELD:
+            pedacos = {p for p in pedacos_do_bitfield(carga) if p < self.total_pedacos}
+            with self._lock_enxame:
+                self._vizinhos_diretos.add(id_remoto)
+                self._pares_conhecidos.add(id_remoto)
+                antigos = set(self.info_pares.get(id_remoto, ()))
+                self._atualizar_par(id_remoto, pedacos - antigos, adicionados=True)
+                self._atualizar_par(id_remoto, antigos - pedacos, adicionados=False)
+        elif tipo == MSG_TENHO:
+            (indice,) = TENHO.unpack(carga)
+            if indice < self.total_pedacos:
+                with self._lock_enxame:
+                    self._atualizar_par(id_remoto, [indice], adicionados=True)
+
+    def _difundir(self, tipo, carga):
+        """Envia uma mensagem do enxame a todos os vizinhos, em segundo plano"""
+        self.sessao._fila_difusao.put((self, tipo, carga))
+
+    def _entregar_difusao(self, tipo, carga):
+        """Entrega uma mensagem difundida pelas conexões abertas e recebidas (thread da sessão)"""
+        if self._parado.is_set():
+            return
+        mensagem = montar_mensagem(tipo, carga)
+        for conexao in self._conexoes_saida().values():
+            conexao.enviar(tipo, carga)
+        for socket_cliente, (_, lock_envio, avisos) in list(self._entradas.items()):
+            avisos.append(mensagem)
+            try:
+                self._enviar_avisos(socket_cliente, lock_envio, avisos)
+            except OSError:
+                # Um vizinho que não lê não pode travar a difusão aos demais: a
+                # thread da conexão acorda com o shutdown e a encerra
+                try:
+                    socket_cliente.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _conexoes_saida(self):
+        """{id_par: conexão} abertas por nós"""
+        return self.conexoes.conectadas()
+
+    def _conexoes_entrada(self):
+        """Ids dos pares com conexões recebidas abertas"""
+        return [id_remoto for id_remoto, _, _ in list(self._entradas.values())]
+
+    def _conectar_vizinhos(self):
+        """Abre conexões com pares conhecidos até MAX_VIZINHOS, para receber bitfields e TENHOs"""
+        conectados = set(self._conexoes_saida())
+        with self._lock_enxame:
+            candidatos = list(self._pares_conhecidos - conectados - self._conectando - {self.id_par})
+            vagas = MAX_VIZINHOS - len(conectados) - len(self._conectando)
+            random.shuffle(candidatos)
+            candidatos = candidatos[:max(0, vagas)]
+            self._conectando.update(candidatos)
+        for id_par in candidatos:
+            self._abrir_vizinho(id_par)
+
+    def _abrir_vizinho(self, id_par):
+        threading.Thread(target=self._conectar_vizinho, args=(id_par,), daemon=True).start()
+
+    def _conectar_vizinho(self, id_par):
+        host, porta = id_par.rsplit(":", 1)
+        try:
+            self.conexoes.obter(host, int(porta))
+        except SemVagasConexao:
+            pass  # Tenta de novo na próxima manutenção
+        except OSError:
+            # Inalcançável: esquecido (com seus pedaços) até reaparecer no tracker ou em um PEX
+            with self._lock_enxame:
+                self._esquecer_par(id_par)
+        finally:
+            with self._lock_enxame:
+                self._conectando.discard(id_par)
+
+    def _registrar_no_rastreador(self):
+        """Envia ao tracker o estado completo como bitfield compacto"""
+        with self.lock_pedacos:
+            bitfield = criar_bitfield(self.meus_pedacos, self.total_pedacos)
+            self._pedacos_nao_anunciados = []
+        self.rastreador.registrar_bitfield(self.id_par, xmlrpc.client.Binary(bytes(bitfield)),
+                                           self.info_hash)
+        self._registrado_no_rastreador = True
+
+    def _anunciar_ao_rastreador(self):
+        """Anuncia apenas os pedaços novos e aplica as alterações do enxame"""
+        with self._lock_rastreador:
+            return self._anunciar_sem_trava()
+
+    def _anunciar_sem_trava(self):
+        if not self._registrado_no_rastreador:
+            self._registrar_no_rastreador()
+
+        with self.lock_pedacos:
+            novos, self._pedacos_nao_anunciados = self._pedacos_nao_anunciados, []
+
+        try:
+            resposta = self.rastreador.anunciar(self.id_par, novos, self._versao_rastreador,
+                                                self.info_hash)
+        except Exception:
+            # Devolve os pedaços para o próximo anúncio
+            with self.lock_pedacos:
+                self._pedacos_nao_anunciados[:0] = novos
+            raise
+
+        if resposta.get('reenviar'):
+            # Tracker perdeu nosso estado: registra tudo novamente e pede snapshot
+            self._registrado_no_rastreador = False
+            self._versao_rastreador = 0
+            return self._anunciar_sem_trava()
+
+        with self._lock_enxame:
+            self._aplicar_alteracoes(resposta)
+        return self.info_pares
+
+    def _aplicar_alteracoes(self, resposta):
+        """Atualiza a cópia local do enxame com um snapshot ou um delta do tracker"""
+        if resposta['completo']:
+            # Snapshot: converte em ganhos e perdas em relação à cópia local. Vizinhos
+            # diretos estão mais atualizados que o tracker: deles só aceita ganhos
+            novos = {id_par: set(pedacos_do_bitfield(dados_binarios(bitfield)))
+                     for id_par, bitfield in resposta['pares'].items()}
+            ganhos, perdidos = {}, {}
+            saidas = [id_par for id_par in self.info_pares if id_par not in novos]
+            for id_par, atuais in novos.items():
+                antigos = self.info_pares.get(id_par, set())
+                ganhos[id_par] = atuais - antigos
+                if id_par not in self._vizinhos_diretos:
+                    perdidos[id_par] = antigos - atuais
+        else:
+            ganhos, perdidos = resposta['ganhos'], resposta['perdidos']
+            saidas = resposta.get('saidas', ())
+        self._pares_conhecidos.update(id_par for id_par in ganhos if id_par != self.id_par)
+
+        for id_par, pedacos in ganhos.items():
+            self._atualizar_par(id_par, pedacos, adicionados=True)
+        for id_par, pedacos in perdidos.items():
+            self._atualizar_par(id_par, pedacos, adicionados=False)
+        for id_par in saidas:
+            if id_par not in self._vizinhos_diretos:
+                self._esquecer_par(id_par)
+        self._versao_rastreador = resposta['versao']
+
+    def _esquecer_par(self, id_par):
+        """Remove um par que saiu do enxame da cópia local, do seletor e dos conhecidos"""
+        self.seletor.remover_pedacos(id_par, self.info_pares.pop(id_par, ()))
+        self._pares_conhecidos.discard(id_par)
+
+    def _atualizar_par(self, id_par, pedacos, adicionados):
+        """Aplica ganhos ou perdas de um par à cópia local e ao seletor de pedaços"""
+        if id_par == self.id_par:
+            return
+        pedacos_par = self.info_pares.setdefault(id_par, set())
+        if adicionados:
+            pedacos_par.update(pedacos)
+            self.seletor.adicionar_pedacos(id_par, pedacos)
+            if pedacos:
+                self._acordar_download()
+        else:
+            pedacos_par.difference_update(pedacos)
+            self.seletor.remover_pedacos(id_par, pedacos)
 
     def _processar_downloads_concluidos(self):
         """Remove downloads finalizados da lista ativa"""
@@ -174,138 +846,281 @@ class Par:
                 concluidos.append(pedaco)
                 try:
                     sucesso = future.result()
-                    if not sucesso:
+                    if sucesso:
+                        self.controle_downloads.sucesso(self._tamanho_do_pedaco(pedaco))
+                    else:
+                        self.controle_downloads.falha()
                         with self.lock_pedacos:
                             self.pedacos_sendo_baixados.discard(pedaco)
                 except Exception as e:
                     print(f"Erro no download do pedaço {pedaco}: {e}")
+                    self.controle_downloads.falha()
                     with self.lock_pedacos:
                         self.pedacos_sendo_baixados.discard(pedaco)
+                    self.seletor.marcar_desejado(pedaco)
         
         for pedaco in concluidos:
             del self.downloads_ativos[pedaco]
 
-    def _iniciar_novos_downloads(self, info_todos_pares):
-        """Inicia novos downloads respeitando o limite máximo"""
+    def _iniciar_novos_downloads(self):
+        """Inicia novos downloads respeitando a janela de concorrência e a cota da sessão"""
         downloads_disponiveis = len(self.downloads_ativos)
-        slots_livres = self.max_downloads_atual - downloads_disponiveis
+        limite = min(self.controle_downloads.limite(), self.sessao.cota_downloads(self))
+        slots_livres = limite - downloads_disponiveis
         
         if slots_livres <= 0:
             return
         
-        # Obtém pedaços disponíveis ordenados por raridade
-        pedacos_disponiveis = self.obter_todos_pedacos_disponiveis(info_todos_pares)
-        pedacos_para_baixar = pedacos_disponiveis[:slots_livres]
+        # Seleciona os pedaços desejados mais raros (rarest first) que têm um
+        # dono disposto a nos atender
+        pedacos_para_baixar = self.seletor.selecionar(
+            slots_livres, lambda id_par: not self._fonte_suspensa(id_par))
         
         # Submete novos downloads
         futures_batch = []
-        for pedaco, pares_disponiveis in pedacos_para_baixar:
-            # Prioriza seeds sobre peers
-            seeds = [p for p in pares_disponiveis if len(info_todos_pares.get(p, [])) == TOTAL_PEDACOS]
-            peers = [p for p in pares_disponiveis if p not in seeds]
-            
-            par_escolhido = random.choice(seeds) if seeds else (random.choice(peers) if peers else None)
-            if not par_escolhido:
+        for pedaco in pedacos_para_baixar:
+            # Donos que nos atendem, sorteados com peso pela taxa medida de cada um
+            fontes = ordenar_por_taxa([id_par for id_par in self.seletor.donos(pedaco)
+                                       if not self._fonte_suspensa(id_par)],
+                                      self.taxas_download)
+            if not fontes:
                 continue
-                
-            host, porta = par_escolhido.split(":")
-            
+
             with self.lock_pedacos:
                 self.pedacos_sendo_baixados.add(pedaco)
+            self.seletor.marcar_indesejado(pedaco)
             
             # Submete tarefa de download
-            future = self.executor_downloads.submit(
-                self.requisitar_pedaco_do_par, host, int(porta), pedaco
-            )
+            future = self._submeter_download(pedaco, fontes)
+            future.add_done_callback(self._download_finalizado)
             self.downloads_ativos[pedaco] = future
-            futures_batch.append((pedaco, par_escolhido))
+            futures_batch.append((pedaco, fontes))
         
-        if futures_batch:
+        if futures_batch and self.verboso:
             print(f"Iniciando {len(futures_batch)} downloads simultâneos")
-            for pedaco, par in futures_batch:
-                print(f"  Pedaço {pedaco} de {par}")
+            for pedaco, fontes in futures_batch:
+                print(f"  Pedaço {pedaco} de {', '.join(fontes)}")
 
-    def obter_todos_pedacos_disponiveis(self, info_todos_pares):
-        """Retorna lista de pedaços disponíveis ordenados por raridade"""
-        contagem_pedacos = defaultdict(list)
-        
-        # Contabiliza pedaços disponíveis
-        for id_par, pedacos in info_todos_pares.items():
-            if id_par != self.id_par:
-                for pedaco in pedacos:
-                    with self.lock_pedacos:
-                        if pedaco not in self.meus_pedacos and pedaco not in self.pedacos_sendo_baixados:
-                            contagem_pedacos[pedaco].append(id_par)
-        
-        if not contagem_pedacos:
-            return []
-        
-        # Ordena por menor disponibilidade (rarest first)
-        return sorted(contagem_pedacos.items(), key=lambda item: (len(item[1]), item[0]))
+    def _submeter_download(self, indice_pedaco, fontes):
+        """Agenda o download de um pedaço; retorna um objeto com a interface de Future"""
+        return self.executor_downloads.submit(self.baixar_pedaco, indice_pedaco, fontes)
+
+    def _download_finalizado(self, future):
+        """Acorda o loop de download para preencher a vaga de um pedaço concluído.
+
+        Falhas esperam o próximo ciclo, para não repetir de imediato um pedaço
+        cujas fontes acabaram de recusá-lo.
+        """
+        if not future.cancelled() and future.exception() is None and future.result():
+            self._evento_download.set()
 
-    def requisitar_pedaco_do_par(self, host, porta, indice_pedaco):
-        """Baixa um pedaço específico de outro par"""
+    def _em_endgame(self):
+        """Endgame: todos os pedaços que faltam já estão em download"""
+        return len(self.meus_pedacos) + len(self.pedacos_sendo_baixados) >= self.total_pedacos
+
+    def baixar_pedaco(self, indice_pedaco, fontes):
+        """Baixa um pedaço em blocos, requisitados em paralelo às primeiras fontes disponíveis
+
+        No endgame, a todos os donos conhecidos do pedaço.
+        """
+        tamanho = self._tamanho_do_pedaco(indice_pedaco)
+        buffer = self.buffers.obter()
+        pedaco = PedacoEmAndamento(indice_pedaco, tamanho, memoryview(buffer)[:tamanho])
+        progresso = threading.Event()
+        fontes = list(fontes)
+        lentas_notificadas = set()
+        salvo = False
+        inicio = time.monotonic()
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(TIMEOUT_CONEXAO)
-                s.connect((host, porta))
-                s.sendall(f"GET {indice_pedaco}".encode())
-                
-                # Recebe dados do pedaço
-                dados = b''
-                while len(dados) < TAMANHO_PEDACO:
-                    try:
-                        pacote = s.recv(min(BUFFER_SIZE, TAMANHO_PEDACO - len(dados)))
-                        if not pacote:
-                            break
-                        dados += pacote
-                    except socket.timeout:
-                        break
-                
-                if len(dados) == TAMANHO_PEDACO:
-                    self.salvar_pedaco(indice_pedaco, dados)
-                    return True
-                else:
-                    print(f"Dados incompletos para pedaço {indice_pedaco}: {len(dados)}/{TAMANHO_PEDACO}")
+            while pedaco.faltantes:
+                if self._parado.is_set():
                     return False
-        except Exception as e:
-            print(f"Falha ao baixar pedaço {indice_pedaco} de {host}:{porta}: {e}")
-            return False
+                endgame = self._em_endgame()
+                if endgame:
+                    # Todo dono atual serve, inclusive os que anunciaram o pedaço depois do início
+                    fontes += [f for f in self.seletor.donos(indice_pedaco)
+                               if f not in fontes and not self._fonte_suspensa(f)]
+                fontes = [f for f in fontes if f not in pedaco.fontes_rejeitadas]
+                if not fontes or time.monotonic() - pedaco.ultimo_progresso > TIMEOUT_CONEXAO:
+                    print(f"Falha ao baixar pedaço {indice_pedaco}: sem progresso das fontes")
+                    return False
+
+                # Fontes que deixaram blocos travar: janela reduzida e suspensas para novos pedaços
+                for id_fonte in pedaco.fontes_lentas - lentas_notificadas:
+                    self._controle_fonte(id_fonte).falha()
+                    self._fontes_suspensas[id_fonte] = time.monotonic()
+                    lentas_notificadas.add(id_fonte)
+
+                ativas = [f for f in fontes if f not in pedaco.fontes_lentas] or fontes
+                if not endgame:
+                    ativas = ativas[:MAX_FONTES_POR_PEDACO]
+                for id_fonte in ativas:
+                    self._requisitar_blocos(pedaco, id_fonte, endgame, progresso)
+
+                progresso.wait(INTERVALO_VERIFICACAO_BLOCOS)
+                progresso.clear()
+
+            # Verifica a integridade contra o hash do metainfo antes de gravar
+            if hash_pedaco(pedaco.buffer, self.metainfo['algoritmo']) != self.hashes[indice_pedaco]:
+                print(f"Pedaço {indice_pedaco} descartado: hash não confere")
+                return False
+
+            self.salvar_pedaco(indice_pedaco, pedaco.buffer)
+            salvo = True
+            return True
         finally:
+            # Cancela blocos ainda pendentes (cópias do endgame ou download abandonado)
+            for conexao, numero in pedaco.finalizar():
+                conexao.cancelar(indice_pedaco, *pedaco.blocos[numero])
+            self.buffers.devolver(buffer)
             with self.lock_pedacos:
                 self.pedacos_sendo_baixados.discard(indice_pedaco)
+            self._pedacos_baixados.incrementar(1, 'salvo' if salvo else 'falha')
+            if salvo:
+                self._duracao_pedaco.observar(time.monotonic() - inicio)
+            else:
+                # Volta a ser candidato na próxima seleção
+                self.seletor.marcar_desejado(indice_pedaco)
+
+    def _requisitar_blocos(self, pedaco, id_fonte, endgame, progresso):
+        """Completa o pipeline de blocos do pedaço com uma fonte"""
+        vagas = self._controle_fonte(id_fonte).limite() - pedaco.em_andamento(id_fonte)
+        if vagas <= 0:
+            return
+
+        host, porta = id_fonte.rsplit(":", 1)
+        try:
+            conexao = self.conexoes.obter(host, int(porta))
+        except SemVagasConexao:
+            return  # Sem conexão com a fonte por enquanto; as demais seguem
+        except OSError as e:
+            print(f"Falha ao conectar a {id_fonte}: {e}")
+            pedaco.fontes_rejeitadas.add(id_fonte)
+            return
+
+        # Banda de recepção da sessão: sem vez até a próxima verificação, não pede nada agora
+        limitador = self.sessao.escalonador.download
+        previstos = min(vagas, pedaco.faltantes)
+        atraso = limitador.reservar(self.info_hash, previstos * TAMANHO_BLOCO,
+                                    INTERVALO_VERIFICACAO_BLOCOS)
+        if atraso is None:
+            return
+        if atraso > 0:
+            time.sleep(atraso)
+
+        pedido = time.monotonic()
+        numeros = pedaco.reservar_blocos(id_fonte, conexao, vagas, endgame, TIMEOUT_BLOCO)
+        limitador.devolver(self.info_hash, (previstos - len(numeros)) * TAMANHO_BLOCO)
+        for numero in numeros:
+            inicio, tamanho = pedaco.blocos[numero]
+            ao_concluir = partial(self._bloco_recebido, pedaco, numero, id_fonte, progresso, pedido)
+            try:
+                conexao.requisitar(pedaco.indice, inicio, tamanho, ao_concluir)
+            except ConnectionError:
+                pedaco.falhou(numero, id_fonte)
+
+    def _bloco_recebido(self, pedaco, numero, id_fonte, progresso, pedido, dados, erro):
+        """Chamado pela conexão quando um bloco chega ou falha"""
+        if erro is not None:
+            if isinstance(erro, ParEstrangulado):
+                self._fontes_suspensas[id_fonte] = time.monotonic()
+            elif not isinstance(erro, PedacoIndisponivel):
+                self._controle_fonte(id_fonte).falha()  # Conexão perdida ou sem resposta
+            pedaco.falhou(numero, id_fonte, rejeitado=isinstance(erro, PedacoIndisponivel))
+        else:
+            self._latencia_bloco.observar(time.monotonic() - pedido)
+            self._bytes_recebidos.incrementar(len(dados), id_fonte)
+            self.taxas_download.registrar(id_fonte, len(dados))
+            self._controle_fonte(id_fonte).sucesso(len(dados))
+            # Cancela as cópias do mesmo bloco pedidas a outras fontes
+            for conexao in pedaco.receber(numero, id_fonte, dados):
+                conexao.cancelar(pedaco.indice, *pedaco.blocos[numero])
+        progresso.set()
 
     def salvar_pedaco(self, indice_pedaco, dados):
         """Salva pedaço baixado no arquivo local"""
-        caminho_arquivo = self.id_par.replace(":", "_") + "_" + NOME_ARQUIVO
-        
+        # Escrita posicional no descritor da sessão, fora da trava de pedaços
+        fd = self.descritores.obter(self.caminho_arquivo)
+        escrever_trecho(self.descritores, fd, indice_pedaco * self.tamanho_pedaco, dados)
+        self._registrar_pedaco_salvo(indice_pedaco)
+
+    def _registrar_pedaco_salvo(self, indice_pedaco):
+        """Marca um pedaço já gravado como possuído e pendente de anúncio"""
         with self.lock_pedacos:
-            # Escreve no arquivo
-            with open(caminho_arquivo, 'r+b') as f:
-                f.seek(indice_pedaco * TAMANHO_PEDACO)
-                f.write(dados)
-            
             self.meus_pedacos.add(indice_pedaco)
+            self._pedacos_nao_anunciados.append(indice_pedaco)
             self.pedacos_sendo_baixados.discard(indice_pedaco)
+        self._difundir(MSG_TENHO, TENHO.pack(indice_pedaco))
         
-        print(f"Pedaço {indice_pedaco} salvo. Total: {len(self.meus_pedacos)}")
+        if self.verboso:
+            print(f"Pedaço {indice_pedaco} salvo. Total: {len(self.meus_pedacos)}")
+
+    def parar(self):
+        """Encerra downloads, conexões e threads do torrent (ex: fim de um benchmark).
+
+        Uma sessão criada pelo próprio par é encerrada junto; uma compartilhada
+        segue atendendo os demais torrents.
+        """
+        if self._parado.is_set():
+            return
+        self._parado.set()
+        self.sessao.remover(self)
+        self._acordar_download()
+        self.estrangulador.parar()
+        # shutdown acorda as threads bloqueadas em recv; close sozinho não
+        for sock in list(self._entradas):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.conexoes.fechar_todas()
+        # Downloads em andamento desistem ao ver o par parado; só então os descritores fecham
+        self._aguardar_downloads()
+        if self._sessao_propria:
+            self.sessao.parar()
+        self.descritores.fechar_todos()
+
+    def _aguardar_downloads(self):
+        """Espera o laço de download e os pedaços em andamento terminarem"""
+        if self._thread_download is not None and self._thread_download is not threading.current_thread():
+            self._thread_download.join(TIMEOUT_CONEXAO)
+        futures = list(self.downloads_ativos.values())
+        for future in futures:
+            future.cancel()
+        wait(futures, timeout=TIMEOUT_CONEXAO)
 
     def __del__(self):
-        """Destrutor - garante shutdown limpo do executor"""
-        if hasattr(self, 'executor_downloads'):
-            self.executor_downloads.shutdown(wait=True)
+        """Destrutor - garante shutdown limpo do executor e das conexões"""
+        if hasattr(self, 'estrangulador'):
+            self.parar()
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 4:
-        print("Uso: python par.py <host> <porta> <semeador (true/false)>")
-        sys.exit(1)
-        
-    host = sys.argv[1]
-    porta = int(sys.argv[2])
-    eh_semeador = sys.argv[3].lower() == 'true'
+    import argparse
+    parser = argparse.ArgumentParser(description="Par da rede P2P")
+    parser.add_argument('host')
+    parser.add_argument('porta', type=int)
+    parser.add_argument('semeador', help='true para o semeador inicial')
+    parser.add_argument('--metricas', type=int, metavar='PORTA',
+                        help='porta do endpoint HTTP de métricas (0 = qualquer porta livre)')
+    parser.add_argument('--verboso', action='store_true',
+                        help='imprime cada bloco enviado, pedaço salvo e lote de downloads')
+    parser.add_argument('--arquivo', action='append', metavar='NOME',
+                        help=f'arquivo (torrent) a semear ou baixar; repita para vários '
+                             f'na mesma porta (padrão: {NOME_ARQUIVO})')
+    parser.add_argument('--taxa-upload', type=float, metavar='KB/S',
+                        help='limite de envio do processo, somando todos os torrents')
+    parser.add_argument('--taxa-download', type=float, metavar='KB/S',
+                        help='limite de recepção do processo, somando todos os torrents')
+    args = parser.parse_args()
     
-    par = Par(host, porta, eh_semeador)
+    # Uma sessão (porta, pool de downloads e limites de banda) para todos os torrents
+    sessao = Sessao(args.host, args.porta,
+                    taxa_upload=args.taxa_upload and args.taxa_upload * 1024,
+                    taxa_download=args.taxa_download and args.taxa_download * 1024,
+                    porta_metricas=args.metricas, verboso=args.verboso or None)
+    pares = [Par(args.host, args.porta, args.semeador.lower() == 'true', nome_arquivo=nome,
+                 sessao=sessao)
+             for nome in args.arquivo or [NOME_ARQUIVO]]
     
     try:
         while True:
@@ -0,0 +1,725 @@
+"""Motor de par em asyncio: milhares de conexões em uma única thread.
+
+ParAsync mantém o estado, o tracker e o protocolo de fio de Par, mas o
+servidor de envio e os downloads rodam como corrotinas em um único loop de
+eventos, sem uma thread por conexão ou por pedaço. Só o acesso ao disco
+(gravação, verificação de hash e leitura quando não há sendfile) e as
+chamadas ao tracker vão para um pool pequeno de threads. Vários torrents
+podem dividir uma SessaoAsync: mesma porta, mesmo loop e mesmos limites.
+
+Uso: python par_async.py <host> <porta> <semeador (true/false)> [--arquivo NOME ...]
+         [--taxa-upload KB/S] [--taxa-download KB/S] [--metricas PORTA] [--verboso]
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from armazenamento import escrever_trecho, ler_trecho
+from blocos import TAMANHO_BLOCO, PedacoEmAndamento
+from conexoes import ParEstrangulado, PedacoIndisponivel, SemVagasConexao
+from criar_arquivo import hash_pedaco
+from par import (INTERVALO_ATUALIZACAO, INTERVALO_VERIFICACAO_BLOCOS, MAX_FONTES_POR_PEDACO,
+                 NOME_ARQUIVO, TIMEOUT_BLOCO, TIMEOUT_CONEXAO, TIMEOUT_OCIOSO, Par, Sessao,
+                 remover_requisicao)
+from protocolo import (BLOCO, MENSAGENS_ENXAME, MSG_BLOCO, MSG_CANCELAR, MSG_ESTRANGULADO,
+                       MSG_HANDSHAKE, MSG_REJEITADO, MSG_REQUISICAO, REQUISICAO, ErroProtocolo,
+                       cabecalho_bloco, codificar_handshake, decodificar_handshake, ler_cabecalho,
+                       ler_exato, montar_mensagem)
+
+THREADS_DISCO = 4            # Threads para disco, hashes e chamadas ao tracker
+BACKLOG_SERVIDOR = 1024      # Fila de conexões aguardando accept
+MAX_CONEXOES_ASYNC = 10000   # Conexões de outros pares atendidas ao mesmo tempo
+MAX_HANDSHAKES_ASYNC = 2048  # Conexões recebidas ainda sem handshake (uma corrotina cada)
+MAX_SAIDAS_ASYNC = 2048      # Conexões abertas para outros pares ao mesmo tempo
+
+
+def aumentar_limite_descritores():
+    """Eleva o limite de descritores abertos do processo ao máximo permitido (Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    flexivel, rigido = resource.getrlimit(resource.RLIMIT_NOFILE)
+    alvo = rigido if rigido != resource.RLIM_INFINITY else max(flexivel, 65536)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (alvo, rigido))
+    except (ValueError, OSError):
+        pass
+
+
+class ConexaoParAsync:
+    """Equivalente assíncrono de ConexaoPar.
+
+    Requisições são escritas sem esperar as anteriores; uma tarefa leitora
+    entrega cada bloco a ao_concluir(dados, erro), chamado no próprio loop.
+    Mensagens do enxame vão para ao_receber e o fechamento para ao_encerrar,
+    como em ConexaoPar.
+    """
+
+    def __init__(self, leitor, escritor, endereco, timeout, ao_receber=None, ao_encerrar=None):
+        self.endereco = endereco
+        self.id_remoto = f"{endereco[0]}:{endereco[1]}"
+        self.timeout = timeout
+        self.ao_receber = ao_receber
+        self.ao_encerrar = ao_encerrar
+        self._leitor = leitor
+        self._escritor = escritor
+        self._pendentes = {}  # {(indice, inicio): ao_concluir}
+        self.fechada = False
+        self._tarefa = asyncio.create_task(self._ler_respostas())
+
+    @classmethod
+    async def abrir(cls, host, porta, id_local, info_hash, timeout=None,
+                    ao_conectar=None, ao_receber=None, ao_encerrar=None):
+        timeout = TIMEOUT_CONEXAO if timeout is None else timeout
+        leitor, escritor = await asyncio.wait_for(asyncio.open_connection(host, porta), timeout)
+        escritor.write(montar_mensagem(MSG_HANDSHAKE, codificar_handshake(info_hash, id_local)))
+        for tipo, carga in (ao_conectar() if ao_conectar else ()):
+            escritor.write(montar_mensagem(tipo, carga))
+        return cls(leitor, escritor, (host, porta), timeout, ao_receber, ao_encerrar)
+
+    @property
+    def em_andamento(self):
+        return len(self._pendentes)
+
+    def requisitar(self, indice, inicio, tamanho, ao_concluir):
+        """Envia uma requisição; ao_concluir é chamado quando o bloco chegar ou falhar"""
+        if self.fechada:
+            raise ConnectionError(f"Conexão com {self.endereco} encerrada")
+        self._pendentes[(indice, inicio)] = ao_concluir
+        self._escritor.write(montar_mensagem(MSG_REQUISICAO, REQUISICAO.pack(indice, inicio, tamanho)))
+
+    def cancelar(self, indice, inicio, tamanho):
+        """Desiste de uma requisição; o par remoto a descarta se ainda não a atendeu"""
+        if self._pendentes.pop((indice, inicio), None) is None or self.fechada:
+            return
+        self._escritor.write(montar_mensagem(MSG_CANCELAR, REQUISICAO.pack(indice, inicio, tamanho)))
+
+    def enviar(self, tipo, carga=b''):
+        """Envia uma mensagem avulsa (ex: TENHO); ignorada se a conexão já caiu"""
+        if not self.fechada:
+            self._escritor.write(montar_mensagem(tipo, carga))
+
+    async def _ler_respostas(self):
+        try:
+            while True:
+                try:
+                    cabecalho = await asyncio.wait_for(ler_cabecalho(self._leitor), self.timeout)
+                except asyncio.TimeoutError:
+                    if self._pendentes:
+                        raise
+                    continue  # Conexão ociosa: continua aguardando
+                if cabecalho is None:
+                    raise ConnectionError("Conexão encerrada pelo par")
+
+                tipo, tamanho = cabecalho
+                carga = await asyncio.wait_for(ler_exato(self._leitor, tamanho), self.timeout)
+                if tipo == MSG_BLOCO:
+                    indice, inicio = BLOCO.unpack_from(carga)
+                    # Blocos cancelados ainda podem chegar; são simplesmente descartados
+                    self._resolver((indice, inicio), memoryview(carga)[BLOCO.size:], None)
+                elif tipo == MSG_REJEITADO:
+                    indice, inicio, _ = REQUISICAO.unpack(carga)
+                    self._resolver((indice, inicio), None,
+                                   PedacoIndisponivel(f"Pedaço {indice} indisponível"))
+                elif tipo == MSG_ESTRANGULADO:
+                    indice, inicio, _ = REQUISICAO.unpack(carga)
+                    self._resolver((indice, inicio), None,
+                                   ParEstrangulado(f"{self.endereco} não está nos atendendo"))
+                elif tipo in MENSAGENS_ENXAME:
+                    if self.ao_receber is not None:
+                        self.ao_receber(self.id_remoto, tipo, carga)
+                else:
+                    raise ErroProtocolo(f"Mensagem inesperada do tipo {tipo}")
+        except asyncio.CancelledError:
+            self._encerrar("fechada localmente")
+        except Exception as e:
+            self._encerrar(e)
+
+    def _resolver(self, chave, dados, erro):
+        ao_concluir = self._pendentes.pop(chave, None)
+        if ao_concluir is not None:
+            self._notificar(ao_concluir, dados, erro)
+
+    def _notificar(self, ao_concluir, dados, erro):
+        try:
+            ao_concluir(dados, erro)
+        except Exception as e:
+            print(f"Erro ao processar resposta de {self.endereco}: {e}")
+
+    def _encerrar(self, motivo):
+        # Marca a conexão como fechada e falha todas as requisições pendentes
+        ja_fechada, self.fechada = self.fechada, True
+        pendentes, self._pendentes = self._pendentes, {}
+        self._escritor.close()
+        erro = ConnectionError(f"Conexão com {self.endereco} perdida: {motivo}")
+        for ao_concluir in pendentes.values():
+            self._notificar(ao_concluir, None, erro)
+        if not ja_fechada and self.ao_encerrar is not None:
+            self.ao_encerrar(self.id_remoto)
+
+    def fechar(self):
+        self._tarefa.cancel()
+        self._encerrar("fechada localmente")
+
+
+class SessaoAsync(Sessao):
+    """Sessão do motor asyncio: o servidor é uma corrotina no loop dos torrents.
+
+    Como em Sessao, o handshake escolhe o torrent de cada conexão recebida e
+    a manutenção (tracker, PEX e vizinhos) roda em uma thread; o pool de
+    disco é dividido pelos torrents. Os torrents entram na sessão ao começar
+    executar(), todos no mesmo loop de eventos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.escalonador.limites['conexoes'] = MAX_CONEXOES_ASYNC
+        self.escalonador.limites['saidas'] = MAX_SAIDAS_ASYNC
+        self._handshakes = threading.BoundedSemaphore(MAX_HANDSHAKES_ASYNC)
+        self.executor_disco = ThreadPoolExecutor(max_workers=THREADS_DISCO)
+        self._servidor = None  # Tarefa que abre o asyncio.Server
+
+    def _criar_executor_downloads(self):
+        # Os downloads são tarefas no loop: não há pool de threads
+        return None
+
+    def _iniciar_execucao(self):
+        # Chamado dentro do loop, quando o primeiro torrent entra
+        self._servidor = asyncio.ensure_future(self._abrir_servidor())
+        threading.Thread(target=self._executar_manutencao, daemon=True).start()
+
+    async def _abrir_servidor(self):
+        # O socket já foi aberto por Sessao.__init__ (que resolve a porta 0)
+        servidor = await asyncio.start_server(self._atender_conexao, sock=self._socket_servidor,
+                                              backlog=BACKLOG_SERVIDOR)
+        print(f"Servidor {self.id_par} escutando em {self.host}:{self.porta} (asyncio)")
+        return servidor
+
+    async def aguardar_servidor(self):
+        await asyncio.shield(self._servidor)
+
+    async def _atender_conexao(self, leitor, escritor):
+        """Lê o handshake e entrega a conexão ao torrent, se houver vaga para ele"""
+        info_hash = None
+        admitida = False
+        if not self._handshakes.acquire(blocking=False):
+            escritor.close()
+            return
+        try:
+            try:
+                cabecalho = await asyncio.wait_for(ler_cabecalho(leitor), TIMEOUT_CONEXAO)
+                if cabecalho is None:
+                    return
+                tipo, tamanho = cabecalho
+                if tipo != MSG_HANDSHAKE:
+                    raise ErroProtocolo(f"Esperado handshake, recebida mensagem do tipo {tipo}")
+                info_hash, id_remoto = decodificar_handshake(await ler_exato(leitor, tamanho))
+            finally:
+                self._handshakes.release()
+            par = self.torrents.get(info_hash)
+            if par is None:
+                raise ErroProtocolo(f"Torrent {info_hash} não é servido por {self.id_par}")
+
+            admitida, cedente = self.escalonador.admitir('conexoes', info_hash)
+            if not admitida:
+                return
+            if cedente is not None:
+                self._ceder_conexao(cedente)
+            await par._atender_conexao(leitor, escritor, id_remoto)
+        except Exception as e:
+            print(f"Erro na conexão recebida por {self.id_par}: {e}")
+        finally:
+            if admitida:
+                self.escalonador.liberar('conexoes', info_hash)
+            escritor.close()
+
+    def parar(self):
+        """Encerra o servidor e os pools; deve ser chamada no loop, após os torrents"""
+        if self._parado.is_set():
+            return
+        self._parado.set()
+        if self._servidor is not None and self._servidor.done() and not self._servidor.cancelled() \
+                and self._servidor.exception() is None:
+            self._servidor.result().close()
+        else:
+            self._socket_servidor.close()
+        self.executor_disco.shutdown(wait=False)
+        if self.servidor_metricas is not None:
+            self.servidor_metricas.shutdown()
+            self.servidor_metricas.server_close()
+
+
+class ParAsync(Par):
+    """Par com servidor e downloads em um único loop asyncio.
+
+    O estado dos pedaços, o anúncio ao tracker, o seletor, as taxas, o
+    estrangulamento e o controle AIMD são os mesmos de Par; este motor troca
+    apenas a execução (threads por corrotinas). Nada roda até executar() ser
+    aguardada em um loop de eventos.
+    """
+
+    classe_sessao = SessaoAsync
+
+    def _iniciar_execucao(self):
+        self.executor_disco = self.sessao.executor_disco
+        self._conexoes_async = {}   # {id_par: ConexaoParAsync}
+        self._abrindo = {}          # {id_par: tarefa de abertura da conexão}
+        # {escritor: (id_remoto, avisos, ha_envios)} das conexões recebidas
+        self._entradas_async = {}
+        self._arquivo_envio = None  # Objeto de arquivo sobre o descritor, para loop.sendfile
+        self._sendfile_disponivel = hasattr(os, 'sendfile')
+        self._loop = None           # Definido por executar()
+
+    async def executar(self):
+        """Executa servidor, downloads e estrangulamento até ser cancelada (ou parar())"""
+        self._loop = asyncio.get_running_loop()
+        self._execucao = asyncio.current_task()
+        self._evento_download = asyncio.Event()
+        # Servidor, manutenção (tracker, PEX e vizinhos) e pool de disco são da sessão
+        self.sessao.adicionar(self)
+        # Como a thread de download de Par, uma falha no download não derruba o servidor
+        download = asyncio.ensure_future(self._laco_download())
+        download.add_done_callback(self._download_encerrado)
+        try:
+            await self.sessao.aguardar_servidor()
+            await self._reavaliar_estrangulamento()
+        except asyncio.CancelledError:
+            if not self._parado.is_set():
+                raise
+        finally:
+            self._parado.set()
+            self.sessao.remover(self)
+            # Os pedaços em download são tarefas próprias: cancela e espera todas
+            download.cancel()
+            tarefas = list(self.downloads_ativos.values())
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(download, *tarefas, return_exceptions=True)
+            for conexao in list(self._conexoes_async.values()):
+                conexao.fechar()
+            for escritor in list(self._entradas_async):
+                escritor.close()
+            if self._arquivo_envio is not None:
+                self._arquivo_envio.close()
+            if self._sessao_propria:
+                self.sessao.parar()
+            self.descritores.fechar_todos()
+
+    def parar(self):
+        """Encerra executar(); pode ser chamada de qualquer thread"""
+        if self._parado.is_set():
+            return
+        self._parado.set()
+        if self._loop is None:
+            # executar() nunca rodou: só a sessão própria tem o que fechar
+            if self._sessao_propria:
+                self.sessao.parar()
+            return
+        self._loop.call_soon_threadsafe(self._execucao.cancel)
+
+    def _download_encerrado(self, tarefa):
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            print(f"Erro no laço de download de {self.id_par}: {tarefa.exception()!r}")
+
+    async def _em_executor(self, funcao, *args):
+        """Executa uma chamada bloqueante (disco ou tracker) no pool de threads"""
+        return await self._loop.run_in_executor(self.executor_disco, partial(funcao, *args))
+
+    def _acordar_download(self):
+        # Chamado pela thread de manutenção ou pelo próprio loop
+        self._loop.call_soon_threadsafe(self._evento_download.set)
+
+    async def _reavaliar_estrangulamento(self):
+        while True:
+            await asyncio.sleep(self.estrangulador.intervalo)
+            self.estrangulador.reavaliar()
+
+    # ----- Envio -----
+
+    async def _atender_conexao(self, leitor, escritor, id_remoto):
+        """Atende uma conexão persistente: esta tarefa lê as mensagens e outra envia os blocos.
+
+        Chamada pela sessão depois do handshake.
+        """
+        fila = deque()    # Requisições recebidas e ainda não atendidas
+        avisos = deque()  # Mensagens do enxame, enviadas entre um bloco e outro
+        ha_envios = asyncio.Event()
+
+        async def enviar_fila():
+            while True:
+                await ha_envios.wait()
+                ha_envios.clear()
+                while fila or avisos:
+                    while avisos:
+                        escritor.write(avisos.popleft())
+                    if fila:
+                        self._fila_envio.observar(len(fila))
+                        requisicao, chegada = fila.popleft()
+                        await self.lidar_com_requisicao(escritor, id_remoto, *requisicao, chegada)
+
+        envio = asyncio.create_task(enviar_fila())
+        envio.add_done_callback(partial(self._envio_encerrado, escritor))
+        self._vizinho_conectado(id_remoto)
+        avisos.extend(montar_mensagem(*mensagem) for mensagem in self._mensagens_iniciais())
+        ha_envios.set()
+        self._entradas_async[escritor] = (id_remoto, avisos, ha_envios)
+        try:
+            while True:
+                cabecalho = await asyncio.wait_for(ler_cabecalho(leitor), TIMEOUT_OCIOSO)
+                if cabecalho is None:
+                    break
+                tipo, tamanho = cabecalho
+                carga = await ler_exato(leitor, tamanho)
+
+                if tipo in MENSAGENS_ENXAME:
+                    self._processar_mensagem_enxame(id_remoto, tipo, carga)
+                elif tipo == MSG_REQUISICAO:
+                    fila.append((REQUISICAO.unpack(carga), time.monotonic()))
+                    ha_envios.set()
+                elif tipo == MSG_CANCELAR:
+                    remover_requisicao(fila, REQUISICAO.unpack(carga))
+                else:
+                    raise ErroProtocolo(f"Mensagem inesperada do tipo {tipo}")
+        except Exception as e:
+            print(f"Erro na conexão com {id_remoto}: {e}")
+        finally:
+            self._entradas_async.pop(escritor, None)
+            envio.cancel()
+            escritor.close()
+            self._vizinho_desconectado(id_remoto)
+
+    def _ceder_conexao(self):
+        # Chamada pela sessão, no loop: fecha uma conexão recebida, de preferência de um estrangulado
+        desestrangulados = self.estrangulador.desestrangulados()
+        entradas = sorted(list(self._entradas_async.items()),
+                          key=lambda item: item[1][0] in desestrangulados)
+        if entradas:
+            entradas[0][0].close()
+
+    def _ceder_saida(self):
+        # Chamada no loop, ao reservar a vaga de outro torrent: fecha a conexão menos ocupada
+        abertas = [c for c in self._conexoes_async.values() if not c.fechada]
+        if abertas:
+            min(abertas, key=lambda c: c.em_andamento).fechar()
+
+    def _envio_encerrado(self, escritor, tarefa):
+        # Falha no envio encerra a conexão; a leitura termina com o fim do transporte
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            print(f"Erro ao enviar: {tarefa.exception()}")
+        escritor.close()
+
+    async def lidar_com_requisicao(self, escritor, id_remoto, indice_pedaco, inicio, tamanho,
+                                   chegada=None):
+        """Versão assíncrona de Par.lidar_com_requisicao"""
+        if not self.estrangulador.permitir(id_remoto):
+            self._recusas_enviadas.incrementar(1, 'estrangulado')
+            escritor.write(montar_mensagem(MSG_ESTRANGULADO,
+                                           REQUISICAO.pack(indice_pedaco, inicio, tamanho)))
+            await escritor.drain()
+            return
+
+        with self.lock_pedacos:
+            disponivel = indice_pedaco in self.meus_pedacos
+
+        if not disponivel or inicio + tamanho > self._tamanho_do_pedaco(indice_pedaco):
+            self._recusas_enviadas.incrementar(1, 'indisponivel')
+            escritor.write(montar_mensagem(MSG_REJEITADO,
+                                           REQUISICAO.pack(indice_pedaco, inicio, tamanho)))
+            await escritor.drain()
+            return
+
+        atraso = self.sessao.escalonador.upload.reservar(self.info_hash, tamanho)
+        if self.modelador is not None:
+            atraso = max(atraso, self.modelador(self.id_par, id_remoto, tamanho, chegada))
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+
+        escritor.write(cabecalho_bloco(indice_pedaco, inicio, tamanho))
+        await self._enviar_arquivo(escritor, indice_pedaco * self.tamanho_pedaco + inicio, tamanho)
+        self.taxas_upload.registrar(id_remoto, tamanho)
+        self._bytes_enviados.incrementar(tamanho, id_remoto)
+
+        if self.verboso:
+            print(f"Enviado pedaço {indice_pedaco}")
+
+    async def _enviar_arquivo(self, escritor, inicio, tamanho):
+        """Envia um trecho do arquivo com sendfile, ou lendo no pool de threads"""
+        fd = self.descritores.obter(self.caminho_arquivo)
+        if self._sendfile_disponivel:
+            enviados = self._sendfile_imediato(escritor, fd, inicio, tamanho)
+            if enviados == tamanho:
+                return
+            if self._arquivo_envio is None:
+                # sendfile usa offsets explícitos; a posição do descritor não importa
+                self._arquivo_envio = open(fd, 'rb', closefd=False)
+            try:
+                await self._loop.sendfile(escritor.transport, self._arquivo_envio,
+                                          inicio + enviados, tamanho - enviados, fallback=False)
+                return
+            except asyncio.SendfileNotAvailableError:
+                self._sendfile_disponivel = False
+
+        dados = await self._em_executor(ler_trecho, self.descritores, fd, inicio, tamanho)
+        escritor.write(dados)
+        await escritor.drain()
+
+    def _sendfile_imediato(self, escritor, fd, inicio, tamanho):
+        """Tenta enviar o trecho com uma única chamada a os.sendfile, sem passar pelo loop.
+
+        Só é seguro com o buffer do transporte vazio (senão os dados sairiam
+        antes do cabeçalho). Retorna quantos bytes foram enviados; o restante,
+        se houver, segue por loop.sendfile quando o socket aceitar mais dados.
+        """
+        if escritor.transport.get_write_buffer_size():
+            return 0
+        try:
+            return os.sendfile(escritor.get_extra_info('socket').fileno(), fd, inicio, tamanho)
+        except (BlockingIOError, InterruptedError):
+            return 0
+
+    # ----- Difusão no enxame -----
+
+    def _difundir(self, tipo, carga):
+        # Pode ser chamada de qualquer thread; a escrita acontece no loop
+        self._loop.call_soon_threadsafe(self._difundir_no_loop, tipo, carga)
+
+    def _difundir_no_loop(self, tipo, carga):
+        for conexao in list(self._conexoes_async.values()):
+            conexao.enviar(tipo, carga)
+        mensagem = montar_mensagem(tipo, carga)
+        # Nas conexões recebidas a mensagem entra na fila de envio, para não cortar um bloco
+        for _, avisos, ha_envios in self._entradas_async.values():
+            avisos.append(mensagem)
+            ha_envios.set()
+
+    def _conexoes_saida(self):
+        return {id_par: conexao for id_par, conexao in list(self._conexoes_async.items())
+                if not conexao.fechada}
+
+    def _conexoes_entrada(self):
+        return [id_remoto for id_remoto, _, _ in list(self._entradas_async.values())]
+
+    def _abrir_vizinho(self, id_par):
+        asyncio.run_coroutine_threadsafe(self._conectar_vizinho_async(id_par), self._loop)
+
+    async def _conectar_vizinho_async(self, id_par):
+        try:
+            await self._obter_conexao(id_par)
+        except SemVagasConexao:
+            pass
+        except (OSError, asyncio.TimeoutError):
+            with self._lock_enxame:
+                self._esquecer_par(id_par)
+        finally:
+            with self._lock_enxame:
+                self._conectando.discard(id_par)
+
+    # ----- Download -----
+
+    async def _laco_download(self):
+        """Versão assíncrona de Par.iniciar_download"""
+        if self.eh_semeador_inicial:
+            print(f"Semeador {self.id_par} aguardando conexões.")
+            return
+
+        ultimo_progresso = 0
+
+        while len(self.meus_pedacos) < self.total_pedacos:
+            if time.monotonic() - ultimo_progresso >= INTERVALO_ATUALIZACAO:
+                print(f"\nProgresso {self.id_par}: {len(self.meus_pedacos)}/{self.total_pedacos} ({(len(self.meus_pedacos)/self.total_pedacos)*100:.1f}%) - janela {self.controle_downloads.limite()}")
+                ultimo_progresso = time.monotonic()
+
+            self._processar_downloads_concluidos()
+            self._iniciar_novos_downloads()
+
+            # Dorme até um download terminar, chegar um pedaço novo no enxame ou o próximo ciclo
+            try:
+                await asyncio.wait_for(self._evento_download.wait(), INTERVALO_ATUALIZACAO)
+            except asyncio.TimeoutError:
+                pass
+            self._evento_download.clear()
+
+        print(f"\n*** {self.id_par}: DOWNLOAD COMPLETO! ***")
+        await self._em_executor(self._anunciar_ao_rastreador)
+
+    def _submeter_download(self, indice_pedaco, fontes):
+        return asyncio.ensure_future(self.baixar_pedaco(indice_pedaco, fontes))
+
+    async def baixar_pedaco(self, indice_pedaco, fontes):
+        """Versão assíncrona de Par.baixar_pedaco"""
+        tamanho = self._tamanho_do_pedaco(indice_pedaco)
+        buffer = self.buffers.obter()
+        pedaco = PedacoEmAndamento(indice_pedaco, tamanho, memoryview(buffer)[:tamanho])
+        progresso = asyncio.Event()
+        fontes = list(fontes)
+        lentas_notificadas = set()
+        salvo = False
+        inicio = time.monotonic()
+        try:
+            while pedaco.faltantes:
+                if self._parado.is_set():
+                    return False
+                endgame = self._em_endgame()
+                if endgame:
+                    # Todo dono atual serve, inclusive os que anunciaram o pedaço depois do início
+                    fontes += [f for f in self.seletor.donos(indice_pedaco)
+                               if f not in fontes and not self._fonte_suspensa(f)]
+                fontes = [f for f in fontes if f not in pedaco.fontes_rejeitadas]
+                if not fontes or time.monotonic() - pedaco.ultimo_progresso > TIMEOUT_CONEXAO:
+                    print(f"Falha ao baixar pedaço {indice_pedaco}: sem progresso das fontes")
+                    return False
+
+                for id_fonte in pedaco.fontes_lentas - lentas_notificadas:
+                    self._controle_fonte(id_fonte).falha()
+                    self._fontes_suspensas[id_fonte] = time.monotonic()
+                    lentas_notificadas.add(id_fonte)
+
+                ativas = [f for f in fontes if f not in pedaco.fontes_lentas] or fontes
+                if not endgame:
+                    ativas = ativas[:MAX_FONTES_POR_PEDACO]
+                for id_fonte in ativas:
+                    await self._requisitar_blocos(pedaco, id_fonte, endgame, progresso)
+
+                try:
+                    await asyncio.wait_for(progresso.wait(), INTERVALO_VERIFICACAO_BLOCOS)
+                except asyncio.TimeoutError:
+                    pass
+                progresso.clear()
+
+            hash_obtido = await self._em_executor(hash_pedaco, pedaco.buffer, self.metainfo['algoritmo'])
+            if hash_obtido != self.hashes[indice_pedaco]:
+                print(f"Pedaço {indice_pedaco} descartado: hash não confere")
+                return False
+
+            await self.salvar_pedaco(indice_pedaco, pedaco.buffer)
+            salvo = True
+            return True
+        finally:
+            for conexao, numero in pedaco.finalizar():
+                conexao.cancelar(indice_pedaco, *pedaco.blocos[numero])
+            self.buffers.devolver(buffer)
+            with self.lock_pedacos:
+                self.pedacos_sendo_baixados.discard(indice_pedaco)
+            self._pedacos_baixados.incrementar(1, 'salvo' if salvo else 'falha')
+            if salvo:
+                self._duracao_pedaco.observar(time.monotonic() - inicio)
+            else:
+                self.seletor.marcar_desejado(indice_pedaco)
+
+    async def _obter_conexao(self, id_par):
+        """Conexão persistente com o par, aberta uma única vez mesmo com pedidos simultâneos"""
+        if self._parado.is_set():
+            raise ConnectionError(f"{self.id_par} foi encerrado")
+        conexao = self._conexoes_async.get(id_par)
+        if conexao is not None and not conexao.fechada:
+            return conexao
+
+        tarefa = self._abrindo.get(id_par)
+        if tarefa is None:
+            if not self.sessao.reservar_saida(self.info_hash):
+                raise SemVagasConexao(f"Sem vaga para abrir conexão com {id_par}")
+            host, porta = id_par.rsplit(":", 1)
+            tarefa = asyncio.ensure_future(
+                ConexaoParAsync.abrir(host, int(porta), self.id_par, self.info_hash, TIMEOUT_CONEXAO,
+                                      self._mensagens_iniciais, self._processar_mensagem_enxame,
+                                      self._saida_encerrada))
+            tarefa.add_done_callback(partial(self._abertura_concluida, id_par))
+            self._abrindo[id_par] = tarefa
+        conexao = await asyncio.shield(tarefa)
+        self._conexoes_async[id_par] = conexao
+        return conexao
+
+    def _abertura_concluida(self, id_par, tarefa):
+        self._abrindo.pop(id_par, None)
+        if tarefa.cancelled() or tarefa.exception() is not None:
+            self.sessao.liberar_saida(self.info_hash)  # A vaga fica com a conexão só se ela abriu
+        elif self._parado.is_set():
+            tarefa.result().fechar()  # Abriu depois do fim de executar()
+
+    def _saida_encerrada(self, id_par):
+        self.sessao.liberar_saida(self.info_hash)
+        self._vizinho_desconectado(id_par)
+
+    async def _requisitar_blocos(self, pedaco, id_fonte, endgame, progresso):
+        """Versão assíncrona de Par._requisitar_blocos"""
+        vagas = self._controle_fonte(id_fonte).limite() - pedaco.em_andamento(id_fonte)
+        if vagas <= 0:
+            return
+
+        try:
+            conexao = await self._obter_conexao(id_fonte)
+        except SemVagasConexao:
+            return
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"Falha ao conectar a {id_fonte}: {e}")
+            pedaco.fontes_rejeitadas.add(id_fonte)
+            return
+
+        limitador = self.sessao.escalonador.download
+        previstos = min(vagas, pedaco.faltantes)
+        atraso = limitador.reservar(self.info_hash, previstos * TAMANHO_BLOCO,
+                                    INTERVALO_VERIFICACAO_BLOCOS)
+        if atraso is None:
+            return
+        if atraso > 0:
+            await asyncio.sleep(atraso)
+
+        pedido = time.monotonic()
+        numeros = pedaco.reservar_blocos(id_fonte, conexao, vagas, endgame, TIMEOUT_BLOCO)
+        limitador.devolver(self.info_hash, (previstos - len(numeros)) * TAMANHO_BLOCO)
+        for numero in numeros:
+            inicio, tamanho = pedaco.blocos[numero]
+            ao_concluir = partial(self._bloco_recebido, pedaco, numero, id_fonte, progresso, pedido)
+            try:
+                conexao.requisitar(pedaco.indice, inicio, tamanho, ao_concluir)
+            except ConnectionError:
+                pedaco.falhou(numero, id_fonte)
+
+    async def salvar_pedaco(self, indice_pedaco, dados):
+        """Versão assíncrona de Par.salvar_pedaco: a gravação roda no pool de disco"""
+        fd = self.descritores.obter(self.caminho_arquivo)
+        await self._em_executor(escrever_trecho, self.descritores, fd,
+                                indice_pedaco * self.tamanho_pedaco, dados)
+        self._registrar_pedaco_salvo(indice_pedaco)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Par da rede P2P (motor asyncio)")
+    parser.add_argument('host')
+    parser.add_argument('porta', type=int)
+    parser.add_argument('semeador', help='true para o semeador inicial')
+    parser.add_argument('--metricas', type=int, metavar='PORTA',
+                        help='porta do endpoint HTTP de métricas (0 = qualquer porta livre)')
+    parser.add_argument('--verboso', action='store_true',
+                        help='imprime cada bloco enviado, pedaço salvo e lote de downloads')
+    parser.add_argument('--arquivo', action='append', metavar='NOME',
+                        help=f'arquivo (torrent) a semear ou baixar; repita para vários '
+                             f'na mesma porta (padrão: {NOME_ARQUIVO})')
+    parser.add_argument('--taxa-upload', type=float, metavar='KB/S',
+                        help='limite de envio do processo, somando todos os torrents')
+    parser.add_argument('--taxa-download', type=float, metavar='KB/S',
+                        help='limite de recepção do processo, somando todos os torrents')
+    args = parser.parse_args()
+
+    aumentar_limite_descritores()
+    sessao = SessaoAsync(args.host, args.porta,
+                         taxa_upload=args.taxa_upload and args.taxa_upload * 1024,
+                         taxa_download=args.taxa_download and args.taxa_download * 1024,
+                         porta_metricas=args.metricas, verboso=args.verboso or None)
+    pares = [ParAsync(args.host, args.porta, args.semeador.lower() == 'true', nome_arquivo=nome,
+                      sessao=sessao)
+             for nome in args.arquivo or [NOME_ARQUIVO]]
+
+    async def executar_todos():
+        await asyncio.gather(*(par.executar() for par in pares))
+
+    try:
+        asyncio.run(executar_todos())
+    except KeyboardInterrupt:
+        print("Encerrando o par...")
@@ -0,0 +1,155 @@
+"""Protocolo de fio entre pares, com mensagens prefixadas pelo tamanho.
+
+Cada mensagem é <tamanho:uint32><tipo:uint8><carga> em big-endian, onde
+tamanho conta o byte de tipo mais a carga. As conexões são persistentes:
+várias requisições podem ser enviadas sem esperar as respostas anteriores
+(pipelining), e o servidor responde na ordem em que as recebeu, exceto
+pelas requisições canceladas antes de serem atendidas.
+
+Além das requisições, os dois lados de uma conexão trocam informações do
+enxame: o bitfield completo logo após o handshake, um TENHO (HAVE) a cada
+pedaço obtido e listas de pares conhecidos (PEX).
+
+O handshake traz o info_hash do torrent: um mesmo processo atende vários
+torrents em uma única porta, e cada conexão pertence a um deles.
+"""
+import asyncio
+import select
+import socket
+import struct
+import time
+
+# Tipos de mensagem
+MSG_HANDSHAKE = 0    # carga: info_hash do torrent (20 bytes) + id do par remetente (utf-8)
+MSG_REQUISICAO = 1   # carga: REQUISICAO (indice, inicio, tamanho)
+MSG_BLOCO = 2        # carga: BLOCO (indice, inicio) + dados
+MSG_REJEITADO = 3    # carga: REQUISICAO da requisição que não pôde ser atendida
+MSG_CANCELAR = 4     # carga: REQUISICAO de uma requisição que não é mais necessária
+MSG_ESTRANGULADO = 5  # carga: REQUISICAO recusada porque o remetente não está sendo atendido
+MSG_BITFIELD = 6     # carga: bitfield dos pedaços do remetente
+MSG_TENHO = 7        # carga: TENHO (indice) de um pedaço que o remetente acabou de obter
+MSG_PARES = 8        # carga: ids "host:porta" de pares conhecidos, separados por '\n' (PEX)
+MENSAGENS_ENXAME = (MSG_BITFIELD, MSG_TENHO, MSG_PARES)  # Trocadas nos dois sentidos
+
+CABECALHO = struct.Struct('>IB')
+REQUISICAO = struct.Struct('>III')
+BLOCO = struct.Struct('>II')
+TENHO = struct.Struct('>I')
+TAMANHO_INFO_HASH = 20  # SHA-1 das informações do metainfo
+
+TAMANHO_MAXIMO_MENSAGEM = 4 * 1024 * 1024 + BLOCO.size + 1  # Limite defensivo
+
+
+class ErroProtocolo(Exception):
+    """Mensagem malformada ou inesperada recebida de outro par"""
+
+
+def receber_exato(sock, tamanho):
+    """Recebe exatamente `tamanho` bytes ou levanta ConnectionError"""
+    dados = bytearray(tamanho)
+    visao = memoryview(dados)
+    recebidos = 0
+    while recebidos < tamanho:
+        n = sock.recv_into(visao[recebidos:])
+        if not n:
+            raise ConnectionError("Conexão encerrada pelo par")
+        recebidos += n
+    return bytes(dados)
+
+
+def receber_cabecalho(sock):
+    """Recebe o cabeçalho da próxima mensagem: (tipo, tamanho da carga).
+
+    Retorna None se a conexão foi encerrada de forma limpa entre mensagens.
+    """
+    try:
+        primeiro = sock.recv(CABECALHO.size)
+    except ConnectionResetError:
+        return None
+    if not primeiro:
+        return None
+    if len(primeiro) < CABECALHO.size:
+        primeiro += receber_exato(sock, CABECALHO.size - len(primeiro))
+
+    tamanho, tipo = CABECALHO.unpack(primeiro)
+    if tamanho < 1 or tamanho > TAMANHO_MAXIMO_MENSAGEM:
+        raise ErroProtocolo(f"Tamanho de mensagem inválido: {tamanho}")
+    return tipo, tamanho - 1
+
+
+async def ler_cabecalho(leitor):
+    """Versão asyncio de receber_cabecalho, lendo de um asyncio.StreamReader.
+
+    A leitura é atômica: se for cancelada (ex: por timeout), nenhum byte é consumido.
+    """
+    try:
+        dados = await leitor.readexactly(CABECALHO.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Conexão encerrada no meio de uma mensagem")
+
+    tamanho, tipo = CABECALHO.unpack(dados)
+    if tamanho < 1 or tamanho > TAMANHO_MAXIMO_MENSAGEM:
+        raise ErroProtocolo(f"Tamanho de mensagem inválido: {tamanho}")
+    return tipo, tamanho - 1
+
+
+async def ler_exato(leitor, tamanho):
+    """Versão asyncio de receber_exato"""
+    try:
+        return await leitor.readexactly(tamanho)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Conexão encerrada pelo par")
+
+
+def montar_mensagem(tipo, carga=b''):
+    """Monta uma mensagem completa (cabeçalho + carga)"""
+    return CABECALHO.pack(len(carga) + 1, tipo) + carga
+
+
+def enviar_mensagem(sock, tipo, carga=b''):
+    """Envia uma mensagem completa"""
+    sock.sendall(montar_mensagem(tipo, carga))
+
+
+def enviar_com_prazo(sock, dados, prazo):
+    """Como sendall, mas levanta socket.timeout se o envio todo passar de `prazo` segundos.
+
+    O timeout do socket vale para cada espera isolada, e um par que lê aos
+    poucos nunca o atinge; aqui o prazo conta o envio inteiro.
+    """
+    limite = time.monotonic() + prazo
+    dados = memoryview(dados)
+    while dados:
+        restante = limite - time.monotonic()
+        if restante <= 0 or not select.select([], [sock], [], restante)[1]:
+            raise socket.timeout("Prazo de envio esgotado")
+        dados = dados[sock.send(dados):]
+
+
+def codificar_handshake(info_hash, id_par):
+    """Carga de uma mensagem MSG_HANDSHAKE; info_hash em hexadecimal, como no metainfo"""
+    return bytes.fromhex(info_hash) + id_par.encode()
+
+
+def decodificar_handshake(carga):
+    """(info_hash em hexadecimal, id do par) de uma mensagem MSG_HANDSHAKE"""
+    if len(carga) < TAMANHO_INFO_HASH:
+        raise ErroProtocolo("Handshake sem info_hash")
+    return carga[:TAMANHO_INFO_HASH].hex(), carga[TAMANHO_INFO_HASH:].decode()
+
+
+def codificar_pares(ids_pares):
+    """Carga de uma mensagem MSG_PARES"""
+    return '\n'.join(ids_pares).encode()
+
+
+def decodificar_pares(carga):
+    """Lista de ids de uma mensagem MSG_PARES"""
+    return [id_par for id_par in carga.decode().split('\n') if id_par]
+
+
+def cabecalho_bloco(indice, inicio, tamanho_dados):
+    """Cabeçalho de uma mensagem MSG_BLOCO cujos dados serão enviados em seguida"""
+    return CABECALHO.pack(BLOCO.size + tamanho_dados + 1, MSG_BLOCO) + BLOCO.pack(indice, inicio)
@@ -1,124 +1,487 @@
-﻿from xmlrpc.server import SimpleXMLRPCServer
+﻿from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xmlrpc.client import Binary
+from socketserver import ThreadingMixIn
+from collections import defaultdict, deque
+from itertools import islice
+import heapq
+import sys
 import threading
 import time
 from datetime import datetime
 import os
 
+from bitfield import (contar_pedacos, criar_bitfield, dados_binarios, definir_pedaco,
+                      diferenca_bitfields, pedacos_do_bitfield, tamanho_bitfield)
+from metricas import (BALDES_ESPERA_TRAVA, CAMINHO_METRICAS, RegistroMetricas, TravaMedida,
+                      responder_get)
+from rpc_json import CAMINHO_JSON, codificar, decodificar
+
+# Configurações do protocolo de anúncio incremental
+MAX_HISTORICO_ALTERACOES = 4096  # Alterações mantidas para responder deltas
+MAX_ALTERACOES_DELTA = 1024      # Acima disso, um snapshot completo é mais barato
+TEMPO_EXPIRACAO_PAR = 180        # Par sem anunciar há esse tempo sai do enxame (segundos)
+INTERVALO_EXPIRACAO = 5          # Intervalo mínimo entre varreduras de pares expirados (segundos)
+ENXAME_PADRAO = ''               # info_hash assumido quando o par não informa um (um único enxame)
+# O rastreador não conhece o total de pedaços do torrent: índices são aceitos até este limite
+MAX_PEDACOS = 1 << 20
+
+INTERVALO_INTERFACE = 0.5        # Intervalo mínimo entre renderizações do painel (segundos)
+
+# Configurações do servidor
+TAMANHO_FILA_CONEXOES = 128      # Conexões pendentes aceitas pelo socket do servidor
+TIMEOUT_CONEXAO_OCIOSA = 60      # Conexões keep-alive ociosas são fechadas após (segundos)
+
+def validar_pedacos(pedacos):
+    # Rejeita índices que não são inteiros em [0, MAX_PEDACOS), antes de tocar no bitfield
+    pedacos = list(pedacos)
+    for pedaco in pedacos:
+        if type(pedaco) is not int or not 0 <= pedaco < MAX_PEDACOS:
+            raise ValueError(f"Índice de pedaço inválido: {pedaco!r}")
+    return pedacos
+
+def validar_bitfield(bitfield):
+    # Rejeita bitfields maiores que o necessário para MAX_PEDACOS pedaços
+    bitfield = bytearray(dados_binarios(bitfield))
+    if len(bitfield) > tamanho_bitfield(MAX_PEDACOS):
+        raise ValueError(f"Bitfield de {len(bitfield)} bytes excede o limite de pedaços")
+    return bitfield
+
+class Enxame:
+    """Pares de um torrent e os pedaços de cada um.
+
+    Não tem trava própria: os métodos são chamados com a trava do
+    Rastreador adquirida.
+    """
+
+    def __init__(self):
+        self.pares = {}  # Dicionário de pares conectados {id_par: bitfield}
+        self.contagem = {}  # Quantidade de pedaços de cada par {id_par: int}
+        self.donos = defaultdict(set)  # Índice invertido {pedaco: {id_par}}
+        self.ultimo_contato = {}  # Instante do último anúncio de cada par {id_par: float}
+        self.versao = 0  # Versão do estado, incrementada a cada alteração
+        # Histórico de alterações [(versao, id_par, ganhos, perdidos)]
+        self.historico = deque(maxlen=MAX_HISTORICO_ALTERACOES)
+
+    def atualizar_par(self, id_par, bitfield):
+        # Substitui o bitfield do peer e ajusta o índice invertido apenas
+        # nos pedaços que mudaram
+        novo_par = id_par not in self.pares
+        antigo = self.pares.get(id_par, b'')
+        ganhos, perdidos = diferenca_bitfields(antigo, bitfield)
+        for pedaco in ganhos:
+            self.donos[pedaco].add(id_par)
+        for pedaco in perdidos:
+            donos = self.donos[pedaco]
+            donos.discard(id_par)
+            if not donos:
+                del self.donos[pedaco]
+
+        self.pares[id_par] = bitfield
+        self.contagem[id_par] = contar_pedacos(bitfield)
+        self.ultimo_contato[id_par] = time.monotonic()
+        self.registrar_alteracao(id_par, ganhos, perdidos, novo_par)
+
+    def adicionar_pedacos(self, id_par, pedacos_novos):
+        # Acrescenta pedaços ao bitfield do peer (anúncio incremental)
+        novo_par = id_par not in self.pares
+        bitfield = self.pares.setdefault(id_par, bytearray())
+        ganhos = []
+        for pedaco in pedacos_novos:
+            donos = self.donos[pedaco]
+            if id_par not in donos:
+                definir_pedaco(bitfield, pedaco)
+                donos.add(id_par)
+                ganhos.append(pedaco)
+        self.contagem[id_par] = self.contagem.get(id_par, 0) + len(ganhos)
+        self.ultimo_contato[id_par] = time.monotonic()
+        self.registrar_alteracao(id_par, ganhos, novo_par=novo_par)
+
+    def expirar_pares(self, agora):
+        # Remove pares que pararam de anunciar; a saída entra no histórico como
+        # perda de todos os seus pedaços
+        expirados = [id_par for id_par, instante in self.ultimo_contato.items()
+                     if agora - instante > TEMPO_EXPIRACAO_PAR]
+        for id_par in expirados:
+            perdidos = pedacos_do_bitfield(self.pares.pop(id_par))
+            for pedaco in perdidos:
+                donos = self.donos[pedaco]
+                donos.discard(id_par)
+                if not donos:
+                    del self.donos[pedaco]
+            del self.contagem[id_par]
+            del self.ultimo_contato[id_par]
+            self.registrar_alteracao(id_par, (), perdidos)
+
+    def registrar_alteracao(self, id_par, ganhos, perdidos=(), novo_par=False):
+        # Nova versão do estado no histórico
+        if not ganhos and not perdidos and not novo_par:
+            return
+        self.versao += 1
+        self.historico.append((self.versao, id_par, list(ganhos), list(perdidos)))
+
+    def alteracoes_desde(self, versao):
+        # Monta resposta com as alterações posteriores a uma versão conhecida,
+        # recorrendo a um snapshot completo quando o intervalo é grande demais
+        primeira_versao = self.historico[0][0] if self.historico else self.versao + 1
+        faltantes = self.versao - versao
+        if versao < primeira_versao - 1 or faltantes < 0 or faltantes > MAX_ALTERACOES_DELTA:
+            return {
+                'versao': self.versao,
+                'completo': True,
+                'pares': {id_par: Binary(bytes(bitfield))
+                          for id_par, bitfield in self.pares.items()},
+            }
+
+        # Saldo de cada par, aplicando as alterações na ordem das versões: um
+        # ganho seguido de perda do mesmo pedaço (ou o contrário) se anula
+        saldos = {}  # {id_par: {pedaco: True (ganho) ou False (perda)}}
+        for _, id_par, pedacos_ganhos, pedacos_perdidos in islice(
+                self.historico, versao - primeira_versao + 1, None):
+            saldo = saldos.setdefault(id_par, {})
+            for pedaco in pedacos_ganhos:
+                if saldo.pop(pedaco, None) is None:
+                    saldo[pedaco] = True
+            for pedaco in pedacos_perdidos:
+                if saldo.pop(pedaco, None) is None:
+                    saldo[pedaco] = False
+
+        # Pares que não estão mais no enxame vão só em 'saidas'
+        ganhos, perdidos, saidas = {}, {}, []
+        for id_par, saldo in saldos.items():
+            if id_par not in self.pares:
+                saidas.append(id_par)
+                continue
+            ganhos[id_par] = [pedaco for pedaco, ganho in saldo.items() if ganho]
+            pedacos_perdidos = [pedaco for pedaco, ganho in saldo.items() if not ganho]
+            if pedacos_perdidos:
+                perdidos[id_par] = pedacos_perdidos
+        return {
+            'versao': self.versao,
+            'completo': False,
+            'ganhos': ganhos,
+            'perdidos': perdidos,
+            'saidas': saidas,
+        }
+
 class Rastreador:
     def __init__(self):
-        # Estruturas para gerenciar pares e estatísticas
-        self._pares = {}  # Dicionário de pares conectados {id_par: [pedacos]}
-        self._trava = threading.Lock()  # Lock para acesso thread-safe
+        # Um enxame por torrent {info_hash: Enxame}; pares que não informam
+        # o info_hash ficam no enxame ENXAME_PADRAO
+        self._enxames = {}
+        self._ultima_expiracao = time.monotonic()
+
+        # Métricas expostas em GET /metrics no mesmo servidor HTTP das RPCs
+        self.metricas = RegistroMetricas()
+        self._duracao_rpc = self.metricas.histograma(
+            'rastreador_rpc_segundos', 'Duração das chamadas RPC', rotulos=('metodo',))
+        self._erros_rpc = self.metricas.contador(
+            'rastreador_rpc_erros_total', 'Chamadas RPC que terminaram em erro', ('metodo',))
+        espera_trava = self.metricas.histograma(
+            'rastreador_espera_trava_segundos', 'Espera para adquirir a trava do estado',
+            BALDES_ESPERA_TRAVA)
+        self.metricas.medidor('rastreador_enxames', 'Enxames (torrents) com pares',
+                              lambda: len(self._enxames))
+        self.metricas.medidor('rastreador_pares', 'Pares em todos os enxames',
+                              lambda: sum(len(e.pares) for e in list(self._enxames.values())))
+        self.metricas.medidor('rastreador_versao', 'Soma das versões dos enxames',
+                              self._versao_total)
+
+        self._trava = TravaMedida(threading.Lock(), espera_trava)  # Lock para acesso thread-safe
         self._stats = {
             'total_registros': 0,
             'total_consultas': 0,
             'inicio': datetime.now(),
             'historico_pedacos': {}  # Rastreia pedaços mais solicitados
         }
-        
-    def _limpar_tela(self):
-        # Limpa o terminal (funciona em Windows e Unix)
-        os.system('cls' if os.name == 'nt' else 'clear')
-    
-    def _mostrar_interface(self):
-        # Exibe interface visual do rastreador
-        tempo_ativo = datetime.now() - self._stats['inicio']
-        
-        self._limpar_tela()
-        print("╭─────────────────────────────────────────────────────────╮")
-        print("│                    🔗 RASTREADOR P2P                    │")
-        print("├─────────────────────────────────────────────────────────┤")
-        print(f"│ ⏱️  Tempo ativo: {str(tempo_ativo).split('.')[0]:<25}               │")
-        print(f"│ 👥 Pares conectados: {len(self._pares):<15}                    │")
-        print(f"│ 📊 Total de registros: {self._stats['total_registros']:<13}                    │")
-        print(f"│ 🔍 Total de consultas: {self._stats['total_consultas']:<13}                    │")
-        print("├─────────────────────────────────────────────────────────┤")
-        
-        # Lista pares ativos com barras de progresso
-        if self._pares:
-            print("│                      PARES ATIVOS                       │")
-            print("├─────────────────────────────────────────────────────────┤")
-            for i, (id_par, pedacos) in enumerate(self._pares.items(), 1):
-                status_bar = self._criar_barra_progresso(len(pedacos), 20)
-                print(f"│ {i:2d}. {id_par:<20} [{status_bar}] {len(pedacos):3d}     │")
-        else:
-            print("│           🔍 Aguardando pares se conectarem...          │")
-        
-        # Mostra pedaços mais populares
-        print("├─────────────────────────────────────────────────────────┤")
-        if self._stats['historico_pedacos']:
-            print("│                  PEDAÇOS POPULARES                      │")
-            print("├─────────────────────────────────────────────────────────┤")
-            pedacos_ordenados = sorted(self._stats['historico_pedacos'].items(), 
-                                     key=lambda x: x[1], reverse=True)[:5]
-            for pedaco, count in pedacos_ordenados:
-                print(f"│ Pedaço {pedaco:3d}: {count:3d} consultas{'':23}│")
-        
-        print("╰─────────────────────────────────────────────────────────╯")
-        print("\n💡 Pressione Ctrl+C para encerrar o servidor")
-    
-    def _criar_barra_progresso(self, valor, max_largura=20):
-        # Cria barra de progresso visual baseada na completude do peer
-        if valor == 0:
-            return "░" * max_largura
-        
-        # Calcula porcentagem baseada no peer mais completo
-        max_pedacos = max([len(p) for p in self._pares.values()] + [1])
-        porcentagem = min(valor / max_pedacos, 1.0)
-        
-        blocos_preenchidos = int(porcentagem * max_largura)
-        blocos_vazios = max_largura - blocos_preenchidos
-        
-        return "█" * blocos_preenchidos + "░" * blocos_vazios
 
-    def registrar(self, id_par, pedacos):
+    def _versao_total(self):
+        return sum(enxame.versao for enxame in list(self._enxames.values()))
+
+    def _enxame(self, info_hash):
+        # Enxame do torrent, criado no primeiro anúncio (deve ser chamado com a trava adquirida)
+        enxame = self._enxames.get(info_hash)
+        if enxame is None:
+            enxame = self._enxames[info_hash] = Enxame()
+        return enxame
+
+    def _consultar_enxame(self, info_hash):
+        # Enxame para consultas: um torrent desconhecido é um enxame vazio, que não é guardado
+        return self._enxames.get(info_hash) or Enxame()
+
+    def _snapshot_estatisticas(self):
+        # Cópia barata do estado exibido pelo painel, feita sob a trava
+        with self._trava:
+            historico = self._stats['historico_pedacos']
+            varios = len(self._enxames) > 1
+            return {
+                'versao': self._versao_total(),
+                'total_registros': self._stats['total_registros'],
+                'total_consultas': self._stats['total_consultas'],
+                'inicio': self._stats['inicio'],
+                'contagem': [(f"{info_hash[:4]} {id_par}" if varios else id_par, total)
+                             for info_hash, enxame in self._enxames.items()
+                             for id_par, total in enxame.contagem.items()],
+                'populares': heapq.nlargest(5, historico.items(), key=lambda x: x[1]),
+            }
+
+    def _expirar_pares(self):
+        # Expira pares de todos os enxames e descarta os que ficaram vazios
+        # (deve ser chamado com a trava adquirida)
+        agora = time.monotonic()
+        if agora - self._ultima_expiracao < INTERVALO_EXPIRACAO:
+            return
+        self._ultima_expiracao = agora
+        for info_hash, enxame in list(self._enxames.items()):
+            enxame.expirar_pares(agora)
+            if not enxame.pares:
+                del self._enxames[info_hash]
+
+    def _dispatch(self, metodo, parametros):
+        # Chamado pelo servidor (XML-RPC e JSON) para cada RPC: mede a duração por método
+        funcao = None if metodo.startswith('_') else getattr(self, metodo, None)
+        if not callable(funcao):
+            raise Exception(f'method "{metodo}" is not supported')
+        inicio = time.perf_counter()
+        try:
+            return funcao(*parametros)
+        except Exception:
+            self._erros_rpc.incrementar(1, metodo)
+            raise
+        finally:
+            self._duracao_rpc.observar(time.perf_counter() - inicio, metodo)
+
+    def registrar(self, id_par, pedacos, info_hash=ENXAME_PADRAO):
         # Registra novo peer ou atualiza lista de pedaços de um peer existente
+        bitfield = criar_bitfield(validar_pedacos(pedacos))
         with self._trava:
-            self._pares[id_par] = pedacos
+            self._enxame(info_hash).atualizar_par(id_par, bitfield)
             self._stats['total_registros'] += 1
-            self._mostrar_interface()
         return True
 
-    def obter_pares(self):
+    def registrar_bitfield(self, id_par, bitfield, info_hash=ENXAME_PADRAO):
+        # Variante de registrar que recebe os pedaços como bitfield binário
+        bitfield = validar_bitfield(bitfield)
+        with self._trava:
+            self._enxame(info_hash).atualizar_par(id_par, bitfield)
+            self._stats['total_registros'] += 1
+        return True
+
+    def anunciar(self, id_par, pedacos_novos, versao_conhecida, info_hash=ENXAME_PADRAO):
+        # Anúncio incremental: recebe apenas os pedaços obtidos desde o último
+        # anúncio e devolve as alterações do enxame desde versao_conhecida
+        pedacos_novos = validar_pedacos(pedacos_novos)
+        with self._trava:
+            self._expirar_pares()
+            enxame = self._enxames.get(info_hash)
+            if (enxame is None or id_par not in enxame.pares) and versao_conhecida:
+                # Rastreador não conhece o estado completo do peer (ex: reiniciou)
+                return {'reenviar': True}
+
+            enxame = self._enxame(info_hash)
+            enxame.adicionar_pedacos(id_par, pedacos_novos)
+            self._stats['total_registros'] += 1
+            return enxame.alteracoes_desde(versao_conhecida)
+
+    def obter_alteracoes(self, versao_conhecida, info_hash=ENXAME_PADRAO):
+        # Retorna as alterações do enxame desde versao_conhecida, sem anunciar
+        with self._trava:
+            self._expirar_pares()
+            self._stats['total_consultas'] += 1
+            return self._consultar_enxame(info_hash).alteracoes_desde(versao_conhecida)
+
+    def obter_enxames(self):
+        # Retorna os enxames ativos com a quantidade de pares de cada um
+        with self._trava:
+            self._stats['total_consultas'] += 1
+            return {info_hash: len(enxame.pares) for info_hash, enxame in self._enxames.items()}
+
+    def obter_pares(self, info_hash=ENXAME_PADRAO):
         # Retorna lista de todos os pares conectados
         with self._trava:
             self._stats['total_consultas'] += 1
-            self._mostrar_interface()
-            return self._pares.copy()
+            return {id_par: pedacos_do_bitfield(bitfield)
+                    for id_par, bitfield in self._consultar_enxame(info_hash).pares.items()}
+
+    def obter_pares_bitfield(self, info_hash=ENXAME_PADRAO):
+        # Retorna os pares conectados com seus pedaços em bitfields compactos
+        with self._trava:
+            self._stats['total_consultas'] += 1
+            return {id_par: Binary(bytes(bitfield))
+                    for id_par, bitfield in self._consultar_enxame(info_hash).pares.items()}
 
-    def obter_donos_pedaco(self, indice_pedaco):
+    def obter_donos_pedaco(self, indice_pedaco, info_hash=ENXAME_PADRAO):
         # Retorna lista de pares que possuem um pedaço específico
+        validar_pedacos([indice_pedaco])
         with self._trava:
             self._stats['total_consultas'] += 1
             
             # Atualiza estatísticas de popularidade do pedaço
-            if indice_pedaco not in self._stats['historico_pedacos']:
-                self._stats['historico_pedacos'][indice_pedaco] = 0
-            self._stats['historico_pedacos'][indice_pedaco] += 1
-            
-            # Encontra pares que possuem o pedaço
-            donos = [id_par for id_par, pedacos in self._pares.items() 
-                    if indice_pedaco in pedacos]
+            chave = indice_pedaco if info_hash == ENXAME_PADRAO else f"{info_hash[:4]}:{indice_pedaco}"
+            if chave not in self._stats['historico_pedacos']:
+                self._stats['historico_pedacos'][chave] = 0
+            self._stats['historico_pedacos'][chave] += 1
             
-            self._mostrar_interface()
+            # Consulta o índice invertido de donos do pedaço
+            donos = list(self._consultar_enxame(info_hash).donos.get(indice_pedaco, ()))
             return donos
 
-def executar_rastreador(host='localhost', porta=8000):
-    # Inicia servidor XML-RPC
-    servidor = SimpleXMLRPCServer((host, porta), allow_none=True)
-    rastreador = Rastreador()
+class PainelRastreador:
+    """Renderiza o painel do rastreador em uma thread própria, com taxa limitada"""
+
+    def __init__(self, rastreador, intervalo=INTERVALO_INTERFACE):
+        self.rastreador = rastreador
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._ultimo_estado = None
+
+    def iniciar(self):
+        threading.Thread(target=self._executar, daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+    def _executar(self):
+        # Renderiza no máximo uma vez por intervalo, e só se algo mudou
+        # (o relógio de tempo ativo é atualizado a cada segundo)
+        while not self._parar.is_set():
+            snapshot = self.rastreador._snapshot_estatisticas()
+            estado = (snapshot['versao'], snapshot['total_registros'],
+                      snapshot['total_consultas'], int(time.time()))
+            if estado != self._ultimo_estado:
+                self._ultimo_estado = estado
+                self.mostrar(snapshot)
+            self._parar.wait(self.intervalo)
+
+    def _limpar_tela(self):
+        # Limpa o terminal (sequência ANSI evita criar um processo por renderização)
+        if os.name == 'nt':
+            os.system('cls')
+            return ''
+        return "\033[H\033[2J"
+
+    def mostrar(self, snapshot):
+        # Exibe interface visual do rastreador a partir de um snapshot
+        tempo_ativo = datetime.now() - snapshot['inicio']
+        contagem = snapshot['contagem']
+        max_pedacos = max([total for _, total in contagem] + [1])
+
+        linhas = [
+            self._limpar_tela() + "╭─────────────────────────────────────────────────────────╮",
+            "│                    🔗 RASTREADOR P2P                    │",
+            "├─────────────────────────────────────────────────────────┤",
+            f"│ ⏱️  Tempo ativo: {str(tempo_ativo).split('.')[0]:<25}               │",
+            f"│ 👥 Pares conectados: {len(contagem):<15}                    │",
+            f"│ 📊 Total de registros: {snapshot['total_registros']:<13}                    │",
+            f"│ 🔍 Total de consultas: {snapshot['total_consultas']:<13}                    │",
+            "├─────────────────────────────────────────────────────────┤",
+        ]
+
+        # Lista pares ativos com barras de progresso
+        if contagem:
+            linhas.append("│                      PARES ATIVOS                       │")
+            linhas.append("├─────────────────────────────────────────────────────────┤")
+            for i, (id_par, total) in enumerate(contagem, 1):
+                status_bar = self._criar_barra_progresso(total, max_pedacos, 20)
+                linhas.append(f"│ {i:2d}. {id_par:<20} [{status_bar}] {total:3d}     │")
+        else:
+            linhas.append("│           🔍 Aguardando pares se conectarem...          │")
+
+        # Mostra pedaços mais populares
+        linhas.append("├─────────────────────────────────────────────────────────┤")
+        if snapshot['populares']:
+            linhas.append("│                  PEDAÇOS POPULARES                      │")
+            linhas.append("├─────────────────────────────────────────────────────────┤")
+            for pedaco, count in snapshot['populares']:
+                linhas.append(f"│ Pedaço {pedaco!s:>3}: {count:3d} consultas{'':23}│")
+
+        linhas.append("╰─────────────────────────────────────────────────────────╯")
+        linhas.append("\n💡 Pressione Ctrl+C para encerrar o servidor")
+        # Uma única escrita por quadro
+        sys.stdout.write("\n".join(linhas) + "\n")
+        sys.stdout.flush()
+
+    def _criar_barra_progresso(self, valor, max_pedacos, max_largura=20):
+        # Cria barra de progresso visual baseada na completude do peer
+        if valor == 0:
+            return "░" * max_largura
+
+        # Calcula porcentagem baseada no peer mais completo
+        porcentagem = min(valor / max_pedacos, 1.0)
+
+        blocos_preenchidos = int(porcentagem * max_largura)
+        blocos_vazios = max_largura - blocos_preenchidos
+
+        return "█" * blocos_preenchidos + "░" * blocos_vazios
+
+class ManipuladorRastreador(SimpleXMLRPCRequestHandler):
+    # HTTP/1.1 mantém a conexão aberta entre chamadas (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Respostas pequenas não esperam ACK atrasado
+    rpc_paths = ('/', '/RPC2', CAMINHO_JSON)
+    timeout = TIMEOUT_CONEXAO_OCIOSA
+
+    def do_GET(self):
+        # Métricas (/metrics) e perfil por amostragem (/perfil?segundos=N)
+        responder_get(self, self.server.instance.metricas)
+
+    def do_POST(self):
+        if self.path != CAMINHO_JSON:
+            return super().do_POST()
+
+        # Endpoint JSON: mesmo despacho das chamadas XML-RPC
+        try:
+            tamanho = int(self.headers['content-length'])
+            requisicao = decodificar(self.rfile.read(tamanho))
+            resultado = self.server._dispatch(requisicao['metodo'], requisicao['parametros'])
+            resposta = codificar({'resultado': resultado})
+        except Exception as e:
+            resposta = codificar({'erro': f"{type(e).__name__}: {e}"})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+class ServidorRastreadorConcorrente(ThreadingMixIn, SimpleXMLRPCServer):
+    # Atende cada conexão em sua própria thread
+    daemon_threads = True
+    request_queue_size = TAMANHO_FILA_CONEXOES
+
+def criar_servidor(host='localhost', porta=8000, rastreador=None, concorrente=True):
+    # Cria o servidor do rastreador; concorrente=False usa o servidor
+    # original de uma requisição por vez, sem keep-alive
+    rastreador = rastreador or Rastreador()
+    if concorrente:
+        servidor = ServidorRastreadorConcorrente((host, porta), ManipuladorRastreador,
+                                                 allow_none=True, logRequests=False)
+    else:
+        servidor = SimpleXMLRPCServer((host, porta), allow_none=True, logRequests=False)
     servidor.register_instance(rastreador)
-    
-    # Mostra interface inicial
-    rastreador._mostrar_interface()
-    print(f"\n🚀 Servidor iniciado em http://{host}:{porta}")
-    
+    return servidor, rastreador
+
+def executar_rastreador(host='localhost', porta=8000, interface=True):
+    # Inicia servidor XML-RPC (sem log por requisição, que também é I/O de terminal)
+    servidor, rastreador = criar_servidor(host, porta)
+
+    # Painel é renderizado fora do caminho das RPCs; no modo headless não há painel
+    painel = None
+    if interface:
+        painel = PainelRastreador(rastreador)
+        painel.mostrar(rastreador._snapshot_estatisticas())
+    print(f"\n🚀 Servidor iniciado em http://{host}:{porta} (JSON em {CAMINHO_JSON}, "
+          f"métricas em {CAMINHO_METRICAS})")
+    if painel:
+        painel.iniciar()
+
     try:
         # Mantém servidor executando
         servidor.serve_forever()
     except KeyboardInterrupt:
         print("\n\n🔴 Encerrando servidor...")
-        servidor.shutdown()
+        if painel:
+            painel.parar()
+        servidor.server_close()
 
 if __name__ == "__main__":
-    executar_rastreador()
\ No newline at end of file
+    executar_rastreador(interface='--sem-interface' not in sys.argv[1:])
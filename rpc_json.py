@@ -0,0 +1,92 @@
+"""Endpoint JSON compacto do rastreador, alternativo ao XML-RPC.
+
+Requisição: {"metodo": "anunciar", "parametros": [...]}
+Resposta:   {"resultado": ...} ou {"erro": "mensagem"}
+
+Valores binários (bitfields) trafegam como {"__binario__": "<base64>"}.
+"""
+import base64
+import http.client
+import json
+import xmlrpc.client
+from urllib.parse import urlsplit
+
+CAMINHO_JSON = '/json'  # Caminho HTTP do endpoint JSON no rastreador
+TIMEOUT_RPC = 10        # Timeout das chamadas ao rastreador (segundos)
+
+
+def _padrao(valor):
+    # Serializa tipos que o JSON não conhece
+    if isinstance(valor, xmlrpc.client.Binary):
+        valor = valor.data
+    if isinstance(valor, (bytes, bytearray)):
+        return {'__binario__': base64.b64encode(valor).decode('ascii')}
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _gancho(objeto):
+    # Restaura valores binários como xmlrpc.client.Binary, como no XML-RPC
+    if len(objeto) == 1 and '__binario__' in objeto:
+        return xmlrpc.client.Binary(base64.b64decode(objeto['__binario__']))
+    return objeto
+
+
+def codificar(valor):
+    """Serializa um valor para o corpo de uma mensagem JSON"""
+    return json.dumps(valor, default=_padrao, separators=(',', ':')).encode('utf-8')
+
+
+def decodificar(dados):
+    """Desserializa o corpo de uma mensagem JSON"""
+    return json.loads(dados, object_hook=_gancho)
+
+
+class ClienteRastreadorJSON:
+    """Proxy para o endpoint JSON com conexão HTTP persistente (keep-alive).
+
+    Assim como xmlrpc.client.ServerProxy, não deve ser compartilhado entre threads.
+    """
+
+    def __init__(self, url, timeout=None):
+        partes = urlsplit(url)
+        self._host = partes.hostname
+        self._porta = partes.port or 80
+        self._caminho = partes.path or CAMINHO_JSON
+        self._timeout = TIMEOUT_RPC if timeout is None else timeout
+        self._conexao = None
+
+    def _chamar(self, metodo, parametros):
+        corpo = codificar({'metodo': metodo, 'parametros': list(parametros)})
+        for tentativa in range(2):
+            if self._conexao is None:
+                self._conexao = http.client.HTTPConnection(self._host, self._porta,
+                                                           timeout=self._timeout)
+            try:
+                self._conexao.request('POST', self._caminho, corpo,
+                                      {'Content-Type': 'application/json'})
+                resposta = decodificar(self._conexao.getresponse().read())
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Servidor fechou a conexão ociosa: reconecta uma vez
+                self._conexao.close()
+                self._conexao = None
+                if tentativa:
+                    raise
+
+        if 'erro' in resposta:
+            raise xmlrpc.client.Fault(1, resposta['erro'])
+        return resposta['resultado']
+
+    def __getattr__(self, metodo):
+        if metodo.startswith('_'):
+            raise AttributeError(metodo)
+        return lambda *parametros: self._chamar(metodo, parametros)
+
+
+def conectar_rastreador(url):
+    """Cria o cliente adequado à URL: JSON se apontar para CAMINHO_JSON, senão XML-RPC"""
+    if urlsplit(url).path == CAMINHO_JSON:
+        return ClienteRastreadorJSON(url)
+    return xmlrpc.client.ServerProxy(url)
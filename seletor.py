@@ -0,0 +1,138 @@
+"""Seletor incremental de pedaços "mais raros primeiro"."""
+import random
+import threading
+
+
+class _ConjuntoIndexado:
+    """Conjunto com inserção, remoção e sorteio em O(1) por elemento"""
+
+    def __init__(self):
+        self._itens = []
+        self._posicoes = {}
+
+    def __len__(self):
+        return len(self._itens)
+
+    def adicionar(self, item):
+        if item not in self._posicoes:
+            self._posicoes[item] = len(self._itens)
+            self._itens.append(item)
+
+    def remover(self, item):
+        posicao = self._posicoes.pop(item, None)
+        if posicao is None:
+            return
+        ultimo = self._itens.pop()
+        if posicao < len(self._itens):
+            self._itens[posicao] = ultimo
+            self._posicoes[ultimo] = posicao
+
+    def sortear(self, quantidade):
+        return random.sample(self._itens, min(quantidade, len(self._itens)))
+
+
+class SeletorPedacos:
+    """Disponibilidade de cada pedaço no enxame, mantida incrementalmente.
+
+    Os pedaços desejados (que não possuímos nem estamos baixando) ficam em
+    baldes indexados pela quantidade de donos. Atualizações custam O(pedaços
+    alterados) e selecionar(k) custa O(k) mais o número de baldes visitados,
+    independente do total de pedaços e de pares (quando há pedaços sem fonte
+    utilizável, os baldes visitados são percorridos).
+    """
+
+    def __init__(self, total_pedacos, desejados):
+        self.total_pedacos = total_pedacos
+        self._donos = [set() for _ in range(total_pedacos)]
+        self._desejados = set(desejados)
+        self._baldes = {}  # {quantidade de donos: _ConjuntoIndexado de pedaços desejados}
+        self._lock = threading.Lock()
+
+    def _mover(self, indice, de, para):
+        # Move um pedaço desejado entre baldes (0 = nenhum dono, fora dos baldes)
+        if de:
+            balde = self._baldes[de]
+            balde.remover(indice)
+            if not balde:
+                del self._baldes[de]
+        if para:
+            self._baldes.setdefault(para, _ConjuntoIndexado()).adicionar(indice)
+
+    def adicionar_pedacos(self, id_par, pedacos):
+        """Registra que id_par passou a possuir os pedaços"""
+        with self._lock:
+            for indice in pedacos:
+                donos = self._donos[indice]
+                if id_par in donos:
+                    continue
+                donos.add(id_par)
+                if indice in self._desejados:
+                    self._mover(indice, len(donos) - 1, len(donos))
+
+    def remover_pedacos(self, id_par, pedacos):
+        """Registra que id_par deixou de possuir os pedaços (ou saiu do enxame)"""
+        with self._lock:
+            for indice in pedacos:
+                donos = self._donos[indice]
+                if id_par not in donos:
+                    continue
+                donos.discard(id_par)
+                if indice in self._desejados:
+                    self._mover(indice, len(donos) + 1, len(donos))
+
+    def marcar_indesejado(self, indice):
+        """Tira o pedaço da seleção (já possuído ou em download)"""
+        with self._lock:
+            if indice in self._desejados:
+                self._desejados.discard(indice)
+                self._mover(indice, len(self._donos[indice]), 0)
+
+    def marcar_desejado(self, indice):
+        """Devolve o pedaço à seleção (ex: download falhou)"""
+        with self._lock:
+            if indice not in self._desejados:
+                self._desejados.add(indice)
+                self._mover(indice, 0, len(self._donos[indice]))
+
+    def donos(self, indice):
+        with self._lock:
+            return list(self._donos[indice])
+
+    def selecionar(self, quantidade, fonte_utilizavel=None):
+        """Retorna até `quantidade` pedaços desejados, dos mais raros aos mais comuns.
+
+        Empates de raridade são desfeitos por sorteio. Com fonte_utilizavel(id_par),
+        só entram pedaços com ao menos um dono utilizável: pedaços raros cujos
+        donos nos recusam no momento não ocupam as vagas dos demais.
+        """
+        utilizaveis = {}  # Resultado de fonte_utilizavel por par, nesta seleção
+
+        def tem_fonte(indice):
+            if fonte_utilizavel is None:
+                return True
+            for id_par in self._donos[indice]:
+                if id_par not in utilizaveis:
+                    utilizaveis[id_par] = fonte_utilizavel(id_par)
+                if utilizaveis[id_par]:
+                    return True
+            return False
+
+        escolhidos = []
+        with self._lock:
+            for contagem in sorted(self._baldes):
+                faltam = quantidade - len(escolhidos)
+                if faltam <= 0:
+                    break
+                balde = self._baldes[contagem]
+                sorteados = balde.sortear(faltam)
+                aceitos = [indice for indice in sorteados if tem_fonte(indice)]
+                if len(aceitos) < len(sorteados) < len(balde):
+                    # Há sorteados sem fonte: procura no resto do balde antes do próximo
+                    vistos = set(sorteados)
+                    for indice in balde.sortear(len(balde)):
+                        if len(aceitos) >= faltam:
+                            break
+                        if indice not in vistos and tem_fonte(indice):
+                            aceitos.append(indice)
+                escolhidos.extend(aceitos)
+        return escolhidos
@@ -0,0 +1,97 @@
+"""Testes do enxame do rastreador e da aplicação de deltas pelo par."""
+import threading
+import time
+import unittest
+
+from bitfield import criar_bitfield
+from par import Par
+from rastreador import TEMPO_EXPIRACAO_PAR, Enxame
+from seletor import SeletorPedacos
+
+
+def _par_local(id_par='local:1', total_pedacos=8):
+    # Só o estado usado por _aplicar_alteracoes, sem sessão, sockets ou tracker
+    par = Par.__new__(Par)
+    par.id_par = id_par
+    par.info_pares = {}
+    par.seletor = SeletorPedacos(total_pedacos, range(total_pedacos))
+    par._pares_conhecidos = set()
+    par._vizinhos_diretos = set()
+    par._versao_rastreador = 0
+    par._evento_download = threading.Event()
+    return par
+
+
+def _expirar(enxame):
+    enxame.expirar_pares(time.monotonic() + TEMPO_EXPIRACAO_PAR + 1)
+
+
+class TestEnxame(unittest.TestCase):
+    def test_expirar_e_registrar_de_novo_se_anula(self):
+        enxame = Enxame()
+        enxame.atualizar_par('A', criar_bitfield([0, 1, 2]))
+        versao = enxame.versao
+        _expirar(enxame)
+        enxame.atualizar_par('A', criar_bitfield([0, 1, 2]))
+
+        delta = enxame.alteracoes_desde(versao)
+        self.assertFalse(delta['completo'])
+        self.assertEqual(delta['ganhos'], {'A': []})
+        self.assertEqual(delta['perdidos'], {})
+        self.assertEqual(delta['saidas'], [])
+
+    def test_registrar_de_novo_com_menos_pedacos(self):
+        enxame = Enxame()
+        enxame.atualizar_par('A', criar_bitfield([0, 1, 2]))
+        versao = enxame.versao
+        _expirar(enxame)
+        enxame.atualizar_par('A', criar_bitfield([0, 3]))
+
+        delta = enxame.alteracoes_desde(versao)
+        self.assertEqual(sorted(delta['ganhos']['A']), [3])
+        self.assertEqual(sorted(delta['perdidos']['A']), [1, 2])
+
+    def test_par_expirado_vai_apenas_para_saidas(self):
+        enxame = Enxame()
+        enxame.atualizar_par('A', criar_bitfield([0, 1]))
+        enxame.atualizar_par('B', criar_bitfield([2]))
+        versao = enxame.versao
+        enxame.ultimo_contato['B'] = time.monotonic() + TEMPO_EXPIRACAO_PAR
+        _expirar(enxame)
+
+        delta = enxame.alteracoes_desde(versao)
+        self.assertEqual(delta['ganhos'], {})
+        self.assertEqual(delta['perdidos'], {})
+        self.assertEqual(delta['saidas'], ['A'])
+
+
+class TestAplicarAlteracoes(unittest.TestCase):
+    def test_expirar_e_registrar_de_novo_mantem_pedacos(self):
+        enxame = Enxame()
+        enxame.atualizar_par('A', criar_bitfield([0, 1, 2]))
+        par = _par_local()
+        par._aplicar_alteracoes(enxame.alteracoes_desde(0))
+        self.assertEqual(par.info_pares['A'], {0, 1, 2})
+
+        _expirar(enxame)
+        enxame.atualizar_par('A', criar_bitfield([0, 1, 2]))
+        par._aplicar_alteracoes(enxame.alteracoes_desde(par._versao_rastreador))
+        self.assertEqual(par.info_pares['A'], {0, 1, 2})
+        self.assertEqual(par.seletor.donos(1), ['A'])
+        self.assertIn('A', par._pares_conhecidos)
+
+    def test_par_expirado_e_esquecido(self):
+        enxame = Enxame()
+        enxame.atualizar_par('A', criar_bitfield([0, 1]))
+        par = _par_local()
+        par._aplicar_alteracoes(enxame.alteracoes_desde(0))
+
+        _expirar(enxame)
+        par._aplicar_alteracoes(enxame.alteracoes_desde(par._versao_rastreador))
+        self.assertNotIn('A', par.info_pares)
+        self.assertNotIn('A', par._pares_conhecidos)
+        self.assertEqual(par.seletor.donos(0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+"""Testes do seletor de pedaços mais raros primeiro."""
+import unittest
+
+from seletor import SeletorPedacos
+
+
+class TestSeletorPedacos(unittest.TestCase):
+    def setUp(self):
+        # Pedaço 0 só existe no semeador S; os demais também em A e B
+        self.seletor = SeletorPedacos(6, range(6))
+        self.seletor.adicionar_pedacos('S', range(6))
+        self.seletor.adicionar_pedacos('A', range(1, 6))
+        self.seletor.adicionar_pedacos('B', range(1, 6))
+
+    def test_mais_raro_primeiro(self):
+        self.assertEqual(self.seletor.selecionar(1), [0])
+
+    def test_mais_raro_com_unico_dono_suspenso(self):
+        escolhidos = self.seletor.selecionar(3, lambda id_par: id_par != 'S')
+        self.assertEqual(len(escolhidos), 3)
+        self.assertNotIn(0, escolhidos)
+
+    def test_procura_no_resto_do_balde(self):
+        # Pedaços 0 (só S) e 1 (só A) empatam como mais raros; S está suspenso
+        self.seletor.remover_pedacos('S', [1])
+        self.seletor.remover_pedacos('B', [1])
+        for _ in range(20):
+            self.assertEqual(self.seletor.selecionar(1, lambda id_par: id_par != 'S'), [1])
+
+    def test_sem_fonte_utilizavel(self):
+        self.assertEqual(self.seletor.selecionar(4, lambda id_par: False), [])
+
+
+if __name__ == '__main__':
+    unittest.main()